@@ -290,6 +290,137 @@ app.get("/api/rpa/processes", (req, res) => {
   }
 });
 
+// 获取RPA分阶段耗时指标（Python端 metrics.py 定期重写的JSON快照）
+const RPA_METRICS_DIR =
+  process.env.RPA_METRICS_DIR ||
+  path.join(
+    process.env.RPA_DATA_DIR || path.join(__dirname, "..", "rpa", "data"),
+    "metrics"
+  );
+
+app.get("/api/rpa/metrics/:userUid", (req, res) => {
+  try {
+    const safeUid = req.params.userUid.replace(/[^A-Za-z0-9_-]/g, "");
+    const snapshotPath = path.join(RPA_METRICS_DIR, `${safeUid}.json`);
+
+    if (!safeUid || !fs.existsSync(snapshotPath)) {
+      return res.json({
+        success: true,
+        metrics: null,
+        message: "No metrics snapshot found",
+      });
+    }
+
+    const metrics = JSON.parse(fs.readFileSync(snapshotPath, "utf8"));
+    res.json({
+      success: true,
+      metrics: metrics,
+    });
+  } catch (error) {
+    console.error("Error reading RPA metrics:", error);
+    res.status(500).json({
+      success: false,
+      error: error.message,
+    });
+  }
+});
+
+// 常驻SMS worker（send_personal_sms.py --worker）
+// 避免每条SMS都重新启动Python、导入firebase_admin、读取凭证和配置
+// 设置环境变量 SMS_WORKER=0 可退回每次启动新进程的方式
+let smsWorker = null;
+let smsWorkerSeq = 0;
+const smsWorkerPending = new Map();
+
+function failSmsWorkerPending(reason) {
+  for (const [id, pending] of smsWorkerPending) {
+    clearTimeout(pending.timer);
+    pending.reject(new Error(reason));
+  }
+  smsWorkerPending.clear();
+}
+
+function getSmsWorker() {
+  if (smsWorker) {
+    return smsWorker;
+  }
+
+  const scriptPath = path.join(__dirname, "..", "rpa", "send_personal_sms.py");
+  const workerProcess = spawn("python", [scriptPath, "--worker"], {
+    cwd: path.join(__dirname, "..", ".."), // 设置为项目根目录
+    stdio: ["pipe", "pipe", "pipe"],
+    env: {
+      ...process.env,
+      PYTHONIOENCODING: "utf-8",
+      LANG: "en_US.UTF-8",
+    },
+  });
+  console.log(`📱 SMS worker started (pid: ${workerProcess.pid})`);
+
+  // stdout每行一个JSON结果
+  let buffer = "";
+  workerProcess.stdout.on("data", (data) => {
+    buffer += data.toString("utf8");
+    let idx;
+    while ((idx = buffer.indexOf("\n")) >= 0) {
+      const line = buffer.slice(0, idx).trim();
+      buffer = buffer.slice(idx + 1);
+      if (!line) continue;
+
+      let result;
+      try {
+        result = JSON.parse(line);
+      } catch (e) {
+        console.log("[SMS-WORKER]", line);
+        continue;
+      }
+      const pending = smsWorkerPending.get(result.id);
+      if (pending) {
+        smsWorkerPending.delete(result.id);
+        clearTimeout(pending.timer);
+        pending.resolve(result);
+      }
+    }
+  });
+
+  // 日志走stderr
+  workerProcess.stderr.on("data", (data) => {
+    console.log("[SMS-WORKER]", data.toString("utf8").trimEnd());
+  });
+
+  workerProcess.on("close", (code) => {
+    console.log(`📱 SMS worker exited with code: ${code}`);
+    if (smsWorker === workerProcess) {
+      smsWorker = null;
+    }
+    failSmsWorkerPending(`SMS worker exited with code ${code}`);
+  });
+
+  workerProcess.on("error", (error) => {
+    console.error("SMS worker error:", error);
+    if (smsWorker === workerProcess) {
+      smsWorker = null;
+    }
+    failSmsWorkerPending(error.message);
+  });
+
+  smsWorker = workerProcess;
+  return workerProcess;
+}
+
+function sendViaSmsWorker(payload, timeoutMs = 60000) {
+  return new Promise((resolve, reject) => {
+    const worker = getSmsWorker();
+    const id = ++smsWorkerSeq;
+    const timer = setTimeout(() => {
+      smsWorkerPending.delete(id);
+      reject(new Error("SMS worker timeout"));
+    }, timeoutMs);
+    smsWorkerPending.set(id, { resolve, reject, timer });
+    worker.stdin.write(JSON.stringify({ id, ...payload }) + "\n");
+  });
+}
+
 // SMS个别发送
 app.post("/api/sms/send", async (req, res) => {
   try {
@@ -310,6 +441,36 @@ app.post("/api/sms/send", async (req, res) => {
       process.env.SMS_API_ID &&
       process.env.SMS_API_PASSWORD;
 
+    // Firebase配置：交给常驻worker处理
+    if (!hasEnvConfig && process.env.SMS_WORKER !== "0") {
+      try {
+        const result = await sendViaSmsWorker({ userUid, phone, message });
+        console.log(
+          `📱 SMS worker result (${result.elapsed_ms}ms):`,
+          result.success ? result.message : result.error
+        );
+        if (result.success) {
+          return res.json({
+            success: true,
+            message: "SMS sent successfully",
+            output: result.message,
+          });
+        }
+        return res.status(500).json({
+          success: false,
+          error: "SMS sending failed",
+          details: result.error,
+        });
+      } catch (error) {
+        console.error("SMS worker failed:", error);
+        return res.status(500).json({
+          success: false,
+          error: "SMS worker failed",
+          details: error.message,
+        });
+      }
+    }
+
     let smsScriptPath;
     let inputData;
 
@@ -658,6 +819,9 @@ process.on("SIGINT", () => {
     console.log(`  Stopping RPA for user: ${userUid}`);
     processInfo.process.kill("SIGTERM");
   }
+  if (smsWorker) {
+    smsWorker.kill("SIGTERM");
+  }
 
   process.exit(0);
 });
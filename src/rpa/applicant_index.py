@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+已处理应募索引（按Indeed应募ID去重）
+同一求职者常会触发多封通知（再次应募、提醒、同一应募的多次通知），每封都会完整走一遍
+登录→打开页面→抓号→发短信，只靠 send_history 的60秒A/B窗口兜着。这里在打开浏览器之前拦住：
+- 从目标链接解析稳定的应募ID / 职位ID（跟踪跳转链接会先展开内层URL），组成去重键
+- 持久化：SQLite（WAL）表，多个RPA进程共用；键按用户UID隔离
+- 快速路径：内存Bloom过滤器，“肯定没见过”时不查SQLite；其他进程新写入的键定期增量同步进来
+- stats() 给出命中率、Bloom拦截率与误判次数
+
+环境变量：
+    RPA_APPLICANT_DEDUP=0          关闭去重（原行为）
+    APPLICANT_INDEX_DB             数据库路径（默认 data/applicant_index.db）
+    RPA_APPLICANT_TTL_DAYS         超过多少天的记录不再算重复，0为永久（默认）
+    RPA_BLOOM_CAPACITY / RPA_BLOOM_FP_RATE
+"""
+
+import os
+import math
+import time
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlparse, parse_qs, unquote
+from typing import Optional, Dict, Any, Tuple, Iterable
+
+# ====== 配置 ======
+DATA_DIR = os.getenv("RPA_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+APPLICANT_INDEX_DB = os.getenv("APPLICANT_INDEX_DB", os.path.join(DATA_DIR, "applicant_index.db"))
+DEDUP_ENABLED = os.getenv("RPA_APPLICANT_DEDUP", "1") != "0"
+APPLICANT_TTL = float(os.getenv("RPA_APPLICANT_TTL_DAYS", "0")) * 86400
+BLOOM_CAPACITY = int(os.getenv("RPA_BLOOM_CAPACITY", "200000"))
+BLOOM_FP_RATE = float(os.getenv("RPA_BLOOM_FP_RATE", "0.001"))
+# 多久同步一次其他进程写入的键（秒）
+REFRESH_INTERVAL = 5.0
+
+# 按优先级：应募ID类参数 → 求职者ID类参数；职位ID单独取，组合成键
+# 泛用的 id 只在求职者页面路径（/candidates/view?id=...）上认，跟踪链接、退订链接里的 id 与应募无关
+APPLICATION_PARAMS = ("applicationId", "application_id", "applicationid", "appId", "apply_id", "applyId")
+CANDIDATE_PARAMS = ("candidateId", "candidate_id", "candidateid", "applicantId", "applicant_id")
+JOB_PARAMS = ("jobId", "job_id", "jobid", "jk", "employerJobId")
+# 跟踪跳转链接里装着真实目标的参数
+WRAPPED_URL_PARAMS = ("u", "url", "target", "dest", "redirect", "next")
+# /candidates/<id> 形式的路径
+PATH_MARKERS = ("candidates", "applications", "applicants")
+
+def _first(query: Dict[str, list], names: Iterable[str]) -> Optional[str]:
+    for name in names:
+        values = query.get(name)
+        if values and values[0].strip():
+            return values[0].strip()
+    return None
+
+def parse_ids(url: str, _depth: int = 0) -> Tuple[Optional[str], Optional[str]]:
+    """返回 (应募/求职者ID, 职位ID)，解析不出时为 None"""
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return None, None
+    query = parse_qs(parsed.query)
+    # 先展开跟踪跳转链接：外层的参数属于跟踪服务，内层URL才是真实目标
+    if _depth < 2:
+        inner = _first(query, WRAPPED_URL_PARAMS)
+        if inner and "://" in unquote(inner):
+            app_id, job_id = parse_ids(unquote(inner), _depth + 1)
+            if app_id:
+                return app_id, job_id
+    app_id = _first(query, APPLICATION_PARAMS) or _first(query, CANDIDATE_PARAMS)
+    job_id = _first(query, JOB_PARAMS)
+    if not app_id:
+        parts = [p for p in parsed.path.split("/") if p]
+        for i, part in enumerate(parts[:-1]):
+            if part.lower() not in PATH_MARKERS:
+                continue
+            if parts[i + 1].lower() not in ("view", "list", "search"):
+                app_id = parts[i + 1]
+            elif parts[i + 1].lower() == "view":
+                app_id = _first(query, ("id",))
+            break
+    return app_id, job_id
+
+def applicant_key(url: str) -> Optional[str]:
+    app_id, job_id = parse_ids(url)
+    if not app_id:
+        return None
+    return f"app:{app_id}|job:{job_id}" if job_id else f"app:{app_id}"
+
+# ====== Bloom过滤器 ======
+class BloomFilter:
+    __slots__ = ("size", "hashes", "bits", "count")
+
+    def __init__(self, capacity: int = BLOOM_CAPACITY, fp_rate: float = BLOOM_FP_RATE):
+        capacity = max(1, capacity)
+        self.size = max(64, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def estimated_fp_rate(self) -> float:
+        return (1.0 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+# ====== 索引 ======
+class ApplicantIndex:
+    def __init__(self, db_path: str = APPLICANT_INDEX_DB, ttl: float = APPLICANT_TTL,
+                 capacity: int = BLOOM_CAPACITY, fp_rate: float = BLOOM_FP_RATE,
+                 refresh_interval: float = REFRESH_INTERVAL):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.fp_rate = fp_rate
+        self.refresh_interval = refresh_interval
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS applicant_index (
+                uid        TEXT NOT NULL,
+                key        TEXT NOT NULL,
+                url        TEXT,
+                phone      TEXT,
+                first_seen REAL NOT NULL,
+                last_seen  REAL NOT NULL,
+                hits       INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (uid, key)
+            );
+            """
+        )
+        (rows,) = self._conn.execute("SELECT COUNT(*) FROM applicant_index").fetchone()
+        # 已有记录接近容量时放大，保持误判率
+        self._bloom = BloomFilter(max(capacity, rows * 2), fp_rate)
+        self._max_rowid = 0
+        self._refreshed_at = 0.0
+        self._stats = {"lookups": 0, "no_key": 0, "bloom_negative": 0, "db_lookups": 0,
+                       "hits": 0, "false_positives": 0, "added": 0}
+        with self._lock:
+            self._refresh()
+
+    @staticmethod
+    def _member(uid: str, key: str) -> str:
+        return f"{uid}\x00{key}"
+
+    # 调用方已持有 self._lock
+    def _refresh(self):
+        rows = self._conn.execute(
+            "SELECT rowid, uid, key FROM applicant_index WHERE rowid > ? ORDER BY rowid", (self._max_rowid,)
+        ).fetchall()
+        for rowid, uid, key in rows:
+            self._bloom.add(self._member(uid, key))
+            self._max_rowid = rowid
+        self._refreshed_at = time.monotonic()
+
+    def check(self, uid: str, url: str, now: Optional[float] = None, count_hit: bool = True) -> Optional[Dict[str, Any]]:
+        """该链接对应的应募已处理过时返回已有记录（count_hit 时累计命中次数），否则返回None"""
+        key = applicant_key(url)
+        with self._lock:
+            self._stats["lookups"] += 1
+            if key is None:
+                self._stats["no_key"] += 1
+                return None
+            if time.monotonic() - self._refreshed_at >= self.refresh_interval:
+                self._refresh()
+            if self._member(uid, key) not in self._bloom:
+                self._stats["bloom_negative"] += 1
+                return None
+            self._stats["db_lookups"] += 1
+            row = self._conn.execute(
+                "SELECT url, phone, first_seen, last_seen, hits FROM applicant_index WHERE uid = ? AND key = ?",
+                (uid, key),
+            ).fetchone()
+            now = time.time() if now is None else now
+            if not row or (self.ttl and now - row[3] > self.ttl):
+                if not row:
+                    self._stats["false_positives"] += 1
+                return None
+            if count_hit:
+                self._conn.execute(
+                    "UPDATE applicant_index SET hits = hits + 1 WHERE uid = ? AND key = ?", (uid, key)
+                )
+            self._stats["hits"] += 1
+        return {"key": key, "url": row[0], "phone": row[1], "first_seen": row[2], "last_seen": row[3],
+                "hits": row[4] + int(count_hit)}
+
+    def remember(self, uid: str, url: str, phone: Optional[str] = None, now: Optional[float] = None) -> Optional[str]:
+        """记录一个已处理（已发短信）的应募，返回去重键；链接里解析不出ID时不记录"""
+        key = applicant_key(url)
+        if key is None:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO applicant_index (uid, key, url, phone, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (uid, key) DO UPDATE SET last_seen = excluded.last_seen, phone = excluded.phone",
+                (uid, key, url, phone, now, now),
+            )
+            self._bloom.add(self._member(uid, key))
+            self._stats["added"] += 1
+        return key
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            (s["entries"],) = self._conn.execute("SELECT COUNT(*) FROM applicant_index").fetchone()
+            s["bloom_bits"] = self._bloom.size
+            s["bloom_hashes"] = self._bloom.hashes
+            s["bloom_est_fp_rate"] = round(self._bloom.estimated_fp_rate(), 6)
+        keyed = s["lookups"] - s["no_key"]
+        s["hit_rate"] = round(s["hits"] / keyed, 4) if keyed else 0.0
+        s["bloom_skip_rate"] = round(s["bloom_negative"] / keyed, 4) if keyed else 0.0
+        return s
+
+    def prune(self, older_than_days: float, now: Optional[float] = None) -> int:
+        """删除最后一次出现早于N天的记录（Bloom过滤器里的旧键会在进程重启后消失）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._conn.execute("DELETE FROM applicant_index WHERE last_seen < ?",
+                                      (now - older_than_days * 86400,)).rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_default_index: Optional[ApplicantIndex] = None
+_default_lock = threading.Lock()
+
+def get_applicant_index() -> ApplicantIndex:
+    """进程内共用一个索引"""
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            _default_index = ApplicantIndex()
+        return _default_index
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="已处理应募索引")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_key = sub.add_parser("key", help="显示链接解析出的去重键")
+    p_key.add_argument("url")
+    p_check = sub.add_parser("check", help="查询链接对应的应募是否已处理")
+    p_check.add_argument("url")
+    p_check.add_argument("--uid", default="")
+    sub.add_parser("stats", help="索引条目数与Bloom过滤器参数")
+    p_prune = sub.add_parser("prune", help="删除长期未出现的记录")
+    p_prune.add_argument("--days", type=float, required=True)
+    args = parser.parse_args()
+
+    if args.cmd == "key":
+        print(applicant_key(args.url))
+        return
+    index = get_applicant_index()
+    if args.cmd == "check":
+        print(json.dumps(index.check(args.uid, args.url, count_hit=False), ensure_ascii=False))
+    elif args.cmd == "stats":
+        print(json.dumps(index.stats(), ensure_ascii=False, indent=2))
+    else:
+        print(f"已删除 {index.prune(args.days)} 条")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+每封邮件任务的常驻内存（tracemalloc）
+- message：email.message.Message（message_from_bytes 之后的MIME树），旧做法中任务一直持有它
+- record：MailRecord（parse_mail 解析后的紧凑记录，mail_record.py），现在任务只持有它
+- send_record：SendHistory.get() 返回的 SendRecord
+
+每项先全部建好并持有，再测量分配的净增量，除以封数得到每封字节数。
+合成邮件见 corpus.py（各版式/编码轮流组合）。
+
+用法：python src/rpa/benchmarks/bench_memory.py [--mails 500] [--max-record-bytes 2048] [--json]
+"""
+
+import os
+import sys
+import gc
+import json
+import email
+import tracemalloc
+from typing import Dict, List, Callable, Any
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+# 基准只测内存：不写指标、不输出日志
+os.environ.setdefault("RPA_METRICS", "0")
+
+import corpus
+import send_sms_firebase as rpa
+from send_history import SendHistory
+
+def retained_bytes(build: Callable[[], List[Any]]) -> int:
+    """build() 返回的对象全部保持引用时的净分配字节数"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        held = build()
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del held
+    return after - before
+
+def run(mails: int = 500) -> Dict[str, Dict[str, float]]:
+    raws = [item["raw"] for item in corpus.generate_corpus(mails)]
+    mids = [str(i + 1).encode() for i in range(mails)]
+    # 解析过程中打印的调试输出不计入
+    rpa.print = lambda *args, **kwargs: None
+    parsed = [email.message_from_bytes(raw) for raw in raws]
+    # 预热：首次解析会导入模块、填充正则/编码缓存，这部分不属于任务
+    for mid, msg in zip(mids[:50], parsed[:50]):
+        rpa.parse_mail(mid, msg)
+    history = SendHistory(":memory:")
+    for i in range(mails):
+        history.record(f"090{i:08d}", "A", now=1e9)
+
+    results = {
+        "message": retained_bytes(lambda: [email.message_from_bytes(raw) for raw in raws]),
+        "record": retained_bytes(lambda: [rpa.parse_mail(mid, msg) for mid, msg in zip(mids, parsed)]),
+        "send_record": retained_bytes(lambda: [history.get(f"090{i:08d}", now=1e9) for i in range(mails)]),
+    }
+    history.close()
+    raw_avg = sum(len(raw) for raw in raws) / mails
+    out = {name: {"total_bytes": total, "per_job_bytes": round(total / mails, 1)} for name, total in results.items()}
+    out["raw"] = {"total_bytes": raw_avg * mails, "per_job_bytes": round(raw_avg, 1)}
+    return out
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="每封邮件任务的常驻内存")
+    parser.add_argument("--mails", type=int, default=500)
+    parser.add_argument("--max-record-bytes", type=int, default=2048, help="MailRecord 每封字节数上限，超出时退出码为1")
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+
+    results = run(args.mails)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        labels = {"raw": "原始RFC822字节", "message": "email.message.Message", "record": "MailRecord",
+                  "send_record": "SendRecord"}
+        for name in ("raw", "message", "record", "send_record"):
+            print(f"{labels[name]:<24} {results[name]['per_job_bytes'] / 1024:8.2f} KB / 封")
+        ratio = results["message"]["per_job_bytes"] / max(1.0, results["record"]["per_job_bytes"])
+        print(f"MailRecord 为 Message 的 1/{ratio:.0f}")
+    ok = results["record"]["per_job_bytes"] <= args.max_record_bytes
+    if not ok:
+        print(f"❌ MailRecord 每封 {results['record']['per_job_bytes']:.0f} 字节，超过上限 {args.max_record_bytes}")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
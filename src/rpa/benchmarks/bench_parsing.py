@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+解析/规范化热点路径的微基准
+- mime_decode：message_from_bytes + 标题解码（get_all_target_unread_messages 的取信后处理）
+- extract_urls：extract_urls_from_email（按版式/编码统计，并检查提取出的目标链接是否正确）
+- pick_target_url
+- phone_fallback：tel:链接 → PHONE_XPATHS → 整页 PHONE_DIGITS_RE 的顺序兜底（静态HTML上执行，
+  有 lxml 时直接用 PHONE_XPATHS，否则用 BeautifulSoup 按同样的顺序模拟）
+- only_digits + classify_number / normalize_one
+
+结果写入 benchmarks/results/<时间>_<git短哈希>.json，并与上一次结果对比，变慢超过阈值的项会标出。
+
+用法：python src/rpa/benchmarks/bench_parsing.py [--mails 600] [--repeat 5] [--threshold 0.2] [--fail-on-regression]
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import email
+import random
+import platform
+import statistics
+import subprocess
+from email.header import decode_header
+from typing import Dict, List, Callable, Any, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# 基准只测函数本身：不写指标、不输出日志
+os.environ.setdefault("RPA_METRICS", "0")
+
+import corpus
+import send_sms_firebase as rpa
+from phone_batch import normalize_one
+
+# ====== 计时 ======
+def bench(name: str, func: Callable[[], int], repeat: int) -> Dict[str, Any]:
+    """func 执行一轮并返回处理的条数；取各轮每条耗时的中位数与最小值"""
+    func()  # 预热
+    per_op = []
+    ops = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        ops = func()
+        per_op.append((time.perf_counter() - t0) / max(1, ops) * 1e6)
+    return {"name": name, "ops": ops, "median_us": round(statistics.median(per_op), 3),
+            "min_us": round(min(per_op), 3)}
+
+# ====== 邮件 ======
+def decode_subject(msg) -> str:
+    subj = decode_header(msg.get("Subject") or "")[0][0]
+    return rpa.decode_any(subj)
+
+def extraction_accuracy(items: List[Dict], msgs: List) -> Dict[str, float]:
+    """按 版式/编码 统计 pick_target_url(extract_urls_from_email()) 是否取到期望链接"""
+    hits: Dict[str, List[int]] = {}
+    for item, msg in zip(items, msgs):
+        got = rpa.pick_target_url(rpa.extract_urls_from_email(msg))
+        key = f"{item['layout']}/{item['encoding']}{'/multipart' if item['multipart'] else ''}"
+        h = hits.setdefault(key, [0, 0])
+        h[0] += int(got == item["url"])
+        h[1] += 1
+    return {k: round(v[0] / v[1], 3) for k, v in sorted(hits.items())}
+
+# ====== 手机号页面兜底 ======
+def _phone_fallback_lxml(html: str, lxml_html) -> Optional[str]:
+    doc = lxml_html.fromstring(html)
+    for a in doc.xpath("//a[starts-with(@href,'tel:')]"):
+        m = rpa.PHONE_DIGITS_RE.search(a.get("href") or "")
+        if m:
+            return m.group(0)
+    for xp in rpa.PHONE_XPATHS:
+        for elem in doc.xpath(xp)[:1]:
+            txt = (elem.get("href") or elem.text_content() or "").strip()
+            m = rpa.PHONE_DIGITS_RE.search(txt.replace("　", " "))
+            if m:
+                return m.group(0)
+    m = rpa.PHONE_DIGITS_RE.search(doc.text_content())
+    return m.group(0) if m else None
+
+def _phone_fallback_bs4(html: str) -> Optional[str]:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    for a in soup.select('a[href^="tel:"]'):
+        m = rpa.PHONE_DIGITS_RE.search(a.get("href") or "")
+        if m:
+            return m.group(0)
+    # PHONE_XPATHS：标签元素的相邻div / 文档顺序上的下一个元素
+    for label in ("電話番号", "Phone number"):
+        for node in soup.find_all(string=lambda s: isinstance(s, str) and label in s):
+            parent = node.parent
+            candidates = [parent.find_next_sibling("div"), parent.find_next()]
+            for elem in candidates:
+                if elem is None:
+                    continue
+                txt = (elem.get("href") or elem.get_text() or "").strip()
+                m = rpa.PHONE_DIGITS_RE.search(txt.replace("　", " "))
+                if m:
+                    return m.group(0)
+    m = rpa.PHONE_DIGITS_RE.search(soup.get_text())
+    return m.group(0) if m else None
+
+def phone_fallback_func():
+    try:
+        from lxml import html as lxml_html
+        return "lxml", lambda html: _phone_fallback_lxml(html, lxml_html)
+    except ImportError:
+        return "bs4", _phone_fallback_bs4
+
+# ====== 结果存储与对比 ======
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+def latest_result(exclude: Optional[str] = None) -> Optional[Dict]:
+    paths = sorted(p for p in glob.glob(os.path.join(RESULTS_DIR, "*.json")) if p != exclude)
+    if not paths:
+        return None
+    with open(paths[-1], "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def compare(current: Dict, previous: Dict, threshold: float) -> List[str]:
+    prev = {r["name"]: r for r in previous.get("benchmarks", [])}
+    regressions = []
+    print(f"\n与上次结果对比（{previous.get('revision')} @ {previous.get('timestamp')}）：")
+    for r in current["benchmarks"]:
+        p = prev.get(r["name"])
+        if not p or not p["median_us"]:
+            continue
+        change = r["median_us"] / p["median_us"] - 1.0
+        flag = ""
+        if change > threshold:
+            flag = "  ❌ 变慢"
+            regressions.append(r["name"])
+        elif change < -threshold:
+            flag = "  ✅ 变快"
+        print(f"  {r['name']:<28} {p['median_us']:>10.2f} → {r['median_us']:>10.2f} us  ({change:+.1%}){flag}")
+    return regressions
+
+def run(mails: int = 600, repeat: int = 5, seed: int = 0) -> Dict[str, Any]:
+    items = corpus.generate_corpus(mails, seed=seed)
+    raws = [it["raw"] for it in items]
+    msgs = [email.message_from_bytes(r) for r in raws]
+    url_lists = [rpa.extract_urls_from_email(m) for m in msgs]
+    pages = corpus.load_fixtures()
+    fallback_impl, fallback = phone_fallback_func()
+    rng = random.Random(seed)
+    phones = [corpus.random_phone(rng) for _ in range(20000)]
+    phones += [p.replace("+81 ", "0") for p in phones[:5000]] + ["080-12-34", "", "+1 415 555 0100"] * 100
+
+    def mime_decode():
+        for r in raws:
+            decode_subject(email.message_from_bytes(r))
+        return len(raws)
+
+    def extract_urls():
+        for m in msgs:
+            rpa.extract_urls_from_email(m)
+        return len(msgs)
+
+    def pick_target():
+        for urls in url_lists:
+            rpa.pick_target_url(urls)
+        return len(url_lists)
+
+    def only_digits_classify():
+        for p in phones:
+            rpa.classify_number(rpa.only_digits(p))
+        return len(phones)
+
+    def normalize():
+        for p in phones:
+            normalize_one(p)
+        return len(phones)
+
+    results = [
+        bench("mime_decode", mime_decode, repeat),
+        bench("extract_urls_from_email", extract_urls, repeat),
+        bench("pick_target_url", pick_target, repeat),
+        bench("only_digits+classify", only_digits_classify, repeat),
+        bench("normalize_one", normalize, repeat),
+    ]
+    for variant, html in pages.items():
+        results.append(bench(f"phone_fallback[{variant}]", lambda html=html: (fallback(html), 1)[1], repeat))
+    page_hits = {variant: fallback(html) for variant, html in pages.items()}
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"mails": mails, "repeat": repeat, "seed": seed, "phone_fallback": fallback_impl},
+        "benchmarks": results,
+        "extraction_accuracy": extraction_accuracy(items, msgs),
+        "phone_fallback_hits": page_hits,
+    }
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="解析/规范化热点路径的微基准")
+    parser.add_argument("--mails", type=int, default=600, help="合成通知邮件数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threshold", type=float, default=0.2, help="变慢超过该比例视为回归")
+    parser.add_argument("--no-save", action="store_true", help="不保存结果")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    report = run(args.mails, args.repeat, args.seed)
+    print(f"{'benchmark':<28} {'median us/op':>14} {'min us/op':>12} {'ops':>8}")
+    for r in report["benchmarks"]:
+        print(f"{r['name']:<28} {r['median_us']:>14.2f} {r['min_us']:>12.2f} {r['ops']:>8}")
+    print("\n目标链接提取正确率（版式/编码）：")
+    for k, v in report["extraction_accuracy"].items():
+        print(f"  {'✅' if v == 1.0 else '⚠️'} {k:<36} {v:.0%}")
+    print("\n页面手机号兜底：")
+    for k, v in report["phone_fallback_hits"].items():
+        print(f"  {k:<10} {v}")
+
+    previous = latest_result()
+    regressions = compare(report, previous, args.threshold) if previous else []
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{report['revision']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存: {path}")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
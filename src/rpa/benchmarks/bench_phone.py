@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+手机号规范化吞吐对比：
+- baseline：send_sms_* 里的单号路径（only_digits → 81/0 分支 → classify_number）
+- phone_batch（纯Python / NumPy）
+
+用法：python src/rpa/benchmarks/bench_phone.py [行数]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import phone_batch
+
+# ====== baseline：与 send_sms_once.py 相同的逐号逻辑 ======
+PAT_11 = re.compile(r"^0(?:20[1-9]|60[1-9]|70[1-9]|80[1-9]|90[1-9])\d{7}$")
+PAT_14 = re.compile(r"^0(?:200|600|700|800|900)\d{10}$")
+PAT_81 = re.compile(r"^81(?:70|80|90)\d{8}$")
+
+def only_digits(s):
+    return re.sub(r"\D", "", str(s))
+
+def classify_number(num):
+    if PAT_11.fullmatch(num): return "11"
+    if PAT_14.fullmatch(num): return "14"
+    if PAT_81.fullmatch(num): return "81"
+    return None
+
+def baseline(phone):
+    raw = only_digits(phone)
+    if raw.startswith("81") and len(raw) in (11, 12):
+        local_num = "0" + raw[2:]
+    elif raw.startswith("0") and len(raw) == 11:
+        local_num = raw
+    else:
+        try:
+            raise ValueError(raw)
+        except ValueError:
+            return None, None
+    return local_num, classify_number(local_num)
+
+def make_numbers(n, seed=1):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        body = "".join(rnd.choice("0123456789") for _ in range(8))
+        pre = rnd.choice(["90", "80", "70"])
+        r = rnd.random()
+        if r < 0.4:
+            out.append(f"+81 {pre} {body[:4]} {body[4:]}")
+        elif r < 0.8:
+            out.append(f"0{pre}-{body[:4]}-{body[4:]}")
+        elif r < 0.9:
+            out.append(f"0{pre}0{body}12")
+        else:
+            out.append(rnd.choice(["", "n/a", "03-1234-5678", "+1 555 0100"]))
+    return out
+
+def timeit(fn, rounds=3):
+    best = float("inf")
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def run(n=200000):
+    numbers = make_numbers(n)
+    results = {}
+    results["baseline_per_number"] = timeit(lambda: [baseline(p) for p in numbers])
+    results["batch_python"] = timeit(lambda: phone_batch.normalize_batch(numbers, use_numpy=False))
+    if phone_batch.numpy_or_none() is not None:
+        results["batch_numpy"] = timeit(lambda: phone_batch.normalize_batch(numbers, use_numpy=True))
+    print(f"rows: {n}")
+    for name, sec in results.items():
+        print(f"  {name:<22} {sec * 1000:9.1f} ms  {n / sec:12,.0f} rows/s")
+    return {name: n / sec for name, sec in results.items()}
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
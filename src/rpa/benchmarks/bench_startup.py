@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时预算（基于 python -X importtime）
+- 单条SMS路径：import send_personal_sms（配置缓存命中时不应加载 firebase_admin）
+- RPA路径：import send_sms_firebase / send_sms_once（打开浏览器前不应加载 selenium / bs4）
+
+用法：python src/rpa/benchmarks/bench_startup.py [--runs 5] [--top 15]
+超出预算或加载了不该加载的模块时返回码为1。
+"""
+
+import os
+import re
+import sys
+import json
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+RPA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 模块 → (导入耗时预算ms, 启动阶段禁止出现的重模块)
+BUDGETS: Dict[str, Tuple[float, List[str]]] = {
+    "send_personal_sms": (250.0, ["firebase_admin", "google.cloud", "bs4", "selenium", "numpy"]),
+    "send_sms_firebase": (250.0, ["firebase_admin", "google.cloud", "bs4", "selenium", "undetected_chromedriver", "numpy"]),
+    "send_sms_once": (250.0, ["bs4", "selenium", "undetected_chromedriver", "numpy"]),
+}
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def profile_import(module: str) -> Tuple[float, Dict[str, int], List[Tuple[str, int]]]:
+    """返回 (总耗时ms, 各模块自身耗时us, 被测模块直接导入的模块累计耗时us列表)"""
+    # 要测的是有 .pyc 缓存时的启动；PYTHONDONTWRITEBYTECODE 只要非空就生效（"0" 也会禁用），所以整个去掉
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=RPA_DIR, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    self_us: Dict[str, int] = {}
+    children: List[Tuple[str, int]] = []
+    pending: List[Tuple[str, int]] = []
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if not m:
+            continue
+        self_t, cumulative, indent, name = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+        self_us[name] = self_t
+        # 缩进1个空格为顶层导入（含解释器自身的site等），3个空格为其直接子导入；
+        # importtime 先输出子模块再输出父模块
+        if len(indent) == 1:
+            total_us += cumulative
+            if name == module:
+                children = pending
+            pending = []
+        elif len(indent) == 3:
+            pending.append((name, cumulative))
+    return total_us / 1000.0, self_us, children
+
+def run(runs: int = 5, top: int = 15) -> Dict[str, Dict]:
+    results = {}
+    failed = False
+    for module, (budget_ms, forbidden) in BUDGETS.items():
+        totals = []
+        loaded: Dict[str, int] = {}
+        children: List[Tuple[str, int]] = []
+        for _ in range(runs):
+            total_ms, loaded, children = profile_import(module)
+            totals.append(total_ms)
+        median_ms = statistics.median(totals)
+        heavy = sorted(
+            {name for name in loaded for f in forbidden if name == f or name.startswith(f + ".")}
+        )
+        ok = median_ms <= budget_ms and not heavy
+        failed |= not ok
+        print(f"{'✅' if ok else '❌'} {module:<20} median {median_ms:7.1f} ms  (budget {budget_ms:.0f} ms)")
+        if heavy:
+            print(f"   启动阶段加载了重模块: {', '.join(heavy[:10])}")
+        for name, us in sorted(children, key=lambda x: x[1], reverse=True)[:top]:
+            print(f"     {us / 1000.0:8.1f} ms  {name}")
+        results[module] = {"median_ms": round(median_ms, 2), "budget_ms": budget_ms,
+                           "heavy_loaded": heavy, "ok": ok}
+    return {"results": results, "ok": not failed}
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="RPA脚本启动耗时预算检查")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="以JSON输出结果")
+    args = parser.parse_args()
+    report = run(args.runs, args.top)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    sys.exit(0 if report["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
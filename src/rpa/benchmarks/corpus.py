@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成测试数据：Indeed「新しい応募者のお知らせ」通知邮件 + 求职者详情页HTML
+- 邮件版式：underline（带下划线的求职者名链接）/ button（「応募内容を確認する」按钮）/
+  anchors（只有普通链接）/ plain（纯文本，无HTML）
+- 编码：UTF-8 base64 / UTF-8 quoted-printable / ISO-2022-JP；HTML版式另有单体与 multipart/alternative 两种
+- 求职者页面：tel:链接 / 「電話番号」标签+相邻div / 标签后任意元素 / 仅正文文本 / 无号码
+基准测试（bench_parsing.py）与离线压测（loadtest.py）共用。
+
+用法：python src/rpa/benchmarks/corpus.py --write-fixtures   重新生成 fixtures/ 下的页面
+"""
+
+import os
+import random
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+from email import charset as _charset
+from typing import List, Tuple, Dict, Optional
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+SUBJECT_KEYWORD = "【新しい応募者のお知らせ】"
+LAYOUTS = ("underline", "button", "anchors", "plain")
+ENCODINGS = ("utf-8-b64", "utf-8-qp", "iso-2022-jp")
+PAGE_VARIANTS = ("tel", "label", "following", "text", "none")
+
+NAMES = ["山田 太郎", "佐藤 花子", "鈴木 一郎", "高橋 美咲", "田中 健", "伊藤 さくら", "渡辺 翔", "中村 愛"]
+JOBS = ["ホールスタッフ", "キッチンスタッフ", "配送ドライバー", "倉庫内作業", "コールセンター", "介護職員", "販売スタッフ"]
+
+def applicant_url(i: int, base_url: Optional[str] = None) -> str:
+    base = (base_url or "https://employers.indeed.com").rstrip("/")
+    return f"{base}/candidates/view?id=cand{i:06d}&from=notification"
+
+def random_phone(rng: random.Random) -> str:
+    return f"+81 {rng.choice(['70', '80', '90'])} {rng.randint(1000, 9999)} {rng.randint(1000, 9999)}"
+
+# ====== 通知邮件 ======
+_FOOTER_LINKS = [
+    ("https://jp.indeed.com/hire/help", "ヘルプセンター"),
+    ("https://jp.indeed.com/legal", "利用規約"),
+    ("https://www.indeed.com/unsubscribe?t=abc", "配信停止"),
+]
+
+def notification_html(layout: str, url: str, name: str, job: str) -> str:
+    footer = "".join(f'<a href="{h}" style="color:#767676">{t}</a> | ' for h, t in _FOOTER_LINKS)
+    if layout == "underline":
+        main = (f'<p><a href="{url}" style="color:#2557a7; text-decoration: underline;">{name}</a>さんが'
+                f'「{job}」に応募しました。</p>')
+    elif layout == "button":
+        main = (f'<p>{name}さんが「{job}」に応募しました。</p>'
+                f'<table role="presentation"><tr><td style="background:#2557a7;border-radius:8px">'
+                f'<a href="{url}" style="color:#fff;display:inline-block;padding:12px 24px">応募内容を確認する</a>'
+                f'</td></tr></table>')
+    else:
+        main = f'<p>{name}さんが「{job}」に応募しました。<a href="{url}">詳細はこちら</a></p>'
+    # 实际通知邮件带大量内联样式与布局表格
+    filler = "".join(f'<tr><td style="padding:4px 0;font-size:14px;line-height:20px">項目{k}</td></tr>'
+                     for k in range(12))
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"></head><body style="margin:0">'
+            f'<table width="100%" cellpadding="0" cellspacing="0"><tr><td>{main}</td></tr>{filler}</table>'
+            f'<p style="font-size:12px">{footer}</p></body></html>')
+
+def notification_text(url: str, name: str, job: str) -> str:
+    return (f"{name}さんが「{job}」に応募しました。\n\n求人: {job}\n応募内容を確認する: {url}\n\n"
+            f"ヘルプセンター: https://jp.indeed.com/hire/help\n")
+
+def _text_part(body: str, subtype: str, encoding: str) -> MIMEText:
+    if encoding == "iso-2022-jp":
+        return MIMEText(body, subtype, "iso-2022-jp")
+    cs = _charset.Charset("utf-8")
+    cs.body_encoding = _charset.QP if encoding == "utf-8-qp" else _charset.BASE64
+    part = MIMEText("", subtype)
+    part.set_payload(body, cs)
+    return part
+
+def make_notification(i: int, layout: str = "button", encoding: str = "utf-8-b64", multipart: bool = True,
+                      base_url: Optional[str] = None, name: Optional[str] = None, job: Optional[str] = None,
+                      to_addr: str = "recruit@example.co.jp") -> Tuple[bytes, str]:
+    """返回 (RFC822字节, 期望提取到的求职者链接)"""
+    name = name or NAMES[i % len(NAMES)]
+    job = job or JOBS[i % len(JOBS)]
+    url = applicant_url(i, base_url)
+    text = notification_text(url, name, job)
+    if layout == "plain":
+        msg = _text_part(text, "plain", encoding)
+    else:
+        html = notification_html(layout, url, name, job)
+        if multipart:
+            msg = MIMEMultipart("alternative")
+            msg.attach(_text_part(text, "plain", encoding))
+            msg.attach(_text_part(html, "html", encoding))
+        else:
+            msg = _text_part(html, "html", encoding)
+    header_cs = "iso-2022-jp" if encoding == "iso-2022-jp" else "utf-8"
+    msg["Subject"] = Header(f"{SUBJECT_KEYWORD}{name}さんが「{job}」に応募しました", header_cs)
+    msg["From"] = "Indeed <no-reply@indeed.com>"
+    msg["To"] = to_addr
+    msg["Date"] = formatdate(localtime=True)
+    msg["Message-ID"] = make_msgid(idstring=f"cand{i:06d}", domain="indeed.com")
+    return msg.as_bytes(), url
+
+def generate_corpus(n: int, seed: int = 0, base_url: Optional[str] = None) -> List[Dict]:
+    """n 封通知邮件，版式/编码/是否multipart轮流组合"""
+    rng = random.Random(seed)
+    combos = [(l, e, m) for l in LAYOUTS for e in ENCODINGS for m in ((True, False) if l != "plain" else (False,))]
+    corpus = []
+    for i in range(n):
+        layout, encoding, multipart = combos[i % len(combos)] if i < len(combos) else rng.choice(combos)
+        raw, url = make_notification(i, layout, encoding, multipart, base_url)
+        corpus.append({"raw": raw, "url": url, "layout": layout, "encoding": encoding, "multipart": multipart})
+    return corpus
+
+# ====== 求职者详情页 ======
+def applicant_page(variant: str, phone: str = "+81 90 1234 5678", name: str = "山田 太郎",
+                   job: str = "ホールスタッフ", history_rows: int = 60) -> str:
+    if variant == "tel":
+        contact = f'<div class="contact"><span>連絡先</span><a href="tel:{phone.replace(" ", "")}">{phone}</a></div>'
+    elif variant == "label":
+        contact = f'<div class="row"><div class="label">電話番号</div><div class="value">{phone}</div></div>'
+    elif variant == "following":
+        contact = f'<dl><dt>電話番号</dt><dd><span>{phone}</span></dd></dl>'
+    elif variant == "text":
+        contact = f'<p class="note">ご連絡は {phone} までお願いします。</p>'
+    else:
+        contact = '<div class="row"><div class="label">メールアドレス</div><div class="value">非公開</div></div>'
+    # 职歴/メッセージ履歴 等占页面大头的部分
+    rows = "".join(
+        f'<div class="history-item"><div class="date">2024/{(k % 12) + 1:02d}/{(k % 28) + 1:02d}</div>'
+        f'<div class="body">メッセージ {k}：面接日程についてご確認ください。応募番号 {100000 + k}</div></div>'
+        for k in range(history_rows)
+    )
+    return (f'<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8"><title>{name} - 応募者</title></head>'
+            f'<body><header><nav><a href="/jobs">求人</a><a href="/candidates">応募者</a></nav></header>'
+            f'<main><h1>{name}</h1><div class="job">{job}</div><section class="profile">{contact}</section>'
+            f'<section class="history">{rows}</section></main></body></html>')
+
+def write_fixtures(directory: str = FIXTURES_DIR) -> List[str]:
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for variant in PAGE_VARIANTS:
+        path = os.path.join(directory, f"applicant_{variant}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(applicant_page(variant))
+        paths.append(path)
+    return paths
+
+def load_fixtures(directory: str = FIXTURES_DIR) -> Dict[str, str]:
+    pages = {}
+    for variant in PAGE_VARIANTS:
+        path = os.path.join(directory, f"applicant_{variant}.html")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                pages[variant] = f.read()
+    return pages or {v: applicant_page(v) for v in PAGE_VARIANTS}
+
+if __name__ == "__main__":
+    import sys
+    if "--write-fixtures" in sys.argv[1:]:
+        for p in write_fixtures():
+            print(p)
+    else:
+        for item in generate_corpus(len(LAYOUTS) * len(ENCODINGS) * 2):
+            print(item["layout"], item["encoding"], item["multipart"], len(item["raw"]), item["url"])
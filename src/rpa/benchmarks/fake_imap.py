@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程内IMAP替身（明文，IMAP4rev1 的最小子集，离线压测 loadtest.py 用）
+支持 imaplib 在 send_sms_firebase.py 里用到的命令：
+    CAPABILITY / LOGIN / SELECT / EXAMINE / SEARCH (UNSEEN|ALL|UID 集合)
+    FETCH (RFC822|BODY[]|BODY.PEEK[HEADER.FIELDS (...)]|FLAGS) / STORE ±FLAGS / UID FETCH|SEARCH|STORE / NOOP / LOGOUT
+- 序号即投递顺序，不做 EXPUNGE，序号始终稳定，UID 与序号相同
+- folders={"Indeed": Mailbox()} 提供 INBOX 以外的文件夹（名称按 modified UTF-7 编码后的形式匹配）
+- compress=True 时登录后提供 COMPRESS=DEFLATE（与Gmail相同，登录前的 CAPABILITY 里没有）；
+  stats["bytes_out"] 统计实际写到socket的字节数（压缩后）
+- 延迟从命令到达时算起：客户端流水线发出的多条命令，响应时间会重叠（与真实网络往返相同）
+- implicit_seen=True 时 FETCH RFC822 会顺带设置 \\Seen（RFC 3501 / Gmail 的行为）
+- latency_ms：每条命令的响应延迟，模拟到Gmail的往返时间
+
+用法：
+    box = Mailbox(); box.deliver(raw_bytes)
+    server = FakeIMAPServer(box, latency_ms=30).start()
+    IMAP_HOST=127.0.0.1 IMAP_PORT=<server.port> IMAP_SSL=0
+"""
+
+import re
+import zlib
+import time
+import queue
+import shlex
+import threading
+import socketserver
+from typing import Optional, List, Dict, Any, Set
+
+SEEN = "\\Seen"
+
+class Mailbox:
+    """INBOX 内容：线程安全，可在服务运行中随时投递"""
+
+    def __init__(self, user: str = "", password: str = "", implicit_seen: bool = False):
+        self.user = user            # 为空时接受任意账号
+        self.password = password
+        self.implicit_seen = implicit_seen
+        self.lock = threading.Lock()
+        self.messages: List[bytes] = []
+        self.flags: List[Set[str]] = []
+        self.delivered_at: List[float] = []
+        self.stats = {"connections": 0, "logins": 0, "searches": 0, "fetches": 0, "stores": 0,
+                      "commands": 0, "bytes_out": 0, "compressed_sessions": 0}
+
+    def deliver(self, raw: bytes) -> int:
+        """投递一封邮件，返回序号（从1开始）"""
+        with self.lock:
+            self.messages.append(raw)
+            self.flags.append(set())
+            self.delivered_at.append(time.time())
+            return len(self.messages)
+
+    def count(self) -> int:
+        with self.lock:
+            return len(self.messages)
+
+    def unseen(self) -> List[int]:
+        with self.lock:
+            return [i + 1 for i, f in enumerate(self.flags) if SEEN not in f]
+
+    def check_login(self, user: str, password: str) -> bool:
+        return not self.user or (user == self.user and password == self.password)
+
+def parse_sequence_set(spec: str, exists: int) -> List[int]:
+    """'1,3:5,*' → [1, 3, 4, 5, exists]；超出范围的序号丢弃"""
+    seqs: List[int] = []
+    for part in spec.split(","):
+        if ":" in part:
+            a, b = part.split(":", 1)
+            lo = exists if a == "*" else int(a)
+            hi = exists if b == "*" else int(b)
+            if lo > hi:
+                lo, hi = hi, lo
+            seqs.extend(range(lo, hi + 1))
+        elif part:
+            seqs.append(exists if part == "*" else int(part))
+    return [s for s in seqs if 1 <= s <= exists]
+
+_FLAG_RE = re.compile(r"\\?\w+")
+_RFC822_RE = re.compile(r"RFC822(?![.\w])")
+_HEADER_FIELDS_RE = re.compile(r"HEADER\.FIELDS \(([^)]*)\)")
+
+def header_fields(raw: bytes, names: List[str]) -> bytes:
+    """取出指定的头字段（含折行），末尾带空行，与真实服务器的 BODY[HEADER.FIELDS] 一致"""
+    head = raw.split(b"\r\n\r\n", 1)[0] if b"\r\n\r\n" in raw else raw.split(b"\n\n", 1)[0]
+    wanted = {n.lower().encode("ascii") for n in names}
+    out: List[bytes] = []
+    keep = False
+    for line in head.splitlines():
+        if line[:1] in (b" ", b"\t"):
+            if keep:
+                out.append(line)
+            continue
+        keep = line.split(b":", 1)[0].strip().lower() in wanted
+        if keep:
+            out.append(line)
+    return b"".join(l + b"\r\n" for l in out) + b"\r\n"
+
+class _Inflater:
+    """COMPRESS 之后的输入：readline() 之前先解压"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.inflate = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.buf = bytearray()
+
+    def readline(self) -> bytes:
+        while b"\n" not in self.buf:
+            chunk = self.raw.read1(65536)
+            if not chunk:
+                return b""
+            self.buf += self.inflate.decompress(chunk)
+        i = self.buf.index(b"\n")
+        line = bytes(self.buf[:i + 1])
+        del self.buf[:i + 1]
+        return line
+
+def make_handler(mailbox: Mailbox, latency_ms: float, folders: Optional[Dict[str, Mailbox]] = None,
+                 compress: bool = False):
+    folders = folders or {}
+
+    class IMAPHandler(socketserver.StreamRequestHandler):
+        box: Optional[Mailbox] = None
+        readonly = False
+        deflate = None
+
+        def _write(self, data: bytes):
+            if self.deflate is not None:
+                data = self.deflate.compress(data) + self.deflate.flush(zlib.Z_SYNC_FLUSH)
+            with mailbox.lock:
+                mailbox.stats["bytes_out"] += len(data)
+            self.wfile.write(data)
+
+        def _send(self, line: str):
+            self._write(line.encode("utf-8") + b"\r\n")
+
+        def _read_commands(self, inbox: "queue.Queue"):
+            # 独立线程读命令并记下到达时间；读到 COMPRESS 后客户端要等OK才开始压缩，这里立即切换即可
+            reader = self.rfile
+            while True:
+                try:
+                    raw = reader.readline()
+                except (OSError, ValueError, zlib.error):
+                    raw = b""
+                inbox.put((time.monotonic(), raw))
+                if not raw:
+                    return
+                if raw.split(b" ", 2)[1:2] == [b"COMPRESS"] and compress:
+                    reader = _Inflater(self.rfile)
+
+        def _capabilities(self, authed: bool) -> str:
+            return "IMAP4rev1" + (" COMPRESS=DEFLATE" if compress and authed and self.deflate is None else "")
+
+        def handle(self):
+            with mailbox.lock:
+                mailbox.stats["connections"] += 1
+            self._send(f"* OK [CAPABILITY {self._capabilities(False)}] mock IMAP ready")
+            authed = False
+            inbox: "queue.Queue" = queue.Queue()
+            threading.Thread(target=self._read_commands, args=(inbox,), daemon=True).start()
+            while True:
+                received, raw = inbox.get()
+                if not raw:
+                    return
+                line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+                parts = line.split(" ", 2)
+                if len(parts) < 2:
+                    self._send("* BAD empty command")
+                    continue
+                tag, cmd, args = parts[0], parts[1].upper(), parts[2] if len(parts) > 2 else ""
+                with mailbox.lock:
+                    mailbox.stats["commands"] += 1
+                wait = received + latency_ms / 1000.0 - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                if cmd == "LOGOUT":
+                    self._send("* BYE logging out")
+                    self._send(f"{tag} OK LOGOUT completed")
+                    return
+                if cmd == "CAPABILITY":
+                    self._send(f"* CAPABILITY {self._capabilities(authed)}")
+                    self._send(f"{tag} OK CAPABILITY completed")
+                elif cmd == "COMPRESS" and authed and compress and self.deflate is None:
+                    if args.upper() != "DEFLATE":
+                        self._send(f"{tag} NO unsupported compression")
+                        continue
+                    self._send(f"{tag} OK DEFLATE active")
+                    self.deflate = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+                    with mailbox.lock:
+                        mailbox.stats["compressed_sessions"] += 1
+                elif cmd == "NOOP":
+                    self._send(f"{tag} OK NOOP completed")
+                elif cmd == "LOGIN":
+                    try:
+                        user, password = shlex.split(args)[:2]
+                    except ValueError:
+                        self._send(f"{tag} BAD LOGIN arguments")
+                        continue
+                    if mailbox.check_login(user, password):
+                        authed = True
+                        with mailbox.lock:
+                            mailbox.stats["logins"] += 1
+                        self._send(f"{tag} OK [CAPABILITY {self._capabilities(True)}] LOGIN completed")
+                    else:
+                        self._send(f"{tag} NO [AUTHENTICATIONFAILED] Invalid credentials")
+                elif not authed:
+                    self._send(f"{tag} BAD not authenticated")
+                elif cmd in ("SELECT", "EXAMINE"):
+                    try:
+                        name = shlex.split(args)[0]
+                    except (ValueError, IndexError):
+                        name = ""
+                    box = mailbox if name.upper() == "INBOX" else folders.get(name)
+                    if box is None:
+                        self._send(f"{tag} NO [NONEXISTENT] Unknown Mailbox: {name}")
+                        continue
+                    self.box, self.readonly = box, cmd == "EXAMINE"
+                    self._send(f"* {box.count()} EXISTS")
+                    self._send("* 0 RECENT")
+                    self._send("* FLAGS (\\Seen)")
+                    self._send("* OK [UIDVALIDITY 1] UIDs valid")
+                    mode = "READ-WRITE" if cmd == "SELECT" else "READ-ONLY"
+                    self._send(f"{tag} OK [{mode}] {cmd} completed")
+                elif cmd in ("SEARCH", "FETCH", "STORE", "UID") and self.box is None:
+                    self._send(f"{tag} BAD no mailbox selected")
+                elif cmd == "SEARCH":
+                    self._search(tag, args)
+                elif cmd == "FETCH":
+                    self._fetch(tag, args)
+                elif cmd == "STORE":
+                    self._store(tag, args)
+                elif cmd == "UID":
+                    # UID 与序号相同，只是 FETCH 响应里要带上 UID
+                    sub, _, rest = args.partition(" ")
+                    sub = sub.upper()
+                    if sub == "SEARCH":
+                        self._search(tag, rest, "UID SEARCH")
+                    elif sub == "FETCH":
+                        self._fetch(tag, rest, uid=True, label="UID FETCH")
+                    elif sub == "STORE":
+                        self._store(tag, rest, uid=True, label="UID STORE")
+                    else:
+                        self._send(f"{tag} BAD unsupported UID command {sub}")
+                elif cmd in ("CLOSE", "EXPUNGE", "CHECK"):
+                    self._send(f"{tag} OK {cmd} completed")
+                else:
+                    self._send(f"{tag} BAD unsupported command {cmd}")
+
+        def _search(self, tag: str, args: str, label: str = "SEARCH"):
+            box = self.box
+            criteria = args.upper().split()
+            with box.lock:
+                box.stats["searches"] += 1
+            seqs = set(range(1, box.count() + 1))
+            i = 0
+            while i < len(criteria):
+                word = criteria[i]
+                if word == "UNSEEN":
+                    seqs &= set(box.unseen())
+                elif word == "UID" and i + 1 < len(criteria):
+                    # n:* 在 n 大于最大UID时也会返回最后一封（RFC 3501 的行为，Gmail 相同）
+                    seqs &= set(parse_sequence_set(criteria[i + 1], box.count()))
+                    i += 1
+                elif word != "ALL":
+                    self._send(f"{tag} BAD unsupported SEARCH criteria")
+                    return
+                i += 1
+            self._send("* SEARCH" + "".join(f" {s}" for s in sorted(seqs)))
+            self._send(f"{tag} OK {label} completed")
+
+        def _fetch(self, tag: str, args: str, uid: bool = False, label: str = "FETCH"):
+            box = self.box
+            try:
+                spec, items = args.split(" ", 1)
+                seqs = parse_sequence_set(spec, box.count())
+            except ValueError:
+                self._send(f"{tag} BAD FETCH arguments")
+                return
+            items = items.upper()
+            fields = _HEADER_FIELDS_RE.search(items)
+            size_only = "RFC822.SIZE" in items
+            want_body = bool(_RFC822_RE.search(items)) or "BODY[]" in items or "BODY.PEEK[]" in items
+            for seq in seqs:
+                with box.lock:
+                    box.stats["fetches"] += 1
+                    raw = box.messages[seq - 1]
+                    if want_body and box.implicit_seen and "PEEK" not in items and not self.readonly:
+                        box.flags[seq - 1].add(SEEN)
+                    flags = " ".join(sorted(box.flags[seq - 1]))
+                prefix = f"UID {seq} " if uid else ""
+                if fields:
+                    names = fields.group(1).split()
+                    part = header_fields(raw, names)
+                    name = f"BODY[HEADER.FIELDS ({' '.join(names)})]"
+                    self._write(f"* {seq} FETCH ({prefix}{name} {{{len(part)}}}\r\n".encode("ascii") + part + b")\r\n")
+                elif size_only and not want_body:
+                    self._send(f"* {seq} FETCH ({prefix}RFC822.SIZE {len(raw)})")
+                elif want_body:
+                    name = "BODY[]" if "BODY" in items else "RFC822"
+                    self._write(f"* {seq} FETCH ({prefix}{name} {{{len(raw)}}}\r\n".encode("ascii") + raw + b")\r\n")
+                else:
+                    self._send(f"* {seq} FETCH ({prefix}FLAGS ({flags}))")
+            self._send(f"{tag} OK {label} completed")
+
+        def _store(self, tag: str, args: str, uid: bool = False, label: str = "STORE"):
+            box = self.box
+            if self.readonly:
+                self._send(f"{tag} NO [READ-ONLY] mailbox selected with EXAMINE")
+                return
+            try:
+                spec, op, flag_list = args.split(" ", 2)
+                seqs = parse_sequence_set(spec, box.count())
+            except ValueError:
+                self._send(f"{tag} BAD STORE arguments")
+                return
+            flags = set(_FLAG_RE.findall(flag_list))
+            silent = op.upper().endswith(".SILENT")
+            op = op.upper().replace(".SILENT", "")
+            lines = []
+            with box.lock:
+                box.stats["stores"] += 1
+                for seq in seqs:
+                    current = box.flags[seq - 1]
+                    if op == "+FLAGS":
+                        current |= flags
+                    elif op == "-FLAGS":
+                        current -= flags
+                    else:
+                        current.clear()
+                        current |= flags
+                    lines.append(f"* {seq} FETCH ({f'UID {seq} ' if uid else ''}FLAGS ({' '.join(sorted(current))}))")
+            if not silent:
+                for line in lines:
+                    self._send(line)
+            self._send(f"{tag} OK {label} completed")
+
+    return IMAPHandler
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class FakeIMAPServer:
+    """进程内启动：server = FakeIMAPServer(mailbox).start(); server.port"""
+
+    def __init__(self, mailbox: Optional[Mailbox] = None, host: str = "127.0.0.1", port: int = 0,
+                 latency_ms: float = 0.0, folders: Optional[Dict[str, Mailbox]] = None, compress: bool = False):
+        self.mailbox = mailbox or Mailbox()
+        self.folders = folders or {}
+        self._server = _ThreadingTCPServer((host, port), make_handler(self.mailbox, latency_ms, self.folders, compress))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def config(self) -> Dict[str, Any]:
+        """send_sms_firebase 配置中的IMAP项"""
+        return {"IMAP_HOST": self.host, "IMAP_PORT": self.port, "IMAP_SSL": False,
+                "IMAP_USER": self.mailbox.user or "loadtest@example.co.jp",
+                "IMAP_PASS": self.mailbox.password or "loadtest"}
+
+    def start(self) -> "FakeIMAPServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-imap", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地假招聘站点（离线压测 loadtest.py 用）：登录 → 密码 → 可选二步验证 → 求职者详情页
+页面结构与 site_login_and_open / extract_phone_from_page 依赖的定位方式一致：
+- 未登录访问 /candidates/view?id=... 时原地返回登录页（URL不变，与真实站点相同），邮箱框 name="__email"
+- 密码页 input[type=password]；二步验证页 id="verification_input"，验证码通过 on_code 回调投递（例如发到IMAP替身）
+- 登录后按 cookie 识别会话；带 from= 的通知链接先302到规范URL，求职者页面由 corpus.applicant_page 生成
+- session_ttl：会话空闲超过该秒数即过期（每次访问续期），之后访问需登录的页面（求职者页、首页 /）原地返回登录页
+- latency_ms / jitter_ms：每个请求的服务端延迟
+"""
+
+import time
+import random
+import secrets
+import threading
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs, urlparse, quote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, Callable
+
+import corpus
+
+SESSION_COOKIE = "fake_session"
+
+def _page(title: str, body: str) -> str:
+    return (f'<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8"><title>{title}</title></head>'
+            f'<body><main>{body}</main></body></html>')
+
+def login_page(next_url: str) -> str:
+    return _page("ログイン", f'<form method="post" action="/account/login?next={quote(next_url, safe="")}">'
+                            f'<input type="email" name="__email" id="login-email-input">'
+                            f'<button type="submit">続行</button></form>')
+
+def password_page(token: str, next_url: str) -> str:
+    return _page("パスワード", f'<form method="post" action="/account/password?next={quote(next_url, safe="")}">'
+                              f'<input type="hidden" name="token" value="{token}">'
+                              f'<input type="password" name="password">'
+                              f'<button type="submit">ログイン</button></form>')
+
+def verification_page(token: str, next_url: str, error: str = "") -> str:
+    return _page("認証コード", f'<p>{error}</p>'
+                              f'<form method="post" action="/account/verify?next={quote(next_url, safe="")}">'
+                              f'<input type="hidden" name="token" value="{token}">'
+                              f'<input type="text" name="code" id="verification_input">'
+                              f'<button type="submit">確認</button></form>')
+
+class SiteState:
+    def __init__(self, applicant: Callable[[str], Optional[Dict[str, Any]]], user: str = "", password: str = "",
+                 two_factor: bool = False, on_code: Optional[Callable[[str], None]] = None,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0, seed: Optional[int] = None,
+                 session_ttl: float = 0.0):
+        self.applicant = applicant      # 求职者ID → {"variant", "phone", "name", "job"}，不存在返回None
+        self.user = user                # 为空时接受任意账号
+        self.password = password
+        self.two_factor = two_factor
+        self.on_code = on_code
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.session_ttl = session_ttl  # 0 为不过期
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, float] = {}   # sid → 最近访问时间
+        self.pending: Dict[str, str] = {}   # 登录中 token → 邮箱
+        self.codes: Dict[str, str] = {}     # 二步验证中 token → 验证码
+        self.stats = {"requests": 0, "logins": 0, "two_factor": 0, "applicant_views": 0, "not_found": 0,
+                      "expired": 0}
+
+    def delay(self):
+        with self.lock:
+            self.stats["requests"] += 1
+            wait = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms))
+        if wait:
+            time.sleep(wait / 1000.0)
+
+    def new_session(self) -> str:
+        sid = secrets.token_hex(16)
+        with self.lock:
+            self.sessions[sid] = time.monotonic()
+            self.stats["logins"] += 1
+        return sid
+
+    def touch(self, sid: str) -> bool:
+        """会话有效时续期并返回True"""
+        now = time.monotonic()
+        with self.lock:
+            last = self.sessions.get(sid)
+            if last is None:
+                return False
+            if self.session_ttl and now - last > self.session_ttl:
+                del self.sessions[sid]
+                self.stats["expired"] += 1
+                return False
+            self.sessions[sid] = now
+            return True
+
+def make_handler(state: SiteState):
+    class SiteHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, code: int, body: str = "", headers: Optional[Dict[str, str]] = None):
+            data = body.encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _session(self) -> bool:
+            cookie = SimpleCookie(self.headers.get("Cookie", ""))
+            morsel = cookie.get(SESSION_COOKIE)
+            return bool(morsel) and state.touch(morsel.value)
+
+        def _form(self) -> Dict[str, str]:
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length).decode("utf-8", errors="replace")
+            return {k: v[0] for k, v in parse_qs(raw, keep_blank_values=True).items()}
+
+        def _logged_in(self, next_url: str):
+            sid = state.new_session()
+            self._reply(303, "", {"Location": next_url or "/",
+                                  "Set-Cookie": f"{SESSION_COOKIE}={sid}; Path=/; HttpOnly"})
+
+        def do_GET(self):
+            state.delay()
+            url = urlparse(self.path)
+            if url.path == "/candidates/view":
+                if not self._session():
+                    self._reply(200, login_page(self.path))
+                    return
+                query = parse_qs(url.query)
+                if "from" in query:
+                    # 已登录时通知链接会跳转到去掉跟踪参数的页面（site_login_and_open 靠URL变化判断已登录）
+                    self._reply(302, "", {"Location": f"{url.path}?id={quote(query.get('id', [''])[0])}"})
+                    return
+                cid = query.get("id", [""])[0]
+                info = state.applicant(cid)
+                if info is None:
+                    with state.lock:
+                        state.stats["not_found"] += 1
+                    self._reply(404, _page("Not Found", "<h1>応募者が見つかりません</h1>"))
+                    return
+                with state.lock:
+                    state.stats["applicant_views"] += 1
+                self._reply(200, corpus.applicant_page(info["variant"], info["phone"], info["name"], info["job"]))
+            elif url.path == "/":
+                if not self._session():
+                    self._reply(200, login_page(self.path))
+                    return
+                self._reply(200, _page("ダッシュボード", "<h1>応募者一覧</h1>"))
+            else:
+                self._reply(404, _page("Not Found", ""))
+
+        def do_POST(self):
+            state.delay()
+            url = urlparse(self.path)
+            next_url = parse_qs(url.query).get("next", ["/"])[0]
+            form = self._form()
+            if url.path == "/account/login":
+                token = secrets.token_hex(8)
+                with state.lock:
+                    state.pending[token] = form.get("__email", "")
+                self._reply(200, password_page(token, next_url))
+            elif url.path == "/account/password":
+                token = form.get("token", "")
+                with state.lock:
+                    user = state.pending.pop(token, None)
+                ok = user is not None and (not state.user or (user == state.user
+                                                              and form.get("password") == state.password))
+                if not ok:
+                    self._reply(200, login_page(next_url))
+                    return
+                if not state.two_factor:
+                    self._logged_in(next_url)
+                    return
+                code = f"{state.rng.randint(0, 999999):06d}"
+                with state.lock:
+                    state.codes[token] = code
+                    state.stats["two_factor"] += 1
+                if state.on_code:
+                    state.on_code(code)
+                self._reply(200, verification_page(token, next_url))
+            elif url.path == "/account/verify":
+                token = form.get("token", "")
+                with state.lock:
+                    expected = state.codes.get(token)
+                if expected and form.get("code", "").strip() == expected:
+                    with state.lock:
+                        state.codes.pop(token, None)
+                    self._logged_in(next_url)
+                else:
+                    self._reply(200, verification_page(token, next_url, "認証コードが正しくありません"))
+            else:
+                self._reply(404, _page("Not Found", ""))
+
+        def log_message(self, format, *args):
+            pass
+
+    return SiteHandler
+
+class FakeSite:
+    """进程内启动：site = FakeSite(SiteState(...)).start(); site.base_url"""
+
+    def __init__(self, state: SiteState, host: str = "127.0.0.1", port: int = 0):
+        self.state = state
+        self._httpd = ThreadingHTTPServer((host, port), make_handler(state))
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeSite":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-site", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端离线压测：真实的循环模式 / 流水线 / 补处理代码 + 三个本地替身，不访问Indeed、不消耗SMS额度
+- IMAP替身（fake_imap.py）：一次性或按到达率投递 N 封「新しい応募者のお知らせ」（corpus.py 生成）
+- 假招聘站点（fake_site.py）：登录 / 密码 / 可选二步验证（验证码邮件投递到IMAP替身）/ 求职者页面，可配延迟
+- SMS API替身（mock_sms_server.py）：可配延迟、错误率
+报告：端到端每分钟处理的求职者数、time-to-SMS（邮件投递 → SMS API 收到请求）的 p50/p95/max、
+      各阶段耗时（metrics.py 的 rpa_stage_duration_seconds）与各替身的调用统计
+
+浏览器：
+    --driver http（默认）  requests 会话代替Chrome，按 site_login_and_open 相同的步骤走HTTP登录，
+                           手机号用 bench_parsing 的静态兜底解析；测的是邮箱→站点→SMS链路本身
+    --driver chrome        真实 undetected_chromedriver（需要 selenium + Chrome），每个浏览器用临时 profile
+
+目标链接白名单在进程内替换为只允许本地假站点，通知邮件里的 indeed.com 页脚链接不会被打开。
+
+用法：
+    python src/rpa/benchmarks/loadtest.py --mails 200 --site-latency-ms 300
+    python src/rpa/benchmarks/loadtest.py --mode pipeline --extractors 4 --arrival-rate 120 --two-factor
+    python src/rpa/benchmarks/loadtest.py --mails 100 --duplicates 30          重复通知去重效果
+    python src/rpa/benchmarks/loadtest.py --mode catchup --mails 120 --backlog 100 --arrival-rate 20 \
+        --extractors 4 --rate-cap 60                                            积压补处理 + 实时流量插队
+    python src/rpa/benchmarks/loadtest.py --mails 20 --arrival-rate 6 --two-factor --session-ttl 5 \
+        --keepalive 3                                                           站点会话过期时的后台保活
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import tempfile
+import threading
+from email.mime.text import MIMEText
+from email.header import Header
+from email.utils import formatdate
+from urllib.parse import urljoin, urlparse
+from typing import Optional, List, Dict, Any
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+SUBJECT_KEYWORD = "【新しい応募者のお知らせ】"
+SITE_USER = "recruit@example.co.jp"
+SITE_PASS = "loadtest"
+HTTP_TIMEOUT = 15
+PAGE_VARIANTS = ("tel", "label", "following", "text")
+
+# ====== 合成数据 ======
+def applicant_phone(i: int) -> str:
+    # 每个求职者一个不重复的号码，SMS替身收到的本地格式号码可反查到第几封邮件
+    return f"+81 90 {1000 + i // 10000:04d} {i % 10000:04d}"
+
+def verification_mail(code: str, to_addr: str) -> bytes:
+    msg = MIMEText(f"認証コード: {code}\nこのコードは10分間有効です。", "plain", "utf-8")
+    msg["Subject"] = Header("Indeed 認証コード", "utf-8")
+    msg["From"] = "Indeed <no-reply@indeed.com>"
+    msg["To"] = to_addr
+    msg["Date"] = formatdate(localtime=True)
+    return msg.as_bytes()
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[k]
+
+# ====== HTTP 浏览器替身 ======
+class HttpDriver:
+    """Selenium driver 的最小替身：get / current_url / page_source / quit"""
+
+    def __init__(self, allowed_host: str):
+        import requests
+        self.session = requests.Session()
+        self.allowed_host = allowed_host
+        self.current_url = ""
+        self.page_source = ""
+
+    def _check(self, url: str):
+        if urlparse(url).hostname != self.allowed_host:
+            raise RuntimeError(f"离线压测不访问外部站点: {url}")
+
+    def _load(self, r):
+        self.current_url = r.url
+        self.page_source = r.text
+
+    def get(self, url: str):
+        self._check(url)
+        self._load(self.session.get(url, timeout=HTTP_TIMEOUT))
+
+    def submit_form(self, values: Dict[str, str]):
+        """提交页面上的第一个表单（带上隐藏字段）"""
+        from bs4 import BeautifulSoup
+        form = BeautifulSoup(self.page_source, "html.parser").find("form")
+        if form is None:
+            raise RuntimeError(f"页面没有表单: {self.current_url}")
+        data = {i.get("name"): i.get("value", "") for i in form.find_all("input") if i.get("name")}
+        data.update(values)
+        action = urljoin(self.current_url, form.get("action") or "")
+        self._check(action)
+        self._load(self.session.post(action, data=data, timeout=HTTP_TIMEOUT))
+
+    def quit(self):
+        self.session.close()
+
+def install_http_browser(rpa):
+    """把 site_login_and_open / extract_phone_from_page 换成走 HttpDriver 的同步骤实现"""
+    from metrics import timed
+    from bench_parsing import phone_fallback_func
+
+    _, fallback = phone_fallback_func()
+
+    @timed("site_login")
+    def http_login_and_open(driver, login_url, user, pwd, target_url, config):
+        driver.get(login_url)
+        if driver.current_url != login_url:
+            driver.get(target_url)
+            return
+        if 'name="__email"' not in driver.page_source:
+            raise RuntimeError("登录页结构异常，未找到邮箱输入框。")
+        with rpa.login_lock(config):
+            driver.submit_form({"__email": user})
+            if 'type="password"' in driver.page_source:
+                driver.submit_form({"password": pwd})
+            if 'id="verification_input"' in driver.page_source:
+                code = None
+                for _ in range(20):
+                    code = rpa.get_latest_verification_code(config)
+                    if code:
+                        break
+                    time.sleep(0.25)
+                if not code:
+                    raise RuntimeError("未取到二步验证码")
+                driver.submit_form({"code": code})
+        driver.get(target_url)
+
+    @timed("phone_extract")
+    def http_extract_phone(driver):
+        return fallback(driver.page_source)
+
+    rpa.site_login_and_open = http_login_and_open
+    rpa.extract_phone_from_page = http_extract_phone
+
+# ====== 进度 ======
+class Progress:
+    """对照 SMS替身收到的请求，判断何时结束并计算 time-to-SMS"""
+
+    def __init__(self, n: int, sms_state, settle: float, deadline: float):
+        from phone_batch import normalize_one
+        self.n = n
+        self.sms_state = sms_state
+        self.settle = settle
+        self.deadline = deadline
+        self.number_to_index = {normalize_one(applicant_phone(i))[1]: i for i in range(n)}
+        self.arrivals: Dict[int, float] = {}
+        self.feeding_done = threading.Event()
+        self.backlog_ready = threading.Event()
+        self.backlog: set = set()
+        self._last_count = 0
+        self._last_change = time.time()
+
+    def sent(self) -> Dict[int, float]:
+        """第几封邮件 → 第一次成功请求SMS API的时间（560后改用81格式重试的也算）"""
+        first: Dict[int, float] = {}
+        with self.sms_state.lock:
+            requests = list(self.sms_state.requests)
+        for r in requests:
+            number = r.get("mobilenumber") or ""
+            if number.startswith("81"):
+                number = "0" + number[2:]
+            i = self.number_to_index.get(number)
+            if i is not None and r["code"] == 200 and i not in first:
+                first[i] = r["t"]
+        return first
+
+    def finished(self) -> bool:
+        now = time.time()
+        if now >= self.deadline:
+            return True
+        count = len(self.sent())
+        if count != self._last_count:
+            self._last_count, self._last_change = count, now
+        if not self.feeding_done.is_set():
+            return False
+        # 全部发完，或投递结束后一段时间内再无新的成功发送（剩下的是处理失败的邮件）
+        return count >= self.n or now - self._last_change >= self.settle
+
+def add_duplicates(items: List[Dict], count: int, base_url: str, seed: int):
+    """追加 count 封重复通知（同一求职者的再次通知），插在原通知之后的随机位置"""
+    import corpus
+    rng = random.Random(seed + 1)
+    n = len(items)
+    for _ in range(count):
+        j = rng.randrange(n)
+        raw, url = corpus.make_notification(j, "button", "utf-8-b64", True, base_url)
+        pos = next(k for k, it in enumerate(items) if it.get("index") == j)
+        items.insert(rng.randint(pos + 1, len(items)), {"raw": raw, "url": url, "duplicate_of": j})
+
+def feed(mailbox, items: List[Dict], arrival_rate: float, progress: Progress, seed: int, backlog: int = 0):
+    """前 backlog 封立即投递（积压），其余 arrival_rate>0 时按泊松过程投递（封/分），否则一次性全部投递"""
+    rng = random.Random(seed)
+    for k, item in enumerate(items):
+        if k == backlog:
+            progress.backlog_ready.set()
+        if arrival_rate > 0 and k > backlog:
+            time.sleep(rng.expovariate(arrival_rate / 60.0))
+        if "index" in item:
+            progress.arrivals[item["index"]] = time.time()
+            if k < backlog:
+                progress.backlog.add(item["index"])
+        mailbox.deliver(item["raw"])
+    progress.backlog_ready.set()
+    progress.feeding_done.set()
+
+# ====== 运行被测代码 ======
+def run_loop(rpa, config: Dict, templates: Dict, driver, interval: float, progress: Progress) -> Dict[str, Any]:
+    """与 send_sms_firebase.main() 模式2相同的循环，只是可以停止"""
+    from poll_scheduler import PollScheduler
+    from session_keepalive import SessionKeeper
+
+    processed_mids = set()
+    observed_mids = set()
+    scheduler = PollScheduler(base=interval)
+    keeper = SessionKeeper().start()
+    keeper.watch(driver, config)
+    polls = 0
+    try:
+        while not progress.finished():
+            polls += 1
+            msgs = rpa.get_all_target_unread_messages(SUBJECT_KEYWORD, config)
+            records = [rpa.parse_mail(mid, msg) for mid, msg in msgs if mid not in processed_mids]
+            del msgs
+            arrived = [r.mid for r in records if r.mid not in observed_mids]
+            observed_mids.update(arrived)
+            delay = scheduler.observe(len(arrived))
+            for record in records:
+                with keeper.using(driver):
+                    ok = rpa.process_record(driver, record, config, templates)
+                if ok:
+                    processed_mids.add(record.mid)
+                if progress.finished():
+                    break
+            if not progress.finished():
+                time.sleep(delay)
+    finally:
+        keeper.stop()
+    return {"polls": polls, "processed": len(processed_mids), "keepalive": keeper.stats()}
+
+async def _run_pipeline(pipeline, progress: Progress) -> Dict[str, int]:
+    task = asyncio.create_task(pipeline.run())
+    while not task.done() and not progress.finished():
+        await asyncio.sleep(0.2)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    return dict(pipeline.stats, keepalive=pipeline.keeper.stats())
+
+def applicant_index_stats() -> Dict[str, Any]:
+    from applicant_index import get_applicant_index, DEDUP_ENABLED
+    return get_applicant_index().stats() if DEDUP_ENABLED else {}
+
+# ====== 主流程 ======
+def configure_environment(args):
+    """必须在导入 send_sms_firebase 之前调用：数据目录、日志级别、轮询参数在模块导入时读取"""
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="rpa-loadtest-")
+    os.environ["RPA_DATA_DIR"] = data_dir
+    os.environ.setdefault("RPA_RESULTS", "0")
+    os.environ.setdefault("RPA_METRICS", "1")
+    os.environ.setdefault("RPA_LOG_LEVEL", "info" if args.verbose else "warning")
+    # 压测不按时段调整轮询间隔
+    os.environ.setdefault("RPA_POLL_PROFILES", "[]")
+    os.environ.setdefault("RPA_POLL_MIN", str(args.poll_interval))
+    os.environ.setdefault("RPA_POLL_MAX", str(args.poll_max))
+    os.environ.setdefault("RPA_KEEPALIVE", "1" if args.keepalive > 0 else "0")
+    os.environ.setdefault("RPA_KEEPALIVE_INTERVAL", str(args.keepalive or 240))
+    os.environ.setdefault("RPA_KEEPALIVE_IDLE", str(args.keepalive_idle))
+    return data_dir
+
+def run(args) -> Dict[str, Any]:
+    data_dir = configure_environment(args)
+
+    import corpus
+    import send_sms_firebase as rpa
+    from fake_imap import Mailbox, FakeIMAPServer
+    from fake_site import SiteState, FakeSite
+    from mock_sms_server import MockBehavior, MockSMSServer
+    from metrics import get_registry
+
+    mailbox = Mailbox(implicit_seen=args.implicit_seen)
+    imap = FakeIMAPServer(mailbox, latency_ms=args.imap_latency_ms, compress=args.imap_compress).start()
+    imap_config = imap.config()
+
+    def applicant(cid: str) -> Optional[Dict[str, Any]]:
+        try:
+            i = int(cid[4:]) if cid.startswith("cand") else -1
+        except ValueError:
+            return None
+        if not 0 <= i < args.mails:
+            return None
+        return {"variant": PAGE_VARIANTS[i % len(PAGE_VARIANTS)], "phone": applicant_phone(i),
+                "name": corpus.NAMES[i % len(corpus.NAMES)], "job": corpus.JOBS[i % len(corpus.JOBS)]}
+
+    site = FakeSite(SiteState(
+        applicant, SITE_USER, SITE_PASS, two_factor=args.two_factor,
+        on_code=lambda code: mailbox.deliver(verification_mail(code, imap_config["IMAP_USER"])),
+        latency_ms=args.site_latency_ms, jitter_ms=args.site_jitter_ms, seed=args.seed,
+        session_ttl=args.session_ttl,
+    )).start()
+    sms = MockSMSServer(MockBehavior(latency_ms=args.sms_latency_ms, error_rate=args.sms_error_rate,
+                                     seed=args.seed)).start()
+
+    # 目标链接只允许本地假站点
+    site_host = urlparse(site.base_url).hostname
+    rpa.ALLOWED_DOMAINS.clear()
+    rpa.ALLOWED_DOMAINS.add(site_host)
+
+    config = dict(imap_config, **{
+        "USER_UID": "loadtest",
+        "SMS_API_URL": sms.url, "SMS_API_ID": "loadtest", "SMS_API_PASSWORD": "loadtest",
+        "SITE_USER": SITE_USER, "SITE_PASS": SITE_PASS,
+        "SMS_TEXT_A": "{name}様 ご応募ありがとうございます。面接日程をご連絡します。",
+        "SMS_TEXT_B": "{name}様 ご応募ありがとうございます。担当よりご連絡します。",
+    })
+    templates = rpa.compile_templates({"A": config["SMS_TEXT_A"], "B": config["SMS_TEXT_B"]})
+
+    if args.driver == "http":
+        install_http_browser(rpa)
+        driver_factory = lambda i: HttpDriver(site_host)
+    else:
+        driver_factory = lambda i: rpa.make_driver(os.path.join(data_dir, f"chrome_user_data_{i}"))
+
+    items = corpus.generate_corpus(args.mails, seed=args.seed, base_url=site.base_url)
+    for i, item in enumerate(items):
+        item["index"] = i
+    add_duplicates(items, args.duplicates, site.base_url, args.seed)
+    started = time.time()
+    progress = Progress(args.mails, sms.state, args.settle, started + args.timeout)
+    feeder = threading.Thread(target=feed, name="loadtest-feeder", daemon=True,
+                              args=(mailbox, items, args.arrival_rate, progress, args.seed, args.backlog))
+    feeder.start()
+
+    try:
+        if args.mode == "pipeline":
+            from pipeline import Pipeline
+            pipeline = Pipeline(config, templates, SUBJECT_KEYWORD, args.poll_interval,
+                                extractors=args.extractors, driver_factory=driver_factory)
+            runner_stats = asyncio.run(_run_pipeline(pipeline, progress))
+        elif args.mode == "catchup":
+            from catchup import CatchUpPipeline
+            # 积压在启动前已全部投递，之后按 --arrival-rate 到达的是实时流量
+            progress.backlog_ready.wait()
+            pipeline = CatchUpPipeline(config, templates, SUBJECT_KEYWORD, budget_min=args.budget_min,
+                                       rate=args.rate_cap, extractors=args.extractors,
+                                       rescan=args.poll_interval, report_every=5, driver_factory=driver_factory)
+            runner_stats = asyncio.run(_run_pipeline(pipeline, progress))
+        else:
+            driver = driver_factory(0)
+            try:
+                runner_stats = run_loop(rpa, config, templates, driver, args.poll_interval, progress)
+            finally:
+                driver.quit()
+    finally:
+        finished = time.time()
+        for server in (site, sms, imap):
+            server.stop()
+
+    sent = progress.sent()
+    latencies = [t - progress.arrivals[i] for i, t in sent.items() if i in progress.arrivals]
+    live_latencies = [t - progress.arrivals[i] for i, t in sent.items()
+                      if i in progress.arrivals and i not in progress.backlog]
+    first_arrival = min(progress.arrivals.values()) if progress.arrivals else started
+    span = (max(sent.values()) - first_arrival) if sent else 0.0
+    per_minute: Dict[int, int] = {}
+    for t in sent.values():
+        minute = int((t - first_arrival) // 60)
+        per_minute[minute] = per_minute.get(minute, 0) + 1
+
+    missing: Dict[str, int] = {}
+    for item in items:
+        i = item.get("index")
+        if i is not None and i not in sent:
+            key = f"{item['layout']}/{item['encoding']}{'/multipart' if item['multipart'] else ''}"
+            missing[key] = missing.get(key, 0) + 1
+
+    stages = {}
+    histograms = get_registry().snapshot()["histograms"].get("rpa_stage_duration_seconds", [])
+    for h in histograms:
+        stages[h["stage"]] = {"count": h["count"], "p50_ms": round(h["p50"] * 1000, 1),
+                              "p95_ms": round(h["p95"] * 1000, 1), "max_ms": round(h["max"] * 1000, 1)}
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {k: v for k, v in vars(args).items() if k not in ("json",)},
+        "mails": args.mails,
+        "sent": len(sent),
+        "missing": args.mails - len(sent),
+        "missing_by_layout": dict(sorted(missing.items())),
+        "timed_out": finished >= progress.deadline,
+        "wall_seconds": round(finished - started, 2),
+        "applicants_per_min": round(len(sent) / span * 60, 2) if span > 0 else 0.0,
+        "time_to_sms": {
+            "p50_s": round(percentile(latencies, 0.50), 3),
+            "p95_s": round(percentile(latencies, 0.95), 3),
+            "max_s": round(max(latencies), 3) if latencies else 0.0,
+        },
+        "live_time_to_sms": {
+            "count": len(live_latencies),
+            "p50_s": round(percentile(live_latencies, 0.50), 3),
+            "p95_s": round(percentile(live_latencies, 0.95), 3),
+        } if args.backlog else {},
+        "per_minute": [per_minute.get(m, 0) for m in range(max(per_minute) + 1)] if per_minute else [],
+        "stages": stages,
+        "runner": runner_stats,
+        "duplicates": args.duplicates,
+        "duplicate_sms": sum(1 for r in sms.state.requests if r["code"] == 200) - len(sent),
+        "applicant_index": applicant_index_stats(),
+        "imap": dict(mailbox.stats),
+        "site": dict(site.state.stats),
+        "sms_api": sms.state.stats(),
+        "data_dir": data_dir,
+    }
+
+def print_report(report: Dict[str, Any]):
+    p = report["params"]
+    print(f"模式: {p['mode']} | 浏览器: {p['driver']}" + (f" x{p['extractors']}" if p["mode"] != "loop" else "")
+          + f" | 邮件: {report['mails']} | 到达: " + (f"{p['arrival_rate']}封/分" if p["arrival_rate"] else "一次性"))
+    status = "⚠️ 超时" if report["timed_out"] else ("✅" if not report["missing"] else "⚠️")
+    print(f"{status} 已发送 {report['sent']}/{report['mails']}，用时 {report['wall_seconds']}s")
+    print(f"吞吐: {report['applicants_per_min']} 人/分")
+    tts = report["time_to_sms"]
+    print(f"time-to-SMS: p50 {tts['p50_s']}s | p95 {tts['p95_s']}s | max {tts['max_s']}s")
+    if report["live_time_to_sms"]:
+        live = report["live_time_to_sms"]
+        print(f"实时流量（积压 {p['backlog']} 封之后到达的 {live['count']} 封）time-to-SMS: "
+              f"p50 {live['p50_s']}s | p95 {live['p95_s']}s")
+    if report["missing_by_layout"]:
+        print("未发送（版式/编码）: " + ", ".join(f"{k}:{v}" for k, v in report["missing_by_layout"].items()))
+    if report["per_minute"]:
+        print("每分钟发送: " + " ".join(str(c) for c in report["per_minute"]))
+    if report["stages"]:
+        print(f"\n{'stage':<16} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+        for name, s in sorted(report["stages"].items()):
+            print(f"{name:<16} {s['count']:>7} {s['p50_ms']:>10} {s['p95_ms']:>10} {s['max_ms']:>10}")
+    print(f"\nIMAP: {report['imap']}")
+    print(f"站点: {report['site']}")
+    keepalive = report["runner"].get("keepalive") or {}
+    if keepalive:
+        relogins = keepalive.get("relogins", 0)
+        print(f"会话保活: 确认 {keepalive.get('touches', 0)} 次 | 后台重新登录 {relogins} 次 | "
+              f"处理邮件时冷登录 {report['site']['logins'] - relogins} 次")
+    print(f"SMS API: {report['sms_api']}")
+    print(f"流程统计: {report['runner']}")
+    if report["duplicates"]:
+        idx = report["applicant_index"]
+        print(f"重复通知: {report['duplicates']} 封 | 重复发送的短信: {report['duplicate_sms']} | "
+              f"应募索引命中率: {idx.get('hit_rate', '关闭')} | Bloom拦截率: {idx.get('bloom_skip_rate', '-')}")
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="端到端离线压测（IMAP / 招聘站点 / SMS API 均为本地替身）")
+    parser.add_argument("--mails", type=int, default=100, help="投递的通知邮件数")
+    parser.add_argument("--mode", choices=("loop", "pipeline", "catchup"), default="loop",
+                        help="循环模式、流水线模式或积压补处理模式")
+    parser.add_argument("--driver", choices=("http", "chrome"), default="http", help="浏览器替身或真实Chrome")
+    parser.add_argument("--extractors", type=int, default=2, help="流水线模式的浏览器数")
+    parser.add_argument("--backlog", type=int, default=0, help="开始前立即投递的积压邮件数，其余按到达率投递")
+    parser.add_argument("--budget-min", type=float, default=0.0, help="补处理模式的时间预算（分），0为不限")
+    parser.add_argument("--rate-cap", type=float, default=0.0, help="补处理模式每分钟最多派发几封，0为不限")
+    parser.add_argument("--arrival-rate", type=float, default=0.0, help="每分钟到达的邮件数（泊松），0为一次性投递")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="基准轮询间隔（秒）")
+    parser.add_argument("--poll-max", type=float, default=5.0, help="最大轮询间隔（秒）")
+    parser.add_argument("--imap-latency-ms", type=float, default=20.0, help="IMAP每条命令的延迟")
+    parser.add_argument("--imap-compress", action="store_true", help="IMAP替身提供 COMPRESS=DEFLATE")
+    parser.add_argument("--site-latency-ms", type=float, default=200.0, help="站点每个请求的延迟")
+    parser.add_argument("--site-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--sms-latency-ms", type=float, default=150.0, help="SMS API延迟")
+    parser.add_argument("--sms-error-rate", type=float, default=0.0)
+    parser.add_argument("--duplicates", type=int, default=0, help="额外投递的重复通知数（同一求职者再次通知）")
+    parser.add_argument("--two-factor", action="store_true", help="登录时要求二步验证（验证码邮件投递到IMAP替身）")
+    parser.add_argument("--session-ttl", type=float, default=0.0, help="站点会话空闲多少秒后过期，0为不过期")
+    parser.add_argument("--keepalive", type=float, default=0.0, help="会话保活间隔（秒），0为关闭")
+    parser.add_argument("--keepalive-idle", type=float, default=1.0, help="浏览器空闲多少秒后才保活")
+    parser.add_argument("--implicit-seen", action="store_true", help="FETCH RFC822 时自动设为已读（与Gmail相同）")
+    parser.add_argument("--settle", type=float, default=15.0, help="投递结束后多少秒无新发送即结束")
+    parser.add_argument("--timeout", type=float, default=1800.0, help="最长运行秒数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default="", help="send_history 等数据目录，默认临时目录")
+    parser.add_argument("--json", default="", help="报告另存为JSON")
+    parser.add_argument("--verbose", action="store_true", help="输出被测代码的日志")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n报告已保存: {args.json}")
+
+if __name__ == "__main__":
+    main()
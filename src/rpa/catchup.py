@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+积压补处理模式（send_sms_firebase.py 模式4）
+停机或周末之后收件箱里可能积压几百封未读通知，循环模式只会按序号倒序逐封处理，没有截止时间的概念。
+这里在 pipeline.Pipeline 上换一个抓取阶段：
+- 先只取全部未读邮件的 Subject/Date 头（BODY.PEEK，不下载正文、不标记已读），排好优先级后
+  每次按优先级取够浏览器数的一批，一条批量 FETCH 取全文（mail_fetch.py，可用时启用 COMPRESS=DEFLATE）再派发
+    newest  最新的先处理（默认）
+    value   按职位关键词权重（RPA_CATCHUP_VALUE="正社員:3,店長:2"），同分时新的先
+- 浏览器数提高到 RPA_CATCHUP_EXTRACTORS；派发受速率上限 RPA_CATCHUP_RATE（封/分）约束，保护站点和SMS接口
+- 总时间预算 RPA_CATCHUP_BUDGET_MIN：到时不再派发，处理中的做完即结束，剩下的保持未读交给常规模式
+- 每 RPA_CATCHUP_RESCAN 秒重新搜索一次 UNSEEN：补处理开始后新到的邮件是实时流量，排在所有积压之前
+  （队列容量很小，实时邮件最多等几封已派发的积压）
+- 每 RPA_CATCHUP_REPORT 秒打印进度和 ETA（按已完成的速率估算），同时写 catchup_progress 事件
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import imaplib
+from email.message import Message
+from email.header import decode_header
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Tuple
+
+from send_sms_firebase import imap_connect, select_folder, fetch_headers, subject_matches, decode_any, FETCH_CHUNK
+from pipeline import Pipeline, MailJob, _DONE
+from mail_fetch import enable_compression, iter_messages
+from sms_template import extract_applicant_info
+from event_log import make_print, log_event
+
+print = make_print()
+
+CATCHUP_EXTRACTORS = int(os.getenv("RPA_CATCHUP_EXTRACTORS", "4"))
+CATCHUP_QUEUE_SIZE = int(os.getenv("RPA_CATCHUP_QUEUE", "2"))
+CATCHUP_RATE = float(os.getenv("RPA_CATCHUP_RATE", "30"))           # 每分钟最多派发几封，0为不限
+CATCHUP_BUDGET_MIN = float(os.getenv("RPA_CATCHUP_BUDGET_MIN", "60"))
+CATCHUP_PRIORITY = os.getenv("RPA_CATCHUP_PRIORITY", "newest").lower()
+CATCHUP_VALUE = os.getenv("RPA_CATCHUP_VALUE", "")
+CATCHUP_RESCAN = float(os.getenv("RPA_CATCHUP_RESCAN", "15"))
+CATCHUP_REPORT = float(os.getenv("RPA_CATCHUP_REPORT", "30"))
+
+LIVE, BACKLOG = 0, 1
+
+def parse_value_weights(spec: str) -> List[Tuple[str, float]]:
+    """'正社員:3,店長:2' → [('正社員', 3.0), ('店長', 2.0)]；没写权重的关键词记1分"""
+    weights = []
+    for part in spec.split(","):
+        word, _, weight = part.strip().partition(":")
+        if not word:
+            continue
+        try:
+            weights.append((word.strip(), float(weight) if weight else 1.0))
+        except ValueError:
+            print(f"⚠️ RPA_CATCHUP_VALUE 权重无效，已忽略: {part}")
+    return weights
+
+def mail_timestamp(headers: Message) -> float:
+    try:
+        return parsedate_to_datetime(headers.get("Date")).timestamp()
+    except Exception:
+        return 0.0
+
+def format_duration(seconds: float) -> str:
+    seconds = max(0, int(seconds))
+    h, rest = divmod(seconds, 3600)
+    return f"{h}:{rest // 60:02d}:{rest % 60:02d}" if h else f"{rest // 60}:{rest % 60:02d}"
+
+# ====== 优先级队列 ======
+class BacklogQueue:
+    """(类别, -价值分, -时间, -序号) 最小堆：实时邮件永远在积压之前，其余按优先级策略"""
+
+    def __init__(self, priority: str = CATCHUP_PRIORITY, value_spec: str = CATCHUP_VALUE):
+        self.priority = priority if priority in ("newest", "value") else "newest"
+        self.weights = parse_value_weights(value_spec) if self.priority == "value" else []
+        self._heap: List[tuple] = []
+        self.counts = {LIVE: 0, BACKLOG: 0}
+
+    def score(self, headers: Message) -> float:
+        if not self.weights:
+            return 0.0
+        text = extract_applicant_info(headers)["job"] or decode_any(decode_header(headers.get("Subject") or "")[0][0])
+        return sum(w for word, w in self.weights if word in text)
+
+    def push(self, mid: bytes, headers: Message, klass: int = BACKLOG):
+        key = (klass, -self.score(headers), -mail_timestamp(headers), -int(mid))
+        heapq.heappush(self._heap, (key, mid))
+        self.counts[klass] += 1
+
+    def pop(self) -> Tuple[int, bytes]:
+        key, mid = heapq.heappop(self._heap)
+        self.counts[key[0]] -= 1
+        return key[0], mid
+
+    def __len__(self):
+        return len(self._heap)
+
+# ====== 派发速率上限 ======
+class RateLimiter:
+    """令牌桶：平均每分钟 per_minute 个，最多攒 burst 个（让所有浏览器一开始就有活干）"""
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """拿到令牌返回0，否则返回还需等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+# ====== IMAP会话（补处理期间保持登录，断线自动重连一次）======
+class MailSession:
+    def __init__(self, config: Dict):
+        self.config = config
+        self.box = None
+
+    def connect(self):
+        self.box = imap_connect(self.config)
+        self.box.login(self.config["IMAP_USER"], self.config["IMAP_PASS"])
+        enable_compression(self.box)
+        select_folder(self.box, self.config)
+
+    def _call(self, func, *args):
+        if self.box is None:
+            self.connect()
+        try:
+            return func(self.box, *args)
+        except (imaplib.IMAP4.abort, OSError):
+            self.connect()
+            return func(self.box, *args)
+
+    # 补处理期间（最长整个预算）一直持有这些编号，之后还要在另一条连接上标记已读：
+    # 中途有邮件被删除时序号会错位，所以搜索、取信、标记全部用UID
+    def unseen(self) -> List[bytes]:
+        typ, data = self._call(lambda box: box.uid("SEARCH", None, 'UNSEEN'))
+        return data[0].split() if typ == "OK" and data and data[0] else []
+
+    def headers(self, mids: List[bytes]) -> Dict[bytes, Message]:
+        found = {}
+        for start in range(0, len(mids), FETCH_CHUNK):
+            found.update(self._call(fetch_headers, mids[start:start + FETCH_CHUNK], "SUBJECT DATE", True))
+        return found
+
+    def messages(self, mids: List[bytes]) -> Dict[bytes, Message]:
+        return self._call(lambda box: dict(iter_messages(box, mids, uid=True)))
+
+    def close(self):
+        try:
+            self.box.logout()
+        except Exception:
+            pass
+
+# ====== 补处理流水线 ======
+class CatchUpPipeline(Pipeline):
+    def __init__(self, config: Dict, templates: Dict, subject_keyword: str,
+                 budget_min: float = CATCHUP_BUDGET_MIN, rate: float = CATCHUP_RATE,
+                 priority: str = CATCHUP_PRIORITY, value_spec: str = CATCHUP_VALUE,
+                 extractors: int = CATCHUP_EXTRACTORS, queue_size: int = CATCHUP_QUEUE_SIZE,
+                 rescan: float = CATCHUP_RESCAN, report_every: float = CATCHUP_REPORT, driver_factory=None):
+        super().__init__(config, templates, subject_keyword, rescan, extractors, queue_size, driver_factory)
+        self.budget = budget_min * 60
+        self.limiter = RateLimiter(rate, burst=self.extractors)
+        self.queue = BacklogQueue(priority, value_spec)
+        self.rescan = rescan
+        self.report_every = report_every
+        self.known = set()
+        self.started = time.monotonic()
+        self.stats.update({"backlog": 0, "live": 0, "dispatched_backlog": 0, "dispatched_live": 0,
+                           "left_unread": 0})
+
+    def deadline_passed(self) -> bool:
+        return self.budget > 0 and time.monotonic() - self.started >= self.budget
+
+    async def _scan(self, session: MailSession, klass: int) -> int:
+        ids = [m for m in await self._call(self._io, session.unseen) if m not in self.known]
+        if not ids:
+            return 0
+        self.known.update(ids)
+        headers = await self._call(self._io, session.headers, ids)
+        added = 0
+        for mid in ids:
+            h = headers.get(mid)
+            if h is not None and subject_matches(h.get("Subject"), self.subject_keyword):
+                self.queue.push(mid, h, klass)
+                added += 1
+        self.stats["live" if klass == LIVE else "backlog"] += added
+        return added
+
+    # ====== 阶段1（替换）：排序后的积压 + 实时邮件 ======
+    async def fetcher(self, out: asyncio.Queue, once: bool):
+        session = MailSession(self.config)
+        try:
+            total = await self._scan(session, BACKLOG)
+            print(f"📥 积压未读通知 {total} 封 | 优先级: {self.queue.priority} | 浏览器 {self.extractors} 个 | "
+                  f"速率上限 {self.limiter.rate * 60:g} 封/分 | 预算 {format_duration(self.budget)}")
+            log_event("catchup_started", "info", backlog=total, priority=self.queue.priority,
+                      extractors=self.extractors, rate_per_min=self.limiter.rate * 60, budget_s=self.budget)
+            last_scan = time.monotonic()
+            while len(self.queue):
+                if self.deadline_passed():
+                    break
+                if time.monotonic() - last_scan >= self.rescan:
+                    last_scan = time.monotonic()
+                    live = await self._scan(session, LIVE)
+                    if live:
+                        print(f"⚡ 新到实时通知 {live} 封，优先于积压处理")
+                wait = self.limiter.reserve()
+                if wait > 0:
+                    await asyncio.sleep(min(wait, self.rescan))
+                    continue
+                # 一批最多浏览器数那么多封：批量取信省往返，又不会让之后到达的实时邮件等太久
+                batch = [self.queue.pop()]
+                while len(batch) < self.extractors and len(self.queue) and self.limiter.reserve() == 0:
+                    batch.append(self.queue.pop())
+                msgs = await self._call(self._io, session.messages, [mid for _, mid in batch])
+                for klass, mid in batch:
+                    msg = msgs.get(mid)
+                    if msg is None:
+                        continue
+                    self.in_flight.add(mid)
+                    self.stats["fetched"] += 1
+                    self.stats["dispatched_live" if klass == LIVE else "dispatched_backlog"] += 1
+                    await out.put(MailJob(mid, msg))
+        except asyncio.CancelledError:
+            session.close()
+            raise
+        finally:
+            self.stats["left_unread"] = len(self.queue)
+        await self._call(self._io, session.close)
+        await out.put(_DONE)
+
+    # ====== 进度 / ETA ======
+    def progress(self) -> Dict:
+        s = self.stats
+        done = s["committed"] + s["duplicate"] + s["failed"]
+        elapsed = time.monotonic() - self.started
+        remaining = len(self.queue) + len(self.in_flight)
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = remaining / rate if rate > 0 else None
+        budget_left = max(0.0, self.budget - elapsed) if self.budget > 0 else None
+        return {"done": done, "sent": s["committed"], "duplicate": s["duplicate"], "failed": s["failed"],
+                "remaining": remaining, "live_waiting": self.queue.counts[LIVE],
+                "per_min": round(rate * 60, 1), "elapsed_s": round(elapsed),
+                "eta_s": round(eta) if eta is not None else None,
+                "budget_left_s": round(budget_left) if budget_left is not None else None}
+
+    def report(self):
+        p = self.progress()
+        eta = format_duration(p["eta_s"]) if p["eta_s"] is not None else "-"
+        line = (f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 补处理 完成 {p['done']}/{p['done'] + p['remaining']}"
+                f"（发送 {p['sent']}，重复 {p['duplicate']}，失败 {p['failed']}）| 剩余 {p['remaining']}"
+                f"（实时 {p['live_waiting']}）| {p['per_min']} 封/分 | ETA {eta}")
+        if p["budget_left_s"] is not None:
+            line += f" | 预算剩余 {format_duration(p['budget_left_s'])}"
+            if p["eta_s"] is not None and p["eta_s"] > p["budget_left_s"]:
+                line += f" ⚠️ 预算内约还能处理 {int(p['per_min'] * p['budget_left_s'] / 60)} 封"
+        print(line)
+        log_event("catchup_progress", "info", **p)
+
+    async def reporter(self):
+        while True:
+            await asyncio.sleep(self.report_every)
+            self.report()
+
+    async def run(self, once: bool = False):
+        self.started = time.monotonic()
+        reporter = asyncio.create_task(self.reporter())
+        try:
+            return await super().run(once)
+        finally:
+            reporter.cancel()
+            self.report()
+            if self.stats["left_unread"]:
+                print(f"⏰ 时间预算用完，{self.stats['left_unread']} 封保持未读，交给常规模式处理")
+
+def run_catchup(config: Dict, templates: Dict, subject_keyword: str, **kwargs) -> Dict[str, int]:
+    pipeline = CatchUpPipeline(config, templates, subject_keyword, **kwargs)
+    print("进入积压补处理模式：处理完积压或预算用完后退出。按Ctrl+C退出。")
+    try:
+        return asyncio.run(pipeline.run())
+    except KeyboardInterrupt:
+        print("\n已手动退出补处理模式。")
+        return pipeline.stats
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户配置本地缓存（按 uid）
+send_personal_sms.py 每次都要初始化 Firebase Admin 并读取 user_configs/{uid}，
+这里把读到的配置连同版本戳（文档 update_time）写到本地文件：
+- 短进程：TTL 内直接读文件（进程内再按 mtime 缓存解析结果），不走网络
+- 长进程（worker / 循环模式）：watch() 注册 Firestore on_snapshot，网页端一改就刷新
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Optional, Dict, Any, Tuple
+
+DATA_DIR = os.getenv("RPA_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+CONFIG_CACHE_DIR = os.getenv("CONFIG_CACHE_DIR", os.path.join(DATA_DIR, "config_cache"))
+# 没有 on_snapshot 监听时的最长信任时间（秒），网页端修改最迟这么久后生效
+CONFIG_CACHE_TTL = float(os.getenv("CONFIG_CACHE_TTL", "60"))
+
+class ConfigCache:
+    def __init__(self, cache_dir: str = CONFIG_CACHE_DIR, ttl: float = CONFIG_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # uid -> (文件mtime, 解析后的条目)
+        self._memo: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._watches: Dict[str, Any] = {}
+
+    def _path(self, uid: str) -> str:
+        safe = "".join(c for c in uid if c.isalnum() or c in "-_")
+        return os.path.join(self.cache_dir, f"{safe}.json")
+
+    def _load(self, uid: str) -> Optional[Dict[str, Any]]:
+        path = self._path(uid)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        with self._lock:
+            memo = self._memo.get(uid)
+            if memo and memo[0] == mtime:
+                return memo[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._memo[uid] = (mtime, entry)
+        return entry
+
+    def get(self, uid: str, max_age: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """返回未过期的配置；有 on_snapshot 监听的 uid 不看 TTL"""
+        entry = self._load(uid)
+        if not entry:
+            return None
+        if uid not in self._watches:
+            max_age = self.ttl if max_age is None else max_age
+            if time.time() - float(entry.get("fetched_at", 0)) > max_age:
+                return None
+        return entry.get("config")
+
+    def get_stale(self, uid: str) -> Optional[Dict[str, Any]]:
+        """忽略TTL（Firestore不可用时兜底）"""
+        entry = self._load(uid)
+        return entry.get("config") if entry else None
+
+    def version(self, uid: str) -> Optional[str]:
+        entry = self._load(uid)
+        return entry.get("version") if entry else None
+
+    def put(self, uid: str, config: Dict[str, Any], version: Optional[str] = None):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = {"uid": uid, "version": version, "fetched_at": time.time(), "config": config}
+        path = self._path(uid)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, default=str)
+        try:
+            os.chmod(tmp, 0o600)  # 含API密码，只给本用户读
+        except OSError:
+            pass
+        # 原子替换，其他进程不会读到半个文件
+        os.replace(tmp, path)
+        with self._lock:
+            self._memo.pop(uid, None)
+
+    def invalidate(self, uid: str):
+        try:
+            os.remove(self._path(uid))
+        except OSError:
+            pass
+        with self._lock:
+            self._memo.pop(uid, None)
+
+    def watch(self, db, uid: str):
+        """注册 Firestore on_snapshot：文档变化即写入缓存（用于常驻进程）"""
+        if uid in self._watches:
+            return self._watches[uid]
+
+        def on_snapshot(doc_snapshots, changes, read_time):
+            for doc in doc_snapshots:
+                if doc.exists:
+                    self.put(uid, doc.to_dict(), str(getattr(doc, "update_time", "") or read_time))
+                else:
+                    self.invalidate(uid)
+
+        watch = db.collection("user_configs").document(uid).on_snapshot(on_snapshot)
+        self._watches[uid] = watch
+        return watch
+
+    def unwatch_all(self):
+        for watch in self._watches.values():
+            try:
+                watch.unsubscribe()
+            except Exception:
+                pass
+        self._watches.clear()
+
+_default_cache: Optional[ConfigCache] = None
+
+def get_config_cache() -> ConfigCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ConfigCache()
+    return _default_cache
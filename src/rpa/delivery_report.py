@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+送达报告（Delivery Report）接收与统计
+1. post_once 在 SMS_USE_REPORT=1 时带上 smsid，并把发送记录写入本地SQLite
+2. 回调接收器（serve）或轮询器（poll）把运营商送达状态按 smsid 写回
+3. stats 按模板 / 运营商统计送达率和送达延迟
+
+HTTP 200 只代表API受理，不代表送达（配额、过滤、黑名单都可能返回200），
+真实吞吐请看这里的 delivered 数。
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import base64
+import threading
+from typing import Optional, List, Dict, Any, Iterable
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ====== 配置 ======
+DATA_DIR = os.getenv("RPA_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+DELIVERY_DB = os.getenv("DELIVERY_DB", os.path.join(DATA_DIR, "delivery_reports.db"))
+# 轮询用的状态查询接口（本地替身或服务商提供的状态API）
+SMS_STATUS_URL = os.getenv("SMS_STATUS_URL", "")
+
+# 服务商文档里的状态值只有 delivered / failed / pending（mock_sms_server.py 同此）
+# 其他值不猜测含义，按原样保存（raw_status 列另存原文），统计时视为 pending
+
+def normalize_status(raw: Optional[str]) -> str:
+    if raw is None:
+        return "pending"
+    return str(raw).strip().lower()
+
+# ====== 本地状态库 ======
+class DeliveryStore:
+    """以 smsid 为主键的送达状态库（SQLite，多进程可共用同一文件）"""
+
+    def __init__(self, db_path: str = DELIVERY_DB):
+        self.db_path = db_path
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sms_reports (
+                smsid       TEXT PRIMARY KEY,
+                phone       TEXT,
+                template    TEXT,
+                carrier     TEXT,
+                http_status INTEGER,
+                sent_at     REAL,
+                status      TEXT NOT NULL DEFAULT 'pending',
+                raw_status  TEXT,
+                status_at   REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_reports_template ON sms_reports(template);
+            CREATE INDEX IF NOT EXISTS idx_reports_carrier ON sms_reports(carrier);
+            CREATE INDEX IF NOT EXISTS idx_reports_status_sent ON sms_reports(status, sent_at);
+            """
+        )
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record_sent(self, smsid: str, phone: str, template: str = "",
+                    http_status: Optional[int] = None, carrier: Optional[str] = None,
+                    sent_at: Optional[float] = None):
+        """发送时调用：登记 smsid（已有状态回传时不覆盖状态）"""
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO sms_reports (smsid, phone, template, carrier, http_status, sent_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(smsid) DO UPDATE SET
+                    phone=excluded.phone,
+                    template=excluded.template,
+                    carrier=COALESCE(excluded.carrier, sms_reports.carrier),
+                    http_status=excluded.http_status,
+                    sent_at=excluded.sent_at
+                """,
+                (smsid, phone, template, carrier, http_status, sent_at or time.time()),
+            )
+            self._conn.commit()
+
+    def record_status(self, smsid: str, raw_status: Optional[str], carrier: Optional[str] = None,
+                      status_at: Optional[float] = None):
+        """状态回传时调用：按 smsid 更新送达状态"""
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO sms_reports (smsid, carrier, status, raw_status, status_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(smsid) DO UPDATE SET
+                    carrier=COALESCE(excluded.carrier, sms_reports.carrier),
+                    status=excluded.status,
+                    raw_status=excluded.raw_status,
+                    status_at=excluded.status_at
+                """,
+                (smsid, carrier, normalize_status(raw_status), raw_status, status_at or time.time()),
+            )
+            self._conn.commit()
+
+    def get(self, smsid: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cur = self._conn.execute("SELECT * FROM sms_reports WHERE smsid = ?", (smsid,))
+            row = cur.fetchone()
+            if not row:
+                return None
+            return dict(zip([c[0] for c in cur.description], row))
+
+    def pending_smsids(self, older_than: float = 0.0, limit: int = 500) -> List[str]:
+        """取出仍未确定状态的 smsid，供轮询器使用"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT smsid FROM sms_reports WHERE status = 'pending' AND sent_at <= ? "
+                "ORDER BY sent_at LIMIT ?",
+                (time.time() - older_than, limit),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def stats(self, group_by: str = "template", since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """按 template 或 carrier 统计送达率、延迟（秒）"""
+        if group_by not in ("template", "carrier"):
+            raise ValueError(f"group_by must be 'template' or 'carrier': {group_by}")
+        where = "WHERE sent_at >= ?" if since else ""
+        params: tuple = (since,) if since else ()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT COALESCE({group_by}, ''), status, status_at - sent_at "
+                f"FROM sms_reports {where}",
+                params,
+            ).fetchall()
+        groups: Dict[str, Dict[str, Any]] = {}
+        for key, status, latency in rows:
+            g = groups.setdefault(key, {group_by: key, "total": 0, "delivered": 0,
+                                        "failed": 0, "pending": 0, "_lat": []})
+            g["total"] += 1
+            if status == "delivered":
+                g["delivered"] += 1
+                if latency is not None and latency >= 0:
+                    g["_lat"].append(latency)
+            elif status == "failed":
+                g["failed"] += 1
+            else:
+                g["pending"] += 1
+        result = []
+        for g in groups.values():
+            lat = sorted(g.pop("_lat"))
+            g["delivery_rate"] = round(g["delivered"] / g["total"], 4) if g["total"] else 0.0
+            g["latency_avg"] = round(sum(lat) / len(lat), 3) if lat else None
+            g["latency_p50"] = round(_percentile(lat, 0.50), 3) if lat else None
+            g["latency_p95"] = round(_percentile(lat, 0.95), 3) if lat else None
+            result.append(g)
+        result.sort(key=lambda g: g["total"], reverse=True)
+        return result
+
+    def delivered_throughput(self, window: float = 3600.0) -> float:
+        """最近 window 秒内真实送达的条数/分钟"""
+        with self._lock:
+            (n,) = self._conn.execute(
+                "SELECT COUNT(*) FROM sms_reports WHERE status = 'delivered' AND status_at >= ?",
+                (time.time() - window,),
+            ).fetchone()
+        return n / (window / 60.0)
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+_default_store: Optional[DeliveryStore] = None
+
+def get_store() -> DeliveryStore:
+    """进程内共用一个连接"""
+    global _default_store
+    if _default_store is None:
+        _default_store = DeliveryStore()
+    return _default_store
+
+def record_sent_report(smsid: str, mobilenumber: str, template: str, http_status: int):
+    """post_once 发送后登记smsid，失败只打印警告，不影响发送"""
+    try:
+        get_store().record_sent(smsid, mobilenumber, template, http_status)
+    except Exception as e:
+        print(f"⚠️ 登记送达报告失败：{e}")
+
+# ====== 回调接收器 ======
+def _parse_report_fields(fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    smsid = fields.get("smsid") or fields.get("sms_id") or fields.get("id")
+    if not smsid:
+        return None
+    return {
+        "smsid": str(smsid),
+        "status": fields.get("status") or fields.get("result"),
+        "carrier": fields.get("carrier") or fields.get("career"),
+    }
+
+def _flatten_qs(raw: str) -> Dict[str, str]:
+    return {k: v[0] for k, v in parse_qs(raw, keep_blank_values=True).items()}
+
+def make_report_handler(store: DeliveryStore):
+    class ReportHandler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, body: str):
+            data = body.encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self, fields: Dict[str, Any]):
+            report = _parse_report_fields(fields)
+            if not report:
+                self._reply(400, "smsid required")
+                return
+            store.record_status(report["smsid"], report["status"], report["carrier"])
+            self._reply(200, "OK")
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            if parsed.path.rstrip("/") == "/stats":
+                body = json.dumps({"template": store.stats("template"),
+                                   "carrier": store.stats("carrier")}, ensure_ascii=False)
+                self._reply(200, body)
+                return
+            self._handle(_flatten_qs(parsed.query))
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length).decode("utf-8", errors="replace")
+            ctype = self.headers.get("Content-Type", "")
+            try:
+                fields = json.loads(raw) if "json" in ctype else _flatten_qs(raw)
+            except ValueError:
+                self._reply(400, "bad body")
+                return
+            # 批量回传：[{smsid, status}, ...]
+            if isinstance(fields, list):
+                for item in fields:
+                    report = _parse_report_fields(item) if isinstance(item, dict) else None
+                    if report:
+                        store.record_status(report["smsid"], report["status"], report["carrier"])
+                self._reply(200, "OK")
+                return
+            self._handle(fields)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReportHandler
+
+def serve_reports(host: str = "127.0.0.1", port: int = 8090, store: Optional[DeliveryStore] = None) -> ThreadingHTTPServer:
+    """启动送达回调接收服务（后台线程），返回 server 以便 shutdown()"""
+    server = ThreadingHTTPServer((host, port), make_report_handler(store or get_store()))
+    t = threading.Thread(target=server.serve_forever, name="delivery-report-receiver", daemon=True)
+    t.start()
+    return server
+
+# ====== 轮询器 ======
+def poll_once(store: DeliveryStore, status_url: str, api_id: str, api_password: str,
+              smsids: Optional[Iterable[str]] = None, timeout: float = 15) -> int:
+    """向状态接口查询 pending 的 smsid，返回本次更新的条数"""
+    import requests
+
+    ids = list(smsids) if smsids is not None else store.pending_smsids(older_than=5)
+    if not ids:
+        return 0
+    token = base64.b64encode(f"{api_id}:{api_password}".encode("utf-8")).decode("utf-8")
+    headers = {
+        "Authorization": f"Basic {token}",
+        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+    }
+    updated = 0
+    with requests.Session() as session:
+        for smsid in ids:
+            try:
+                r = session.post(status_url, headers=headers, data={"smsid": smsid}, timeout=timeout)
+            except Exception as e:
+                print(f"⚠️ 状态查询失败 {smsid}: {e}")
+                continue
+            if r.status_code != 200:
+                continue
+            text = r.text.strip()
+            try:
+                fields = r.json() if text.startswith("{") else _flatten_qs(text)
+            except ValueError:
+                fields = {"status": text}
+            fields.setdefault("smsid", smsid)
+            report = _parse_report_fields(fields)
+            if report and report["status"] is not None:
+                store.record_status(report["smsid"], report["status"], report["carrier"])
+                updated += 1
+    return updated
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SMS送达报告接收/轮询/统计")
+    sub = parser.add_subparsers(dest="cmd")
+    p_serve = sub.add_parser("serve", help="启动回调接收服务")
+    p_serve.add_argument("--host", default="127.0.0.1")
+    p_serve.add_argument("--port", type=int, default=int(os.getenv("DELIVERY_REPORT_PORT", "8090")))
+    p_poll = sub.add_parser("poll", help="轮询状态接口")
+    p_poll.add_argument("--url", default=SMS_STATUS_URL)
+    p_poll.add_argument("--interval", type=float, default=30.0)
+    p_poll.add_argument("--once", action="store_true")
+    p_stats = sub.add_parser("stats", help="输出统计")
+    p_stats.add_argument("--by", choices=["template", "carrier"], default="template")
+    p_stats.add_argument("--since-hours", type=float, default=0)
+    args = parser.parse_args()
+
+    store = get_store()
+    if args.cmd == "serve":
+        server = serve_reports(args.host, args.port, store)
+        print(f"📬 送达报告接收中: http://{args.host}:{args.port}/ （GET /stats 查看统计）")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+    elif args.cmd == "poll":
+        if not args.url:
+            print("请设置 SMS_STATUS_URL 或 --url")
+            sys.exit(1)
+        api_id = os.getenv("SMS_API_ID", "")
+        api_password = os.getenv("SMS_API_PASSWORD", "")
+        while True:
+            n = poll_once(store, args.url, api_id, api_password)
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 状态更新 {n} 条")
+            if args.once:
+                break
+            time.sleep(args.interval)
+    elif args.cmd == "stats":
+        since = time.time() - args.since_hours * 3600 if args.since_hours else None
+        print(json.dumps(store.stats(args.by, since), ensure_ascii=False, indent=2))
+        print(f"最近1小时真实送达: {store.delivered_throughput():.2f} 条/分钟")
+    else:
+        parser.print_help()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+结构化事件日志（JSON Lines）
+- 事件 = 稳定的事件名 + 级别 + 字段，例如 {"event": "mail_processed", "level": "info", "status": "sent", ...}
+- 所有输出由一个后台写线程批量写出：调用方不做编码处理、不逐条 flush
+- RPA_LOG_FORMAT=compat（默认）：stdout 输出与原来的 print 文本完全一致（保留 rpa_server.js 解析的
+  SUCCESS: / ERROR: / SCRIPT_EXIT_* 标记）；RPA_LOG_FORMAT=json：stdout 每行一个JSON事件
+- RPA_LOG_FILE 设置后另写一份 JSON Lines 文件，按大小轮转
+- 旧代码里的 print / input 可以用 make_print() / make_input() 生成的兼容函数替代，不用逐行修改
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import builtins
+import threading
+from typing import Optional, Dict, Any
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+LOG_FORMAT = os.getenv("RPA_LOG_FORMAT", "compat")
+LOG_LEVEL = os.getenv("RPA_LOG_LEVEL", "info")
+LOG_FILE = os.getenv("RPA_LOG_FILE", "")
+LOG_MAX_BYTES = int(os.getenv("RPA_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("RPA_LOG_BACKUPS", "5"))
+# 写线程最长攒多久再写出（秒）
+LOG_FLUSH_INTERVAL = float(os.getenv("RPA_LOG_FLUSH_INTERVAL", "0.2"))
+
+# print 文本开头的图标 → 级别
+_PREFIX_LEVELS = (("❌", "error"), ("ERROR:", "error"), ("⚠️", "warning"), ("WARNING:", "warning"))
+
+class RotatingFile:
+    """按大小轮转：path → path.1 → ... → path.N"""
+
+    def __init__(self, path: str, max_bytes: int = LOG_MAX_BYTES, backups: int = LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._f = open(path, "a", encoding="utf-8")
+        self._size = self._f.tell()
+
+    def write(self, text: str):
+        data = text.encode("utf-8")
+        if self.max_bytes and self._size + len(data) > self.max_bytes and self._size:
+            self._rotate()
+        self._f.write(text)
+        self._size += len(data)
+
+    def _rotate(self):
+        self._f.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._f = open(self.path, "a", encoding="utf-8")
+        self._size = 0
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+def _write_stream(stream, text: str):
+    # 唯一处理编码问题的地方（原 safe_print 的多层 try/except）
+    try:
+        stream.write(text)
+    except UnicodeEncodeError:
+        buf = getattr(stream, "buffer", None)
+        if buf is not None:
+            stream.flush()
+            buf.write(text.encode("utf-8", errors="replace"))
+        else:
+            stream.write(text.encode("ascii", errors="replace").decode("ascii"))
+
+class EventLogger:
+    def __init__(self, fmt: str = LOG_FORMAT, level: str = LOG_LEVEL, file_path: str = LOG_FILE,
+                 stream=None, flush_interval: float = LOG_FLUSH_INTERVAL,
+                 max_bytes: int = LOG_MAX_BYTES, backups: int = LOG_BACKUPS):
+        self.fmt = fmt if fmt in ("compat", "json") else "compat"
+        self.min_level = LEVELS.get(level, 20)
+        self.flush_interval = flush_interval
+        # stream=None 表示写入时的 sys.stdout（worker 模式会把它换成 stderr）
+        self._stream = stream
+        self._file = RotatingFile(file_path, max_bytes, backups) if file_path else None
+        self.context: Dict[str, Any] = {"pid": os.getpid()}
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+    # ====== 记录 ======
+    def bind(self, **fields):
+        """之后所有事件都带上这些字段（如 uid、mode）"""
+        self.context.update({k: v for k, v in fields.items() if v is not None})
+
+    def event(self, name: str, level: str = "info", msg: str = "", **fields):
+        self._log(name, level, msg, "\n", False, fields)
+
+    def _log(self, name: str, level: str, msg: str, end: str, always_out: bool, fields: Dict[str, Any]):
+        if LEVELS.get(level, 20) < self.min_level:
+            return
+        record = None
+        if self.fmt == "json" or self._file is not None:
+            record = {"ts": round(time.time(), 3), "level": level, "event": name}
+            if msg:
+                record["msg"] = msg
+            record.update(self.context)
+            record.update(fields)
+        if self.fmt == "json":
+            line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+            out = line
+        else:
+            # compat：只有带文本的事件出现在stdout，文本原样输出
+            out = msg + end if msg or always_out else None
+            line = json.dumps(record, ensure_ascii=False, default=str) + "\n" if record else None
+        self._enqueue((out, line if self._file is not None else None))
+
+    def debug(self, name: str, msg: str = "", **fields):
+        self.event(name, "debug", msg, **fields)
+
+    def info(self, name: str, msg: str = "", **fields):
+        self.event(name, "info", msg, **fields)
+
+    def warning(self, name: str, msg: str = "", **fields):
+        self.event(name, "warning", msg, **fields)
+
+    def error(self, name: str, msg: str = "", **fields):
+        self.event(name, "error", msg, **fields)
+
+    # ====== 写线程 ======
+    def _enqueue(self, item):
+        if self._closed:
+            self._write_batch([item])
+            return
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+                    self._thread.start()
+        self._queue.put(item)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            # 攒一小段时间的输出一起写
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or isinstance(item, threading.Event) or item is None:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+            self._write_batch([b for b in batch if isinstance(b, tuple)])
+            for b in batch:
+                if isinstance(b, threading.Event):
+                    b.set()
+            if batch[-1] is None:
+                return
+
+    def _write_batch(self, batch):
+        stream = self._stream or sys.stdout
+        out = "".join(o for o, _ in batch if o)
+        if out and stream is not None:
+            try:
+                _write_stream(stream, out)
+                stream.flush()
+            except Exception:
+                pass
+        if self._file is not None:
+            lines = "".join(l for _, l in batch if l)
+            if lines:
+                try:
+                    self._file.write(lines)
+                    self._file.flush()
+                except Exception:
+                    pass
+
+    def flush(self, timeout: float = 5.0):
+        if self._thread is None or self._closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        if self._closed:
+            return
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+        self._closed = True
+        if self._file is not None:
+            self._file.close()
+
+    # ====== print 兼容 ======
+    def print(self, *args, sep: str = " ", end: str = "\n", file=None, flush: bool = False):
+        if file is not None and file is not sys.stdout:
+            builtins.print(*args, sep=sep, end=end, file=file, flush=flush)
+            return
+        msg = sep.join(str(a) for a in args)
+        level = "info"
+        stripped = msg.lstrip()
+        for prefix, lvl in _PREFIX_LEVELS:
+            if stripped.startswith(prefix):
+                level = lvl
+                break
+        self._log("log", level, msg, end, True, {})
+        if flush:
+            self.flush()
+
+_default_logger: Optional[EventLogger] = None
+_default_lock = threading.Lock()
+
+def get_logger() -> EventLogger:
+    global _default_logger
+    if _default_logger is None:
+        with _default_lock:
+            if _default_logger is None:
+                _default_logger = EventLogger()
+                atexit.register(_default_logger.close)
+    return _default_logger
+
+def log_event(name: str, level: str = "info", msg: str = "", **fields):
+    get_logger().event(name, level, msg, **fields)
+
+def make_print():
+    """返回与内置 print 签名相同、经由事件日志输出的函数：模块里写 print = make_print()"""
+    def _print(*args, sep=" ", end="\n", file=None, flush=False):
+        get_logger().print(*args, sep=sep, end=end, file=file, flush=flush)
+    return _print
+
+def make_input():
+    """input 的兼容版本：先把缓冲中的输出写出，保证提示信息在输入提示之前显示"""
+    def _input(prompt: str = ""):
+        get_logger().flush()
+        return builtins.input(prompt)
+    return _input
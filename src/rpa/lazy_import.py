@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+延迟导入
+firebase_admin / bs4 / selenium / undetected_chromedriver 导入很慢，
+用代理对象代替模块级 import：第一次访问属性或调用时才真正导入，
+原有写法（By.XPATH、EC.presence_of_element_located(...)、uc.Chrome(...)）不用改。
+"""
+
+import importlib
+import importlib.util
+from typing import Any, Optional
+
+class _LazyProxy:
+    __slots__ = ("_lazy_module", "_lazy_attr", "_lazy_target")
+
+    def __init__(self, module: str, attr: Optional[str] = None):
+        object.__setattr__(self, "_lazy_module", module)
+        object.__setattr__(self, "_lazy_attr", attr)
+        object.__setattr__(self, "_lazy_target", None)
+
+    def _load(self) -> Any:
+        target = object.__getattribute__(self, "_lazy_target")
+        if target is None:
+            target = importlib.import_module(object.__getattribute__(self, "_lazy_module"))
+            attr = object.__getattribute__(self, "_lazy_attr")
+            if attr:
+                target = getattr(target, attr)
+            object.__setattr__(self, "_lazy_target", target)
+        return target
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._load(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __instancecheck__(self, obj) -> bool:
+        return isinstance(obj, self._load())
+
+    def __repr__(self) -> str:
+        name = object.__getattribute__(self, "_lazy_module")
+        attr = object.__getattribute__(self, "_lazy_attr")
+        loaded = object.__getattribute__(self, "_lazy_target") is not None
+        return f"<lazy {name}{'.' + attr if attr else ''}{'' if loaded else ' (not loaded)'}>"
+
+def lazy_module(name: str) -> Any:
+    """import name 的延迟版本"""
+    return _LazyProxy(name)
+
+def lazy_attr(module: str, attr: str) -> Any:
+    """from module import attr 的延迟版本"""
+    return _LazyProxy(module, attr)
+
+def is_available(module: str) -> bool:
+    """只检查能否导入，不执行模块"""
+    return importlib.util.find_spec(module.split(".")[0]) is not None
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+IMAP 批量取信：COMPRESS=DEFLATE + 按字节预算分批、流水线化的 FETCH
+原来每封邮件一条 FETCH，积压几百封就是几百次往返，通知邮件的HTML原样传输。
+- enable_compression(box)：登录后服务器提供 COMPRESS=DEFLATE（RFC 4978，Gmail 支持）时启用，
+  之后这条连接上的收发都经过 raw deflate；HTML邮件通常压到 1/4 以下
+- iter_messages(box, ids)：先一条 FETCH (RFC822.SIZE) 拿到所有邮件的大小，按 RPA_FETCH_BYTES 字节预算分批，
+  每批一条 FETCH (BODY.PEEK[])（不会顺带标记已读），同时最多 RPA_FETCH_PIPELINE 条命令在途，
+  不等上一批的响应收完就发下一批；内存上限约为 预算 × 在途数
+- 序号 / UID 两种方式都支持（uid=True 时发 UID FETCH），产出顺序与传入的 ids 相同
+
+环境变量：
+    RPA_IMAP_COMPRESS=0   不协商压缩
+    RPA_FETCH_BYTES       每批字节预算（默认 2MB，至少一封）
+    RPA_FETCH_PIPELINE    同时在途的 FETCH 数（默认 2，1为不流水线）
+"""
+
+import os
+import re
+import zlib
+import email
+import imaplib
+from collections import deque
+from email.message import Message
+from typing import Optional, List, Dict, Iterator, Tuple
+
+from metrics import inc as metric_inc
+
+IMAP_COMPRESS = os.getenv("RPA_IMAP_COMPRESS", "1") != "0"
+FETCH_BYTES = int(os.getenv("RPA_FETCH_BYTES", str(2 * 1024 * 1024)))
+FETCH_PIPELINE = int(os.getenv("RPA_FETCH_PIPELINE", "2"))
+
+SIZE_RE = re.compile(rb"RFC822\.SIZE (\d+)")
+UID_RE = re.compile(rb"UID (\d+)")
+READ_CHUNK = 65536
+
+# ====== COMPRESS=DEFLATE ======
+class DeflateStream:
+    """替换 imaplib 连接的 read/readline/send：收发都是 raw deflate（wbits=-15），每次发送后 SYNC_FLUSH"""
+
+    def __init__(self, box: imaplib.IMAP4):
+        self.box = box
+        self.file = box.file
+        self.sock = box.sock
+        self.inflate = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.deflate = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self.buf = bytearray()
+        self.stats = {"wire_in": 0, "plain_in": 0, "wire_out": 0, "plain_out": 0}
+
+    def install(self):
+        self.box.read = self.read
+        self.box.readline = self.readline
+        self.box.send = self.send
+        self.box._deflate = self
+
+    def _fill(self):
+        # COMPRESS 的 OK 之后缓冲区里已有的字节也属于压缩流，所以从 file 读而不是直接 recv
+        chunk = self.file.read1(READ_CHUNK)
+        if not chunk:
+            raise self.box.abort("socket error: EOF")
+        data = self.inflate.decompress(chunk)
+        self.stats["wire_in"] += len(chunk)
+        self.stats["plain_in"] += len(data)
+        metric_inc("rpa_imap_bytes_total", len(chunk), direction="in", layer="wire")
+        metric_inc("rpa_imap_bytes_total", len(data), direction="in", layer="plain")
+        self.buf += data
+
+    def read(self, size: int) -> bytes:
+        while len(self.buf) < size:
+            self._fill()
+        data = bytes(self.buf[:size])
+        del self.buf[:size]
+        return data
+
+    def readline(self) -> bytes:
+        while True:
+            i = self.buf.find(b"\n")
+            if i >= 0:
+                line = bytes(self.buf[:i + 1])
+                del self.buf[:i + 1]
+                return line
+            if len(self.buf) > imaplib._MAXLINE:
+                raise self.box.error("got more than %d bytes" % imaplib._MAXLINE)
+            self._fill()
+
+    def send(self, data: bytes):
+        wire = self.deflate.compress(data) + self.deflate.flush(zlib.Z_SYNC_FLUSH)
+        self.stats["plain_out"] += len(data)
+        self.stats["wire_out"] += len(wire)
+        self.sock.sendall(wire)
+
+def _capabilities(box: imaplib.IMAP4) -> set:
+    # 登录成功的响应里通常带 [CAPABILITY ...]（Gmail 登录后才列出 COMPRESS）；没有时再问一次
+    _, data = box.response("CAPABILITY")
+    if not data or data[0] is None:
+        _, data = box.capability()
+    words = set(box.capabilities)
+    for item in data or []:
+        if item:
+            words.update((item.decode("ascii", "ignore") if isinstance(item, bytes) else str(item)).upper().split())
+    return words
+
+def enable_compression(box: imaplib.IMAP4) -> bool:
+    """登录后调用；服务器支持时启用 COMPRESS=DEFLATE，返回是否已启用"""
+    if getattr(box, "_deflate", None) is not None:
+        return True
+    if not IMAP_COMPRESS:
+        return False
+    try:
+        if "COMPRESS=DEFLATE" not in _capabilities(box):
+            return False
+        typ, _ = box.xatom("COMPRESS", "DEFLATE")
+    except imaplib.IMAP4.error:
+        return False
+    if typ != "OK":
+        return False
+    DeflateStream(box).install()
+    return True
+
+def compression_stats(box: imaplib.IMAP4) -> Optional[Dict[str, int]]:
+    stream = getattr(box, "_deflate", None)
+    return dict(stream.stats) if stream else None
+
+# ====== 按字节预算分批 + 流水线 FETCH ======
+def _key(header: bytes, uid: bool) -> Optional[bytes]:
+    if uid:
+        m = UID_RE.search(header)
+        return m.group(1) if m else None
+    return header.split()[0] if header else None
+
+def message_sizes(box: imaplib.IMAP4, ids: List[bytes], uid: bool = False) -> Dict[bytes, int]:
+    """一条 FETCH (RFC822.SIZE) 取所有邮件的大小"""
+    if uid:
+        typ, data = box.uid("FETCH", b",".join(ids), "(RFC822.SIZE)")
+    else:
+        typ, data = box.fetch(b",".join(ids), "(RFC822.SIZE)")
+    sizes = {}
+    if typ != "OK":
+        return sizes
+    for item in data or []:
+        header = item[0] if isinstance(item, tuple) else item
+        if not isinstance(header, bytes):
+            continue
+        m = SIZE_RE.search(header)
+        key = _key(header, uid)
+        if m and key:
+            sizes[key] = int(m.group(1))
+    return sizes
+
+def plan_batches(ids: List[bytes], sizes: Dict[bytes, int], byte_budget: int = FETCH_BYTES) -> List[List[bytes]]:
+    """按顺序装箱：每批总大小不超过预算，单封超预算的自成一批；大小未知的按预算的1/16估算"""
+    batches: List[List[bytes]] = []
+    current: List[bytes] = []
+    total = 0
+    for mid in ids:
+        size = sizes.get(mid, byte_budget // 16)
+        if current and total + size > byte_budget:
+            batches.append(current)
+            current, total = [], 0
+        current.append(mid)
+        total += size
+    if current:
+        batches.append(current)
+    return batches
+
+def _send_fetch(box: imaplib.IMAP4, batch: List[bytes], uid: bool) -> bytes:
+    # 只发命令不等响应（imaplib 的 _command / _command_complete 本身支持多个标签同时在途）
+    if uid:
+        return box._command("UID", "FETCH", b",".join(batch), "(BODY.PEEK[])")
+    return box._command("FETCH", b",".join(batch), "(BODY.PEEK[])")
+
+def _complete_fetch(box: imaplib.IMAP4, tag: bytes, uid: bool) -> Dict[bytes, bytes]:
+    typ, dat = box._command_complete("UID" if uid else "FETCH", tag)
+    typ, data = box._untagged_response(typ, dat, "FETCH")
+    found = {}
+    if typ != "OK":
+        return found
+    for item in data or []:
+        if isinstance(item, tuple) and len(item) > 1:
+            key = _key(item[0], uid)
+            if key:
+                found[key] = item[1]
+    return found
+
+def iter_messages(box: imaplib.IMAP4, ids: List[bytes], uid: bool = False, byte_budget: int = FETCH_BYTES,
+                  depth: int = FETCH_PIPELINE) -> Iterator[Tuple[bytes, Message]]:
+    """按 ids 顺序产出 (id, Message)；取不到的（已删除等）跳过"""
+    ids = [m if isinstance(m, bytes) else str(m).encode() for m in ids]
+    if not ids:
+        return
+    sizes = message_sizes(box, ids, uid) if len(ids) > 1 else {}
+    batches = plan_batches(ids, sizes, byte_budget)
+    pending: deque = deque()
+    sent = 0
+    try:
+        while sent < len(batches) or pending:
+            while sent < len(batches) and len(pending) < max(1, depth):
+                pending.append((batches[sent], _send_fetch(box, batches[sent], uid)))
+                sent += 1
+            batch, tag = pending.popleft()
+            found = _complete_fetch(box, tag, uid)
+            for mid in batch:
+                raw = found.pop(mid, None)
+                if raw is not None:
+                    yield mid, email.message_from_bytes(raw)
+    finally:
+        # 调用方提前停止时把在途命令的响应读完，免得混进这条连接上的下一条命令
+        while pending:
+            _, tag = pending.popleft()
+            try:
+                _complete_fetch(box, tag, uid)
+            except Exception:
+                break
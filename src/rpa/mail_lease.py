@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨进程邮件租约（防止两个RPA进程处理同一封邮件）
+网页上连点两次、重启时新旧进程重叠、send_sms_once.py 与 send_sms_firebase.py 同时跑，
+都会让两个进程取到同一封未读通知，给同一位求职者发两次短信。
+处理一封邮件之前先原子地领取它的租约（带过期时间），领不到就跳过：
+- 键：邮箱账号/文件夹 + Message-ID 的哈希（results_writer.mail_doc_id）。序号在不同连接间不稳定，
+  各脚本取到同一封邮件时算出的键相同
+- 处理期间后台线程每 TTL/3 续期；进程崩溃后租约在 RPA_LEASE_TTL 秒后过期，其他进程可以接手
+- 处理成功：租约转为 done 并保留 RPA_LEASE_DONE_TTL 秒（标记已读失败、邮件仍未读时也不会被别的进程重复处理）；
+  处理失败：立即释放，下一次轮询可由任意进程重试
+- 存储可替换（RPA_LEASE_BACKEND）：
+    sqlite（默认）   本机多进程共用 data/mail_leases.db（WAL，BEGIN IMMEDIATE 保证原子性）
+    firestore        多台主机共用同一个邮箱时用 Firestore 事务（依赖各主机时钟大致同步）
+    模块:工厂        自定义实现（例如 Redis），返回 LeaseBackend 子类实例
+- 存储出错时放行（记录警告），不因租约库故障停止发信
+
+用法：python mail_lease.py status | release <key>
+"""
+
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import hashlib
+import threading
+import importlib
+from typing import Optional, List, Dict, Any
+
+from event_log import make_print, log_event
+from metrics import inc as metric_inc
+
+print = make_print()
+
+# ====== 配置 ======
+DATA_DIR = os.getenv("RPA_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+LEASE_DB = os.getenv("MAIL_LEASE_DB", os.path.join(DATA_DIR, "mail_leases.db"))
+LEASE_ENABLED = os.getenv("RPA_LEASE", "1") != "0"
+LEASE_BACKEND = os.getenv("RPA_LEASE_BACKEND", "sqlite")
+LEASE_COLLECTION = os.getenv("LEASE_COLLECTION", "rpa_mail_leases")
+# 处理中租约的有效期（秒），持有期间自动续期
+LEASE_TTL = float(os.getenv("RPA_LEASE_TTL", "300"))
+# 处理成功后租约保留多久（秒）
+LEASE_DONE_TTL = float(os.getenv("RPA_LEASE_DONE_TTL", str(24 * 3600)))
+
+STATE_ACTIVE = "active"
+STATE_DONE = "done"
+
+def mail_key(source: Dict[str, Any], mail_id: str) -> str:
+    """source 为邮件所在邮箱的IMAP配置（IMAP_USER / IMAP_FOLDER）"""
+    user = str(source.get("IMAP_USER") or "").strip().lower()
+    # 写了多个文件夹时单文件夹模式只处理第一个（send_sms_firebase.select_folder），键与编排模式的逐文件夹键一致
+    folder = str(source.get("IMAP_FOLDER") or "INBOX").split(",")[0].strip() or "INBOX"
+    return f"{user}/{folder}/{mail_id}"
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# ====== 存储接口 ======
+class LeaseBackend:
+    """租约存储；claim 必须原子（同一时刻同一键只有一个 owner 能成功）"""
+
+    def claim(self, key: str, owner: str, ttl: float, now: float) -> bool:
+        """键无人持有、已过期或本来就属于 owner 时领取并返回True；done 状态未过期时一律返回False"""
+        raise NotImplementedError
+
+    def renew(self, keys: List[str], owner: str, ttl: float, now: float) -> List[str]:
+        """延长 owner 持有的租约，返回已经不属于 owner 的键"""
+        raise NotImplementedError
+
+    def release(self, key: str, owner: str, done: bool, done_ttl: float, now: float):
+        raise NotImplementedError
+
+    def leases(self, now: float) -> List[Dict[str, Any]]:
+        """未过期的租约（status 命令用）"""
+        return []
+
+    def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class SQLiteLeaseBackend(LeaseBackend):
+    def __init__(self, db_path: str = LEASE_DB):
+        self.db_path = db_path
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        # isolation_level=None：事务由下面显式的 BEGIN IMMEDIATE 控制
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS mail_leases (
+                key        TEXT PRIMARY KEY,
+                owner      TEXT NOT NULL,
+                state      TEXT NOT NULL,
+                claimed_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                claims     INTEGER NOT NULL DEFAULT 1
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_mail_leases_expires ON mail_leases(expires_at);
+            """
+        )
+
+    def claim(self, key: str, owner: str, ttl: float, now: float) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT owner, state, expires_at FROM mail_leases WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[2] > now and (row[1] == STATE_DONE or row[0] != owner):
+                    self._conn.execute("COMMIT")
+                    return False
+                self._conn.execute(
+                    "INSERT INTO mail_leases (key, owner, state, claimed_at, expires_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, state = excluded.state, "
+                    "claimed_at = excluded.claimed_at, expires_at = excluded.expires_at, claims = claims + 1",
+                    (key, owner, STATE_ACTIVE, now, now + ttl),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._writes += 1
+            if self._writes % 500 == 0:
+                self._conn.execute("DELETE FROM mail_leases WHERE expires_at <= ?", (now,))
+        return True
+
+    def renew(self, keys: List[str], owner: str, ttl: float, now: float) -> List[str]:
+        lost = []
+        with self._lock:
+            for key in keys:
+                updated = self._conn.execute(
+                    "UPDATE mail_leases SET expires_at = ? WHERE key = ? AND owner = ? AND state = ?",
+                    (now + ttl, key, owner, STATE_ACTIVE),
+                ).rowcount
+                if not updated:
+                    lost.append(key)
+        return lost
+
+    def release(self, key: str, owner: str, done: bool, done_ttl: float, now: float):
+        with self._lock:
+            if done:
+                self._conn.execute(
+                    "UPDATE mail_leases SET state = ?, expires_at = ? WHERE key = ? AND owner = ?",
+                    (STATE_DONE, now + done_ttl, key, owner),
+                )
+            else:
+                self._conn.execute("DELETE FROM mail_leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def leases(self, now: float) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, owner, state, claimed_at, expires_at, claims FROM mail_leases "
+                "WHERE expires_at > ? ORDER BY claimed_at", (now,)
+            ).fetchall()
+        return [{"key": r[0], "owner": r[1], "state": r[2], "claimed_at": r[3], "expires_at": r[4], "claims": r[5]}
+                for r in rows]
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("DELETE FROM mail_leases WHERE key = ?", (key,)).rowcount > 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class FirestoreLeaseBackend(LeaseBackend):
+    """rpa_mail_leases/{sha1(key)}；领取在事务内完成"""
+
+    def __init__(self, db=None, collection: str = LEASE_COLLECTION):
+        self._db = db
+        self.collection = collection
+
+    def _client(self):
+        if self._db is None:
+            from firebase_admin import firestore
+            self._db = firestore.client()
+        return self._db
+
+    def _ref(self, key: str):
+        return self._client().collection(self.collection).document(hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def claim(self, key: str, owner: str, ttl: float, now: float) -> bool:
+        from firebase_admin import firestore
+
+        ref = self._ref(key)
+
+        @firestore.transactional
+        def txn(transaction) -> bool:
+            snap = ref.get(transaction=transaction)
+            data = snap.to_dict() if snap.exists else None
+            if data and data.get("expires_at", 0) > now and (data.get("state") == STATE_DONE
+                                                              or data.get("owner") != owner):
+                return False
+            transaction.set(ref, {"key": key, "owner": owner, "state": STATE_ACTIVE, "claimed_at": now,
+                                  "expires_at": now + ttl, "claims": (data or {}).get("claims", 0) + 1})
+            return True
+
+        return txn(self._client().transaction())
+
+    def renew(self, keys: List[str], owner: str, ttl: float, now: float) -> List[str]:
+        from firebase_admin import firestore
+
+        lost = []
+        for key in keys:
+            ref = self._ref(key)
+
+            @firestore.transactional
+            def txn(transaction) -> bool:
+                snap = ref.get(transaction=transaction)
+                data = snap.to_dict() if snap.exists else None
+                if not data or data.get("owner") != owner or data.get("state") != STATE_ACTIVE:
+                    return False
+                transaction.update(ref, {"expires_at": now + ttl})
+                return True
+
+            if not txn(self._client().transaction()):
+                lost.append(key)
+        return lost
+
+    def release(self, key: str, owner: str, done: bool, done_ttl: float, now: float):
+        from firebase_admin import firestore
+
+        ref = self._ref(key)
+
+        @firestore.transactional
+        def txn(transaction):
+            snap = ref.get(transaction=transaction)
+            data = snap.to_dict() if snap.exists else None
+            if not data or data.get("owner") != owner:
+                return
+            if done:
+                transaction.update(ref, {"state": STATE_DONE, "expires_at": now + done_ttl})
+            else:
+                transaction.delete(ref)
+
+        txn(self._client().transaction())
+
+    def leases(self, now: float) -> List[Dict[str, Any]]:
+        docs = self._client().collection(self.collection).where("expires_at", ">", now).stream()
+        return sorted((d.to_dict() for d in docs), key=lambda x: x.get("claimed_at", 0))
+
+    def delete(self, key: str) -> bool:
+        ref = self._ref(key)
+        if not ref.get().exists:
+            return False
+        ref.delete()
+        return True
+
+def make_backend(spec: str = LEASE_BACKEND) -> LeaseBackend:
+    """sqlite / firestore / 模块:工厂"""
+    if spec == "sqlite":
+        return SQLiteLeaseBackend()
+    if spec == "firestore":
+        return FirestoreLeaseBackend()
+    module_name, _, attr = spec.partition(":")
+    if not attr:
+        raise ValueError(f"未知的租约存储: {spec}（可用 sqlite / firestore / 模块:工厂）")
+    return getattr(importlib.import_module(module_name), attr)()
+
+# ====== 租约管理 ======
+class LeaseManager:
+    def __init__(self, backend: Optional[LeaseBackend] = None, owner: Optional[str] = None,
+                 ttl: float = LEASE_TTL, done_ttl: float = LEASE_DONE_TTL, enabled: bool = LEASE_ENABLED):
+        self.enabled = enabled
+        self.backend = backend
+        self.owner = owner or default_owner()
+        self.ttl = ttl
+        self.done_ttl = done_ttl
+        self._held: Dict[str, float] = {}   # 键 → 领取时间
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats = {"claimed": 0, "contended": 0, "lost": 0, "errors": 0}
+
+    def _backend(self) -> LeaseBackend:
+        if self.backend is None:
+            self.backend = make_backend()
+        return self.backend
+
+    def claim(self, key: str) -> bool:
+        """领到（或存储不可用而放行）返回True；其他进程持有 / 已处理完返回False"""
+        if not self.enabled:
+            return True
+        try:
+            ok = self._backend().claim(key, self.owner, self.ttl, time.time())
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ 邮件租约领取失败，继续处理: {e}")
+            return True
+        metric_inc("rpa_mail_leases_total", result="claimed" if ok else "contended")
+        if not ok:
+            self.stats["contended"] += 1
+            return False
+        self.stats["claimed"] += 1
+        with self._lock:
+            self._held[key] = time.time()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._renew_loop, name="mail-lease", daemon=True)
+                self._thread.start()
+        return True
+
+    def release(self, key: str, done: bool):
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._held.pop(key, None) is None:
+                return
+        try:
+            self._backend().release(key, self.owner, done, self.done_ttl, time.time())
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"⚠️ 邮件租约释放失败（{self.ttl:.0f}秒后自动过期）: {e}")
+
+    def held(self) -> List[str]:
+        with self._lock:
+            return list(self._held)
+
+    def _renew_loop(self):
+        while not self._stop.wait(max(1.0, self.ttl / 3)):
+            keys = self.held()
+            if not keys:
+                continue
+            try:
+                lost = self._backend().renew(keys, self.owner, self.ttl, time.time())
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"⚠️ 邮件租约续期失败: {e}")
+                continue
+            for key in lost:
+                # 续期前已过期并被其他进程接手（例如长时间卡住）；本进程的处理不再受保护
+                self.stats["lost"] += 1
+                metric_inc("rpa_mail_leases_total", result="lost")
+                log_event("mail_lease_lost", "warning", key=key, owner=self.owner)
+                with self._lock:
+                    self._held.pop(key, None)
+
+    def close(self):
+        self._stop.set()
+        for key in self.held():
+            self.release(key, False)
+
+_default_manager: Optional[LeaseManager] = None
+_default_lock = threading.Lock()
+
+def get_lease_manager() -> LeaseManager:
+    """进程内共用一个租约管理器（同一 owner）"""
+    global _default_manager
+    with _default_lock:
+        if _default_manager is None:
+            _default_manager = LeaseManager()
+        return _default_manager
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="跨进程邮件租约")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="列出未过期的租约")
+    p_release = sub.add_parser("release", help="强制删除一条租约（持有进程已确认退出时）")
+    p_release.add_argument("key")
+    args = parser.parse_args()
+
+    backend = make_backend()
+    if args.cmd == "status":
+        now = time.time()
+        leases = backend.leases(now)
+        for lease in leases:
+            lease["expires_in_s"] = round(lease["expires_at"] - now)
+        print(json.dumps(leases, ensure_ascii=False, indent=2))
+    else:
+        print("已删除" if backend.delete(args.key) else "没有这条租约")
+
+if __name__ == "__main__":
+    main()
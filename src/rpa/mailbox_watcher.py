@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多邮箱 / 多文件夹监视（orchestrator.py 使用）
+原来每个租户只看一个账号的 INBOX，每次轮询都重新登录。有的客户把 Indeed 邮件转到别的账号或 Gmail 标签，
+只能再起一个RPA进程和浏览器。这里一个进程监视任意多个 (账号, 文件夹)：
+- 每个账号一条常驻IMAP连接、一个监视线程，同账号的多个文件夹在这条连接上轮流 EXAMINE（只读，不会误标已读）
+  —— 多加一个邮箱只多一条连接，浏览器仍由编排器的浏览器池共用
+- 检查点（SQLite）：每个文件夹记录 UIDVALIDITY 与已检查过的最大UID，平时只搜 UID 比它大的未读邮件、只取这些邮件的标题；
+  重启后从检查点继续。处理失败保持未读的邮件由每 RPA_MAILBOX_RESWEEP 秒一次的全量 UNSEEN 扫描重新交出；
+  UIDVALIDITY 变化或没有检查点时立即全量扫描
+- 健康状态：每个文件夹的最近成功时间、连续失败次数、最后错误；连续失败 RPA_MAILBOX_DOWN_AFTER 次记为 down，
+  状态变化写 mailbox_health 事件，同时持久化到检查点库（python mailbox_watcher.py status 查看）
+- 交给下游的 mid 是 UID，配套的 source 配置带 IMAP_UID=True，mark_seen 会在对应账号/文件夹上按UID标记
+
+邮箱来源（mailbox_specs）：租户配置本身的 IMAP_USER / IMAP_FOLDER（逗号分隔可写多个文件夹），
+再加上 Firebase email_config.mailboxes：
+    [{"address": "hr@example.co.jp", "app_password": "...", "folders": ["Indeed", "INBOX"], "host": "imap.gmail.com"}]
+"""
+
+import os
+import time
+import sqlite3
+import imaplib
+import threading
+from email.message import Message
+from typing import Optional, List, Dict, Any, Callable, Tuple
+
+from send_sms_firebase import imap_connect, imap_folders, select_folder, fetch_headers, subject_matches, FETCH_CHUNK
+from mail_fetch import enable_compression, iter_messages
+from event_log import make_print, log_event
+from metrics import inc as metric_inc
+from poll_scheduler import PollScheduler
+
+print = make_print()
+
+DATA_DIR = os.getenv("RPA_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+CHECKPOINT_DB = os.getenv("MAILBOX_CHECKPOINT_DB", os.path.join(DATA_DIR, "mailbox_checkpoints.db"))
+# 多久做一次全量 UNSEEN 扫描（重新交出处理失败、仍未读的邮件）
+RESWEEP_SECONDS = float(os.getenv("RPA_MAILBOX_RESWEEP", "300"))
+# 连续失败多少次记为 down
+DOWN_AFTER = int(os.getenv("RPA_MAILBOX_DOWN_AFTER", "3"))
+POLL_INTERVAL = float(os.getenv("RPA_POLL_INTERVAL", "5"))
+
+def mailbox_specs(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """租户配置 → 要监视的每个 (账号, 文件夹) 的IMAP配置（可直接交给 imap_connect / mark_seen）"""
+    base = {"IMAP_HOST": config.get("IMAP_HOST") or "imap.gmail.com", "IMAP_PORT": config.get("IMAP_PORT"),
+            "IMAP_SSL": config.get("IMAP_SSL", True), "IMAP_UID": True}
+    accounts = [(config.get("IMAP_USER", ""), config.get("IMAP_PASS", ""), None,
+                 imap_folders(config))]
+    for extra in config.get("MAILBOXES") or []:
+        folders = extra.get("folders") or extra.get("folder") or ["INBOX"]
+        accounts.append((extra.get("address", ""), extra.get("app_password", ""), extra.get("host"),
+                         [folders] if isinstance(folders, str) else list(folders)))
+    specs, seen = [], set()
+    for user, password, host, folders in accounts:
+        if not user or not password:
+            continue
+        for folder in folders:
+            spec = dict(base, IMAP_USER=user, IMAP_PASS=password, IMAP_FOLDER=folder.strip() or "INBOX")
+            if host:
+                spec["IMAP_HOST"] = host
+            if source_key(spec) not in seen:
+                seen.add(source_key(spec))
+                specs.append(spec)
+    return specs
+
+def source_key(source: Dict[str, Any]) -> str:
+    return f"{source['IMAP_USER']}@{source['IMAP_HOST']}/{source.get('IMAP_FOLDER') or 'INBOX'}"
+
+# ====== 检查点 / 健康状态（SQLite）======
+class CheckpointStore:
+    def __init__(self, db_path: str = CHECKPOINT_DB):
+        self.db_path = db_path
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS mailbox_state (
+                key TEXT PRIMARY KEY,
+                uidvalidity INTEGER NOT NULL DEFAULT 0,
+                last_uid INTEGER NOT NULL DEFAULT 0,
+                health TEXT NOT NULL DEFAULT 'unknown',
+                failures INTEGER NOT NULL DEFAULT 0,
+                last_ok_at REAL,
+                last_error TEXT,
+                polls INTEGER NOT NULL DEFAULT 0,
+                matched INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            );
+            """
+        )
+
+    def load(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            cur = self._conn.execute("SELECT * FROM mailbox_state WHERE key = ?", (key,))
+            row = cur.fetchone()
+            return dict(zip([d[0] for d in cur.description], row)) if row else {}
+
+    def save(self, key: str, **fields):
+        fields["updated_at"] = time.time()
+        cols = ", ".join(fields)
+        marks = ", ".join("?" for _ in fields)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in fields)
+        with self._lock:
+            self._conn.execute(f"INSERT INTO mailbox_state (key, {cols}) VALUES (?, {marks}) "
+                               f"ON CONFLICT(key) DO UPDATE SET {updates}", (key, *fields.values()))
+
+    def all(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            cur = self._conn.execute("SELECT * FROM mailbox_state ORDER BY key")
+            names = [d[0] for d in cur.description]
+            return [dict(zip(names, row)) for row in cur.fetchall()]
+
+    def delete(self, key: Optional[str] = None):
+        with self._lock:
+            if key:
+                self._conn.execute("DELETE FROM mailbox_state WHERE key = ?", (key,))
+            else:
+                self._conn.execute("DELETE FROM mailbox_state")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_store: Optional[CheckpointStore] = None
+_store_lock = threading.Lock()
+
+def get_checkpoint_store() -> CheckpointStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CheckpointStore()
+        return _store
+
+# ====== 单个文件夹 ======
+class WatchedFolder:
+    def __init__(self, owner: Any, source: Dict[str, Any], store: CheckpointStore):
+        self.owner = owner                # 交给回调的归属（编排器里是 Tenant）
+        self.source = source
+        self.key = source_key(source)
+        self.store = store
+        saved = store.load(self.key)
+        self.uidvalidity = int(saved.get("uidvalidity") or 0)
+        self.last_uid = int(saved.get("last_uid") or 0)
+        self.health = "unknown"
+        self.failures = 0
+        self.last_ok_at: Optional[float] = None
+        self.last_error = ""
+        self.polls = int(saved.get("polls") or 0)
+        self.matched = int(saved.get("matched") or 0)
+        # 有检查点时先只看新邮件，全量扫描按周期进行；没有时第一轮就全量扫描
+        self.swept_at: Optional[float] = time.monotonic() if self.last_uid else None
+
+    def set_health(self, ok: bool, error: str = ""):
+        self.polls += 1
+        if ok:
+            self.failures, self.last_ok_at, self.last_error = 0, time.time(), ""
+        else:
+            self.failures += 1
+            self.last_error = error[:300]
+        health = "ok" if ok else ("down" if self.failures >= DOWN_AFTER else "degraded")
+        if health != self.health:
+            log_event("mailbox_health", "info" if ok else "warning", mailbox=self.key, health=health,
+                      previous=self.health, failures=self.failures, error=self.last_error)
+            if health != "ok" or self.health != "unknown":
+                print(f"{'✅' if ok else '⚠️'} 邮箱 {self.key}: {self.health} → {health}"
+                      + (f"（{self.last_error}）" if self.last_error else ""))
+        self.health = health
+        metric_inc("rpa_mailbox_polls_total", mailbox=self.key, outcome="ok" if ok else "error")
+        self.store.save(self.key, uidvalidity=self.uidvalidity, last_uid=self.last_uid, health=health,
+                        failures=self.failures, last_ok_at=self.last_ok_at, last_error=self.last_error,
+                        polls=self.polls, matched=self.matched)
+
+    def status(self) -> Dict[str, Any]:
+        return {"health": self.health, "failures": self.failures, "last_uid": self.last_uid,
+                "last_ok_age_s": round(time.time() - self.last_ok_at) if self.last_ok_at else None,
+                "polls": self.polls, "matched": self.matched, "last_error": self.last_error}
+
+# ====== 单个账号（一条连接）======
+class AccountWatcher:
+    def __init__(self, folders: List[WatchedFolder], subject_keyword: str,
+                 on_mail: Callable[[WatchedFolder, bytes, Message], bool], poll_interval: float = POLL_INTERVAL):
+        self.folders = folders
+        self.source = folders[0].source
+        self.subject_keyword = subject_keyword
+        self.on_mail = on_mail
+        self.poller = PollScheduler(base=poll_interval)
+        self.box: Optional[imaplib.IMAP4] = None
+        self.name = f"{self.source['IMAP_USER']}@{self.source['IMAP_HOST']}"
+
+    def _connect(self):
+        self.close()
+        self.box = imap_connect(self.source)
+        try:
+            self.box.login(self.source["IMAP_USER"], self.source["IMAP_PASS"])
+        except Exception:
+            self.close()
+            raise
+        enable_compression(self.box)
+
+    def close(self):
+        if self.box is not None:
+            try:
+                self.box.logout()
+            except Exception:
+                pass
+            self.box = None
+
+    def _examine(self, folder: WatchedFolder) -> int:
+        # 打不开时 select_folder 抛 imaplib.IMAP4.error
+        select_folder(self.box, folder.source, readonly=True)
+        _, values = self.box.response("UIDVALIDITY")
+        return int(values[0]) if values and values[0] else 0
+
+    def _search(self, criteria: str) -> List[int]:
+        typ, data = self.box.uid("SEARCH", None, criteria)
+        if typ != "OK" or not data or not data[0]:
+            return []
+        return sorted(int(u) for u in data[0].split())
+
+    def poll_folder(self, folder: WatchedFolder) -> int:
+        """检查一个文件夹，把匹配标题的未读邮件交给 on_mail；返回交出的封数"""
+        uidvalidity = self._examine(folder)
+        if uidvalidity != folder.uidvalidity:
+            if folder.uidvalidity:
+                print(f"⚠️ 邮箱 {folder.key} 的 UIDVALIDITY 已变化，检查点作废并重新全量扫描")
+            folder.uidvalidity, folder.last_uid, folder.swept_at = uidvalidity, 0, None
+        full = folder.swept_at is None or time.monotonic() - folder.swept_at >= RESWEEP_SECONDS
+        if full:
+            uids = self._search("UNSEEN")
+            folder.swept_at = time.monotonic()
+        else:
+            # UID n:* 在没有更新的邮件时也会返回最后一封，所以还要再过滤一次
+            uids = [u for u in self._search(f"UNSEEN UID {folder.last_uid + 1}:*") if u > folder.last_uid]
+        handed = 0
+        for start in range(0, len(uids), FETCH_CHUNK):
+            chunk = [str(u).encode() for u in uids[start:start + FETCH_CHUNK]]
+            headers = fetch_headers(self.box, chunk, "SUBJECT", uid=True)
+            matches = [uid for uid in chunk
+                       if uid in headers and subject_matches(headers[uid].get("Subject"), self.subject_keyword)]
+            for uid, msg in iter_messages(self.box, matches, uid=True):
+                if self.on_mail(folder, uid, msg):
+                    handed += 1
+        if uids:
+            folder.last_uid = max(folder.last_uid, uids[-1])
+        folder.matched += handed
+        return handed
+
+    def poll_once(self) -> int:
+        handed = 0
+        for folder in self.folders:
+            try:
+                if self.box is None:
+                    self._connect()
+                handed += self.poll_folder(folder)
+                folder.set_health(True)
+            except (imaplib.IMAP4.abort, OSError) as e:
+                folder.set_health(False, str(e) or type(e).__name__)
+                # 连接已断开：下一个文件夹 / 下一轮重新连接
+                self.close()
+            except Exception as e:
+                # 文件夹不存在、登录被拒等：连接本身可以继续用
+                folder.set_health(False, str(e) or type(e).__name__)
+        return handed
+
+    def delay(self, handed: int) -> float:
+        delay = self.poller.observe(handed)
+        failures = min(f.failures for f in self.folders)
+        # 所有文件夹都在失败时退避，最长10倍
+        return delay * min(10, 2 ** failures if failures else 1)
+
+# ====== 监视器 ======
+class MailboxWatcher:
+    """
+    watcher = MailboxWatcher([(tenant, source), ...], keyword, on_mail).start()
+    on_mail(folder, uid, msg) 返回是否接收（已在处理中的返回 False）；folder.owner / folder.source 标明来源
+    """
+
+    def __init__(self, sources: List[Tuple[Any, Dict[str, Any]]], subject_keyword: str,
+                 on_mail: Callable[[WatchedFolder, bytes, Message], bool], poll_interval: float = POLL_INTERVAL,
+                 store: Optional[CheckpointStore] = None):
+        self.store = store or get_checkpoint_store()
+        accounts: Dict[Tuple, List[WatchedFolder]] = {}
+        for owner, source in sources:
+            account = (source["IMAP_HOST"], source.get("IMAP_PORT"), source["IMAP_USER"])
+            accounts.setdefault(account, []).append(WatchedFolder(owner, source, self.store))
+        self.accounts = [AccountWatcher(folders, subject_keyword, on_mail, poll_interval)
+                         for folders in accounts.values()]
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def folders(self) -> List[WatchedFolder]:
+        return [f for a in self.accounts for f in a.folders]
+
+    def _run(self, account: AccountWatcher):
+        try:
+            while not self._stop.is_set():
+                handed = account.poll_once()
+                if handed:
+                    print(f"📧 [{account.name}] 检测到{handed}封新未读邮件 | {account.poller.describe()}")
+                self._stop.wait(account.delay(handed))
+        finally:
+            account.close()
+
+    def start(self) -> "MailboxWatcher":
+        for account in self.accounts:
+            t = threading.Thread(target=self._run, args=(account,), name=f"mailbox-{account.name}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+
+    def status(self) -> Dict[str, Any]:
+        return {f.key: f.status() for f in self.folders}
+
+# ====== 命令行 ======
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="多邮箱监视：检查点与健康状态")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="列出各邮箱/文件夹的检查点与健康状态")
+    p_reset = sub.add_parser("reset", help="删除检查点（下次启动全量扫描）")
+    p_reset.add_argument("key", nargs="?", help="user@host/folder，省略则全部删除")
+    args = parser.parse_args()
+
+    store = get_checkpoint_store()
+    if args.cmd == "status":
+        rows = store.all()
+        if not rows:
+            print("（没有检查点）")
+        for r in rows:
+            ok_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r["last_ok_at"])) if r["last_ok_at"] else "-"
+            print(f"{r['key']}: {r['health']} | 最后成功 {ok_at} | 连续失败 {r['failures']} | "
+                  f"UIDVALIDITY {r['uidvalidity']} 检查点UID {r['last_uid']} | 轮询 {r['polls']} 交出 {r['matched']}"
+                  + (f" | 错误: {r['last_error']}" if r["last_error"] else ""))
+    else:
+        store.delete(args.key)
+        print("✅ 已删除检查点")
+
+if __name__ == "__main__":
+    main()
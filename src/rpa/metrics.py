@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分阶段耗时指标
+- 计数器与延迟直方图，标签为 stage（imap_fetch / mime_parse / site_login / phone_extract / sms_api）
+- @timed(stage) 包住各阶段函数，记录调用次数、异常次数和耗时；生成器用 @timed_iter(stage)
+- 导出：
+  RPA_METRICS_PORT>0 时提供 Prometheus 文本格式 GET /metrics（另有 GET /metrics.json）
+  JSON 快照每 RPA_METRICS_INTERVAL 秒原子重写到 data/metrics/<名称>.json，供 rpa_server.js 读取
+"""
+
+import os
+import json
+import time
+import bisect
+import functools
+import threading
+from typing import Optional, Dict, Any, Tuple, List
+
+DATA_DIR = os.getenv("RPA_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+METRICS_DIR = os.getenv("RPA_METRICS_DIR", os.path.join(DATA_DIR, "metrics"))
+METRICS_PORT = int(os.getenv("RPA_METRICS_PORT", "0"))
+METRICS_INTERVAL = float(os.getenv("RPA_METRICS_INTERVAL", "10"))
+METRICS_ENABLED = os.getenv("RPA_METRICS", "1") != "0"
+
+# 秒；覆盖从MIME解析（毫秒级）到登录+页面加载（数十秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    inner = ",".join(f'{k}="{_escape(v)}"' for k, v in items)
+    return "{" + inner + "}"
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count", "max")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """按桶线性插值的近似分位数"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, c in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if c and seen + c >= rank:
+                return min(self.max, lower + (upper - lower) * (rank - seen) / c)
+            seen += c
+            lower = upper
+        return self.max
+
+class MetricsRegistry:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self.started_at = time.time()
+
+    def describe(self, name: str, text: str):
+        self._help[name] = text
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(self.buckets)
+            hist.observe(value)
+
+    # ====== 导出 ======
+    def prometheus_text(self) -> str:
+        out: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    out.append(f"# HELP {name} {self._help[name]}")
+                out.append(f"# TYPE {name} counter")
+                for key, v in sorted(series.items()):
+                    out.append(f"{name}{_fmt_labels(key)} {v:g}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    out.append(f"# HELP {name} {self._help[name]}")
+                out.append(f"# TYPE {name} histogram")
+                for key, h in sorted(series.items()):
+                    cumulative = 0
+                    for i, c in enumerate(h.counts):
+                        cumulative += c
+                        le = f"{h.buckets[i]:g}" if i < len(h.buckets) else "+Inf"
+                        out.append(f"{name}_bucket{_fmt_labels(key, ('le', le))} {cumulative}")
+                    out.append(f"{name}_sum{_fmt_labels(key)} {h.sum:.6f}")
+                    out.append(f"{name}_count{_fmt_labels(key)} {h.count}")
+        return "\n".join(out) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = {name: [dict(key, value=v) for key, v in sorted(series.items())]
+                        for name, series in self._counters.items()}
+            histograms = {}
+            for name, series in self._histograms.items():
+                histograms[name] = [dict(key, count=h.count, sum=round(h.sum, 6), max=round(h.max, 6),
+                                         p50=round(h.quantile(0.5), 6), p95=round(h.quantile(0.95), 6),
+                                         p99=round(h.quantile(0.99), 6))
+                                    for key, h in sorted(series.items())]
+        return {"pid": os.getpid(), "started_at": self.started_at, "updated_at": time.time(),
+                "counters": counters, "histograms": histograms}
+
+    def write_snapshot(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+_registry = MetricsRegistry()
+_registry.describe("rpa_stage_calls_total", "Calls per RPA stage by outcome")
+_registry.describe("rpa_stage_duration_seconds", "Latency per RPA stage")
+_registry.describe("rpa_sms_responses_total", "SMS API responses by HTTP status")
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+def inc(name: str, value: float = 1.0, **labels):
+    if METRICS_ENABLED:
+        _registry.inc(name, value, **labels)
+
+def timed(stage: str):
+    """记录阶段调用次数（ok/error）与耗时；RPA_METRICS=0 时直接返回原函数"""
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            outcome = "error"
+            t0 = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                elapsed = time.perf_counter() - t0
+                _registry.inc("rpa_stage_calls_total", stage=stage, outcome=outcome)
+                _registry.observe("rpa_stage_duration_seconds", elapsed, stage=stage)
+        return wrapper
+    return decorator
+
+def timed_iter(stage: str):
+    """
+    生成器版 @timed：一次迭代（到耗尽或被关闭）记一次，
+    只计生成器内部的耗时，调用方处理每一项的时间不算在内
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            outcome = "error"
+            elapsed = 0.0
+            gen = func(*args, **kwargs)
+            try:
+                while True:
+                    t0 = time.perf_counter()
+                    try:
+                        item = next(gen)
+                    except StopIteration:
+                        outcome = "ok"
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - t0
+                    try:
+                        yield item
+                    except GeneratorExit:
+                        # 调用方提前停止迭代（如单次模式处理完就退出）不算异常
+                        outcome = "ok"
+                        raise
+            finally:
+                gen.close()
+                _registry.inc("rpa_stage_calls_total", stage=stage, outcome=outcome)
+                _registry.observe("rpa_stage_duration_seconds", elapsed, stage=stage)
+        return wrapper
+    return decorator
+
+# ====== 导出服务 ======
+def serve_metrics(host: str = "127.0.0.1", port: int = METRICS_PORT, registry: Optional[MetricsRegistry] = None):
+    """后台线程提供 /metrics（Prometheus文本）与 /metrics.json"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    registry = registry or _registry
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].rstrip("/")
+            if path == "/metrics":
+                body, ctype = registry.prometheus_text(), "text/plain; version=0.0.4; charset=utf-8"
+            elif path == "/metrics.json":
+                body, ctype = json.dumps(registry.snapshot(), ensure_ascii=False), "application/json"
+            else:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
+
+def snapshot_path(name: str) -> str:
+    safe = "".join(c for c in name if c.isalnum() or c in "-_") or str(os.getpid())
+    return os.path.join(METRICS_DIR, f"{safe}.json")
+
+class _SnapshotWriter:
+    def __init__(self, path: str, interval: float, registry: MetricsRegistry):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, name="metrics-snapshot", daemon=True).start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            self.registry.write_snapshot(self.path)
+        except OSError as e:
+            print(f"⚠️ 写入指标快照失败: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self.write()
+
+_exporters_started = False
+
+def start_exporters(name: str, port: int = METRICS_PORT, interval: float = METRICS_INTERVAL):
+    """按环境变量启动导出（幂等）：JSON快照默认开启，HTTP端口需显式设置"""
+    global _exporters_started
+    if _exporters_started or not METRICS_ENABLED:
+        return
+    _exporters_started = True
+    if port > 0:
+        try:
+            serve_metrics(port=port)
+            print(f"📈 指标服务: http://127.0.0.1:{port}/metrics")
+        except OSError as e:
+            print(f"⚠️ 指标服务启动失败（端口{port}）: {e}")
+    if interval > 0:
+        import atexit
+        writer = _SnapshotWriter(snapshot_path(name), interval, _registry)
+        atexit.register(writer.stop)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地SMS API模拟服务（sms-console.jp 替身）
+- 与真实API相同：POST application/x-www-form-urlencoded + Basic认证，
+  字段 mobilenumber / smstext / status / smsid，响应体为状态码文本
+- 可脚本化返回 sms_codes.SMS_CODE_MAP 中的任意状态码，可配置延迟、错误率、限流
+- 另提供 /status（送达状态查询，供 delivery_report.py 轮询）和 /__stats（调用统计）
+
+用法：
+    python mock_sms_server.py --port 8099 --latency-ms 50 --error-rate 0.05
+    SMS_API_URL=http://127.0.0.1:8099/api/ python send_sms_once.py
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import threading
+from typing import Optional, List, Dict, Any
+from urllib.parse import parse_qs, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sms_codes import SMS_CODE_MAP
+from phone_batch import normalize_one, STATUS_OK, STATUS_UNCLASSIFIED
+
+class MockBehavior:
+    """模拟服务的行为配置，运行中可直接修改属性"""
+
+    def __init__(self, api_id: str = "", api_password: str = "",
+                 script: Optional[List[int]] = None, loop_script: bool = False,
+                 latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, error_codes: Optional[List[int]] = None,
+                 rate_per_sec: float = 0.0, burst: int = 1, rate_limit_code: int = 503,
+                 validate_numbers: bool = True, report_url: str = "",
+                 delivered_ratio: float = 1.0, seed: Optional[int] = None):
+        self.api_id = api_id                  # 为空时接受任意认证
+        self.api_password = api_password
+        self.script = list(script or [])      # 依次返回的状态码
+        self.loop_script = loop_script
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes or [503])
+        self.rate_per_sec = rate_per_sec      # 0 为不限流
+        self.burst = max(1, burst)
+        self.rate_limit_code = rate_limit_code
+        self.validate_numbers = validate_numbers
+        self.report_url = report_url          # 设置后异步回调送达状态
+        self.delivered_ratio = delivered_ratio
+        self.rng = random.Random(seed)
+
+class MockSMSState:
+    def __init__(self, behavior: MockBehavior):
+        self.behavior = behavior
+        self.lock = threading.Lock()
+        self.requests: List[Dict[str, Any]] = []
+        self.code_counts: Dict[int, int] = {}
+        self.statuses: Dict[str, str] = {}
+        self._script_pos = 0
+        self._tokens = float(behavior.burst)
+        self._last_refill = time.monotonic()
+
+    def _take_token(self) -> bool:
+        b = self.behavior
+        if b.rate_per_sec <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(float(b.burst), self._tokens + (now - self._last_refill) * b.rate_per_sec)
+        self._last_refill = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+    def decide(self, authorized: bool, fields: Dict[str, str]) -> int:
+        b = self.behavior
+        with self.lock:
+            if not authorized:
+                return 401
+            if not self._take_token():
+                return b.rate_limit_code
+            scripted = None
+            if b.script:
+                if self._script_pos < len(b.script):
+                    scripted = b.script[self._script_pos]
+                    self._script_pos += 1
+                    if b.loop_script and self._script_pos >= len(b.script):
+                        self._script_pos = 0
+                    if scripted != 200:
+                        return scripted
+            if scripted is None and b.error_rate and b.rng.random() < b.error_rate:
+                return b.rng.choice(b.error_codes)
+            rng_delivered = b.rng.random() < b.delivered_ratio
+        if scripted is None:
+            if b.validate_numbers:
+                status, _, _ = normalize_one(fields.get("mobilenumber", ""))
+                if status not in (STATUS_OK, STATUS_UNCLASSIFIED):
+                    return 560
+            if not fields.get("smstext"):
+                return 585
+        # 脚本指定的200也和正常路径一样登记 smsid（重复时624），/status 与送达回调才查得到
+        smsid = fields.get("smsid")
+        if smsid:
+            with self.lock:
+                if smsid in self.statuses:
+                    return 624
+                self.statuses[smsid] = "delivered" if rng_delivered else "failed"
+        return 200
+
+    def record(self, fields: Dict[str, str], code: int):
+        with self.lock:
+            self.requests.append({"t": time.time(), "code": code,
+                                  "mobilenumber": fields.get("mobilenumber"),
+                                  "smsid": fields.get("smsid")})
+            self.code_counts[code] = self.code_counts.get(code, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"total": len(self.requests),
+                    "codes": {str(k): v for k, v in sorted(self.code_counts.items())}}
+
+def _push_report(url: str, smsid: str, status: str):
+    try:
+        import requests
+        requests.post(url, data={"smsid": smsid, "status": status}, timeout=5)
+    except Exception as e:
+        print(f"⚠️ 送达回调失败 {smsid}: {e}")
+
+def make_handler(state: MockSMSState):
+    class MockSMSHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _reply(self, code: int, body: str, ctype: str = "text/plain; charset=utf-8"):
+            data = body.encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _authorized(self) -> bool:
+            b = state.behavior
+            if not b.api_id:
+                return self.headers.get("Authorization", "").startswith("Basic ")
+            expected = base64.b64encode(f"{b.api_id}:{b.api_password}".encode("utf-8")).decode("utf-8")
+            return self.headers.get("Authorization", "") == f"Basic {expected}"
+
+        def _read_form(self) -> Dict[str, str]:
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length).decode("utf-8", errors="replace")
+            return {k: v[0] for k, v in parse_qs(raw, keep_blank_values=True).items()}
+
+        def do_GET(self):
+            path = urlparse(self.path).path.rstrip("/")
+            if path == "/__stats":
+                self._reply(200, json.dumps(state.stats()), "application/json")
+                return
+            # 真实API只接受POST
+            self._reply(405, "405")
+
+        def do_POST(self):
+            path = urlparse(self.path).path.rstrip("/")
+            fields = self._read_form()
+            if path == "/status":
+                if not self._authorized():
+                    self._reply(401, "401")
+                    return
+                status = state.statuses.get(fields.get("smsid", ""))
+                if status is None:
+                    self._reply(574, "574")
+                    return
+                self._reply(200, f"smsid={fields['smsid']}&status={status}")
+                return
+
+            b = state.behavior
+            if b.latency_ms or b.jitter_ms:
+                time.sleep(max(0.0, b.latency_ms + b.rng.uniform(-b.jitter_ms, b.jitter_ms)) / 1000.0)
+            code = state.decide(self._authorized(), fields)
+            state.record(fields, code)
+            smsid = fields.get("smsid")
+            status = state.statuses.get(smsid) if smsid else None
+            if code == 200 and status and b.report_url:
+                threading.Thread(target=_push_report, daemon=True,
+                                 args=(b.report_url, smsid, status)).start()
+            self._reply(code, str(code))
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockSMSHandler
+
+class MockSMSServer:
+    """进程内启动：server = MockSMSServer(MockBehavior(...)).start(); server.url"""
+
+    def __init__(self, behavior: Optional[MockBehavior] = None, host: str = "127.0.0.1", port: int = 0):
+        self.state = MockSMSState(behavior or MockBehavior())
+        self._httpd = ThreadingHTTPServer((host, port), make_handler(self.state))
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/api/"
+
+    @property
+    def status_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/status"
+
+    def start(self) -> "MockSMSServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-sms-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def _int_list(value: str) -> List[int]:
+    return [int(x) for x in value.split(",") if x.strip()]
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地SMS API模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOCK_SMS_PORT", "8099")))
+    parser.add_argument("--api-id", default=os.getenv("SMS_API_ID", ""), help="为空时接受任意Basic认证")
+    parser.add_argument("--api-password", default=os.getenv("SMS_API_PASSWORD", ""))
+    parser.add_argument("--script", type=_int_list, default=[], help="依次返回的状态码，如 200,503,200")
+    parser.add_argument("--loop-script", action="store_true")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-codes", type=_int_list, default=[503])
+    parser.add_argument("--rate", type=float, default=0.0, help="每秒允许的请求数，0为不限")
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--rate-limit-code", type=int, default=503)
+    parser.add_argument("--report-url", default="", help="送达状态回调地址（delivery_report.py serve）")
+    parser.add_argument("--delivered-ratio", type=float, default=1.0)
+    args = parser.parse_args()
+
+    for code in args.script + args.error_codes + [args.rate_limit_code]:
+        if code not in SMS_CODE_MAP:
+            print(f"未知状态码：{code}")
+            sys.exit(1)
+
+    behavior = MockBehavior(
+        api_id=args.api_id, api_password=args.api_password,
+        script=args.script, loop_script=args.loop_script,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, error_codes=args.error_codes,
+        rate_per_sec=args.rate, burst=args.burst, rate_limit_code=args.rate_limit_code,
+        report_url=args.report_url, delivered_ratio=args.delivered_ratio,
+    )
+    server = MockSMSServer(behavior, args.host, args.port).start()
+    print(f"📡 模拟SMS API已启动: {server.url}")
+    print(f"   设置 SMS_API_URL={server.url} 即可让发送脚本改连本地")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"[{time.strftime('%H:%M:%S')}] {json.dumps(server.state.stats())}")
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
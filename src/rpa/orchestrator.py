@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多租户RPA编排（单进程）
+原来每个用户UID由 rpa_server.js 各起一个 send_sms_firebase.py 进程，各自一个Chrome、一个IMAP轮询循环。
+这里在一个进程内托管多个租户：
+- 邮箱监视交给 mailbox_watcher.py：每个账号一条常驻IMAP连接，一个租户可以有多个账号/文件夹，
+  新邮件连同来源邮箱一起放入该租户的队列
+- 浏览器池：全局最多 RPA_BROWSER_POOL 个Chrome，按租户使用各自的 profile 目录（chrome_user_data/<uid>），
+  空闲超时即关闭；池满时回收最久未用的其他租户的空闲浏览器
+- 公平调度：按租户轮转取任务，同一租户同时最多一个任务在处理（同一 profile 不能被两个Chrome同时打开）
+- 空闲的浏览器由 session_keepalive.py 在后台保持站点登录状态，会话过期时提前重新登录
+- 入队前邮件即解析成 MailRecord（mail_record.py），队列里不保留原始邮件
+内存随正在处理的任务数增长，而不是随租户数增长。
+
+用法：python orchestrator.py uid1 uid2 ...   或   RPA_TENANTS=uid1,uid2 python orchestrator.py
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import deque, OrderedDict
+from typing import Optional, List, Dict, Any, Tuple
+
+from send_sms_firebase import FirebaseConfig, get_config_from_firebase, make_driver, parse_mail, process_record
+from mailbox_watcher import MailboxWatcher, mailbox_specs
+from mail_record import MailRecord
+from session_keepalive import SessionKeeper
+from sms_template import compile_templates
+from event_log import make_print, log_event
+from metrics import start_exporters
+
+print = make_print()
+
+PROFILE_ROOT = os.getenv("RPA_PROFILE_ROOT", "chrome_user_data")
+BROWSER_POOL_SIZE = int(os.getenv("RPA_BROWSER_POOL", "2"))
+# 浏览器空闲多久后关闭（秒）
+BROWSER_IDLE_SECONDS = float(os.getenv("RPA_BROWSER_IDLE", "300"))
+POLL_INTERVAL = float(os.getenv("RPA_POLL_INTERVAL", "5"))
+SUBJECT_KEYWORD = "【新しい応募者のお知らせ】"
+
+def profile_dir(uid: str) -> str:
+    safe = "".join(c for c in uid if c.isalnum() or c in "-_")
+    return os.path.join(PROFILE_ROOT, safe)
+
+# ====== 租户 ======
+class Tenant:
+    def __init__(self, uid: str, config: Dict[str, Any]):
+        self.uid = uid
+        self.config = config
+        self.templates = compile_templates({"A": config["SMS_TEXT_A"], "B": config["SMS_TEXT_B"]})
+        self.sources = mailbox_specs(config)
+        self.queue: deque = deque()
+        self.queued_mids = set()
+        self.processed_mids = set()
+        self.busy = False
+        self.stats = {"queued": 0, "ok": 0, "failed": 0}
+
+    def __repr__(self):
+        return f"Tenant({self.uid!r}, queued={len(self.queue)}, busy={self.busy})"
+
+def load_tenant(uid: str) -> Optional[Tenant]:
+    """读取租户配置并校验，不完整时返回 None"""
+    fc = FirebaseConfig()
+    if not fc.initialize_firebase(uid):
+        return None
+    config = get_config_from_firebase(fc)
+    if not config["IMAP_USER"] or not config["IMAP_PASS"]:
+        print(f"❌ [{uid}] 邮箱配置不完整，跳过该租户")
+        return None
+    if not config["SMS_API_ID"] or not config["SMS_API_PASSWORD"]:
+        print(f"❌ [{uid}] SMS配置不完整，跳过该租户")
+        return None
+    return Tenant(uid, config)
+
+# ====== 浏览器池 ======
+class BrowserPool:
+    """全局限量的Chrome池；每个租户最多保留一个空闲浏览器"""
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, idle_seconds: float = BROWSER_IDLE_SECONDS,
+                 factory=None, on_close=None):
+        self.size = max(1, size)
+        self.idle_seconds = idle_seconds
+        self.factory = factory or (lambda uid: make_driver(profile_dir(uid)))
+        self.on_close = on_close
+        self._cond = threading.Condition()
+        # uid -> (driver, 最近使用时间)，按最近使用排序
+        self._idle: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._total = 0
+        self.created = 0
+        self.evicted = 0
+
+    def acquire(self, uid: str):
+        victim = None
+        with self._cond:
+            while True:
+                if uid in self._idle:
+                    return self._idle.pop(uid)[0]
+                if self._total < self.size:
+                    self._total += 1
+                    break
+                if self._idle:
+                    # 池满：回收最久未用的其他租户浏览器，名额转给当前租户
+                    _, (victim, _) = self._idle.popitem(last=False)
+                    self.evicted += 1
+                    break
+                self._cond.wait()
+        if victim is not None:
+            self._close(victim)
+        try:
+            driver = self.factory(uid)
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+        self.created += 1
+        return driver
+
+    def release(self, uid: str, driver, broken: bool = False):
+        if broken:
+            self._close(driver)
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            old = self._idle.pop(uid, None)
+            self._idle[uid] = (driver, time.monotonic())
+            if old is not None:
+                self._total -= 1
+            self._cond.notify()
+        if old is not None:
+            self._close(old[0])
+
+    def reap_idle(self) -> int:
+        """关闭空闲超时的浏览器，返回关闭数"""
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            for uid, (driver, last_used) in list(self._idle.items()):
+                if now - last_used > self.idle_seconds:
+                    del self._idle[uid]
+                    self._total -= 1
+                    expired.append(driver)
+            if expired:
+                self._cond.notify_all()
+        for driver in expired:
+            self._close(driver)
+        return len(expired)
+
+    def close_all(self):
+        with self._cond:
+            drivers = [d for d, _ in self._idle.values()]
+            self._total -= len(drivers)
+            self._idle.clear()
+        for driver in drivers:
+            self._close(driver)
+
+    def _close(self, driver):
+        if self.on_close is not None:
+            self.on_close(driver)
+        _quit(driver)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"open": self._total, "idle": len(self._idle), "size": self.size,
+                    "created": self.created, "evicted": self.evicted}
+
+def _quit(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+# ====== 公平调度 ======
+class FairScheduler:
+    """按租户轮转出队；同一租户同时只发出一个任务"""
+
+    def __init__(self, tenants: List[Tenant]):
+        self.tenants = list(tenants)
+        self._cond = threading.Condition()
+        self._next = 0
+
+    def known(self, tenant: Tenant, key) -> bool:
+        """已在队列中或已处理过"""
+        with self._cond:
+            return key in tenant.queued_mids or key in tenant.processed_mids
+
+    def submit(self, tenant: Tenant, record: MailRecord, config: Optional[Dict[str, Any]] = None, key=None) -> bool:
+        """key 区分不同邮箱里相同的 mid（默认就是 record.mid）；config 为处理这封邮件用的配置（默认租户配置）"""
+        key = key if key is not None else record.mid
+        with self._cond:
+            if key in tenant.queued_mids or key in tenant.processed_mids:
+                return False
+            tenant.queued_mids.add(key)
+            tenant.queue.append((key, record, config or tenant.config))
+            tenant.stats["queued"] += 1
+            self._cond.notify()
+            return True
+
+    def next_job(self, timeout: float = 1.0) -> Optional[Tuple[Tenant, Any, MailRecord, Dict[str, Any]]]:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                n = len(self.tenants)
+                for i in range(n):
+                    tenant = self.tenants[(self._next + i) % n]
+                    if tenant.queue and not tenant.busy:
+                        self._next = (self._next + i + 1) % n
+                        tenant.busy = True
+                        return (tenant, *tenant.queue.popleft())
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def done(self, tenant: Tenant, key, ok: bool):
+        with self._cond:
+            tenant.busy = False
+            tenant.queued_mids.discard(key)
+            if ok:
+                # 失败的邮件保持未读，下次全量扫描时会重新入队（与循环模式一致）
+                tenant.processed_mids.add(key)
+                tenant.stats["ok"] += 1
+            else:
+                tenant.stats["failed"] += 1
+            self._cond.notify_all()
+
+# ====== 编排器 ======
+class Orchestrator:
+    def __init__(self, tenants: List[Tenant], pool_size: int = BROWSER_POOL_SIZE,
+                 poll_interval: float = POLL_INTERVAL, subject_keyword: str = SUBJECT_KEYWORD):
+        self.tenants = tenants
+        self.poll_interval = poll_interval
+        self.subject_keyword = subject_keyword
+        # 空闲浏览器在后台保持站点登录状态（session_keepalive.py）
+        self.keeper = SessionKeeper()
+        self.pool = BrowserPool(pool_size, factory=self._make_driver, on_close=self.keeper.unwatch)
+        self.scheduler = FairScheduler(tenants)
+        # 每个账号独立的自适应间隔；抖动使各账号的IMAP请求错开
+        self.watcher = MailboxWatcher([(t, source) for t in tenants for source in t.sources],
+                                      subject_keyword, self._on_mail, poll_interval)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def _make_driver(self, uid: str):
+        driver = make_driver(profile_dir(uid))
+        tenant = next(t for t in self.tenants if t.uid == uid)
+        self.keeper.watch(driver, tenant.config)
+        return driver
+
+    def _on_mail(self, folder, uid, msg) -> bool:
+        # 已读标记要落在邮件所在的账号/文件夹上（mark_seen 读 MAIL_SOURCE）
+        tenant = folder.owner
+        key = (folder.key, uid)
+        if self.scheduler.known(tenant, key):
+            return False
+        config = dict(tenant.config, MAIL_SOURCE=folder.source)
+        return self.scheduler.submit(tenant, parse_mail(uid, msg), config, key=key)
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self.scheduler.next_job(timeout=1.0)
+            if job is None:
+                continue
+            tenant, key, record, config = job
+            ok = False
+            try:
+                driver = self.pool.acquire(tenant.uid)
+            except Exception as e:
+                print(f"❌ [{tenant.uid}] 浏览器启动失败: {e}")
+                self.scheduler.done(tenant, key, False)
+                continue
+            broken = False
+            try:
+                with self.keeper.using(driver):
+                    ok = process_record(driver, record, config, tenant.templates)
+            except Exception as e:
+                broken = True
+                print(f"❌ [{tenant.uid}] 处理邮件异常: {e}")
+            finally:
+                self.pool.release(tenant.uid, driver, broken=broken)
+                self.scheduler.done(tenant, key, ok)
+
+    def start(self) -> "Orchestrator":
+        self.watcher.start()
+        self.keeper.start()
+        for i in range(self.pool.size):
+            t = threading.Thread(target=self._work, name=f"rpa-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self, timeout: float = 30.0):
+        self._stop.set()
+        self.watcher.stop()
+        self.keeper.stop()
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        self.pool.close_all()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pool": self.pool.stats(),
+            "keepalive": self.keeper.stats(),
+            "tenants": {t.uid: dict(t.stats, pending=len(t.queue), busy=t.busy) for t in self.tenants},
+            "mailboxes": self.watcher.status(),
+        }
+
+    def run_forever(self, status_every: float = 60.0):
+        start_exporters("orchestrator")
+        self.start()
+        last = time.monotonic()
+        try:
+            while True:
+                time.sleep(5)
+                closed = self.pool.reap_idle()
+                if closed:
+                    print(f"🧹 关闭空闲浏览器 {closed} 个")
+                if time.monotonic() - last >= status_every:
+                    last = time.monotonic()
+                    pool = self.pool.stats()
+                    pending = sum(len(t.queue) for t in self.tenants)
+                    folders = self.watcher.folders
+                    healthy = sum(1 for f in folders if f.health == "ok")
+                    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 租户:{len(self.tenants)} | "
+                          f"邮箱:{healthy}/{len(folders)}正常 | 浏览器:{pool['open']}/{pool['size']} | 待处理:{pending}")
+                    log_event("orchestrator_status", **self.status())
+        except KeyboardInterrupt:
+            print("\n已手动退出编排模式。")
+        finally:
+            self.stop()
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="多租户RPA编排（单进程）")
+    parser.add_argument("uids", nargs="*", help="租户UID，缺省读取环境变量 RPA_TENANTS（逗号分隔）")
+    parser.add_argument("--pool", type=int, default=BROWSER_POOL_SIZE, help="浏览器池大小")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="邮箱轮询间隔秒数")
+    args = parser.parse_args()
+
+    uids = args.uids or [u.strip() for u in os.getenv("RPA_TENANTS", "").split(",") if u.strip()]
+    if not uids:
+        print("❌ 未指定租户UID")
+        sys.exit(1)
+
+    tenants = [t for t in (load_tenant(uid) for uid in dict.fromkeys(uids)) if t]
+    if not tenants:
+        print("❌ 没有可用的租户，程序退出")
+        sys.exit(1)
+    print(f"✅ 已加载 {len(tenants)}/{len(uids)} 个租户（{sum(len(t.sources) for t in tenants)} 个邮箱/文件夹），"
+          f"浏览器池大小 {args.pool}")
+    Orchestrator(tenants, pool_size=args.pool, poll_interval=args.interval).run_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+手机号批量规范化与校验
+与 send_sms 的单号逻辑（only_digits → classify_number → 81/0 转换）结果一致，但：
+- 整列一次处理：整列一次 bytes.translate 清洗，分类/转换在定长 uint8 矩阵上用 NumPy 向量化完成
+- 每行返回状态码，不抛异常（send_sms 遇到坏号码会 SystemExit 整个进程）
+- 没装 NumPy 时退回纯Python路径（单条正则完成分类）
+"""
+
+import re
+from typing import Optional, List, Sequence, Tuple, Any
+
+# NumPy 是可选依赖，且导入较慢：第一次批量处理时才加载
+_np = None
+
+def numpy_or_none():
+    global _np
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = False
+    return _np or None
+
+# ====== 状态码 ======
+STATUS_OK = 0            # 可发送，且是已知手机号段（PAT_11 / PAT_81）
+STATUS_UNCLASSIFIED = 1  # send_sms 会发送，但不在已知手机号段内
+STATUS_EMPTY = 2         # 没有任何数字
+STATUS_BAD_FORMAT = 3    # send_sms 会拒绝的长度/前缀
+
+STATUS_NAMES = {
+    STATUS_OK: "ok",
+    STATUS_UNCLASSIFIED: "unclassified",
+    STATUS_EMPTY: "empty",
+    STATUS_BAD_FORMAT: "bad_format",
+}
+
+# 全角数字 → 半角（\D 在Python中把全角数字也当数字保留，这里统一成ASCII）
+_FULLWIDTH = str.maketrans("０１２３４５６７８９", "0123456789")
+_NON_DIGIT_RE = re.compile(r"[^0-9]")
+# PAT_11 / PAT_14 / PAT_81 合并为一条正则，lastindex 即分类
+_CLASSIFY_RE = re.compile(
+    r"(0(?:20[1-9]|60[1-9]|70[1-9]|80[1-9]|90[1-9])\d{7})"
+    r"|(0(?:200|600|700|800|900)\d{10})"
+    r"|(81(?:70|80|90)\d{8})"
+)
+_KINDS = (None, "11", "14", "81")
+
+def clean(phone: Any) -> str:
+    s = str(phone)
+    if not s.isascii():
+        s = s.translate(_FULLWIDTH)
+    return _NON_DIGIT_RE.sub("", s)
+
+def classify(digits: str) -> Optional[str]:
+    m = _CLASSIFY_RE.fullmatch(digits)
+    return _KINDS[m.lastindex] if m else None
+
+def normalize_one(phone: Any) -> Tuple[int, str, Optional[str]]:
+    """单个号码：返回 (状态码, 0开头本地格式, 本地格式的分类)"""
+    raw = clean(phone)
+    if not raw:
+        return STATUS_EMPTY, "", None
+    if raw.startswith("81") and len(raw) in (11, 12):
+        local = "0" + raw[2:]
+    elif raw.startswith("0") and len(raw) == 11:
+        local = raw
+    else:
+        return STATUS_BAD_FORMAT, "", classify(raw)
+    kind = classify(local)
+    return (STATUS_OK if kind == "11" else STATUS_UNCLASSIFIED), local, kind
+
+class BatchResult:
+    """按列保存结果，避免每行一个对象"""
+    __slots__ = ("digits", "local", "intl", "kind", "status")
+
+    def __init__(self, digits: List[str], local: List[str], intl: List[str],
+                 kind: List[Optional[str]], status: Any):
+        self.digits = digits
+        self.local = local      # 0开头本地格式（send_sms 首次发送用）
+        self.intl = intl        # 81开头格式（收到560时的兜底）
+        self.kind = kind        # "11" / "14" / "81" / None
+        self.status = status    # 状态码列（NumPy时为 int8 数组）
+
+    def __len__(self):
+        return len(self.local)
+
+    def ok_mask(self):
+        if not isinstance(self.status, list):
+            return self.status <= STATUS_UNCLASSIFIED
+        return [s <= STATUS_UNCLASSIFIED for s in self.status]
+
+    def counts(self) -> dict:
+        result = {name: 0 for name in STATUS_NAMES.values()}
+        for s in self.status:
+            result[STATUS_NAMES[int(s)]] += 1
+        return result
+
+# bytes.translate 要删除的字节：除数字和换行（列分隔符）以外的全部
+_DELETE_NON_DIGITS = bytes(c for c in range(256) if not 48 <= c <= 57 and c != 10)
+
+def clean_column(numbers: Sequence[Any]) -> List[bytes]:
+    """整列清洗：拼成一个字节串做一次 translate 再切分，避免逐行正则"""
+    strs = [p if type(p) is str else str(p) for p in numbers]
+    try:
+        blob = "\n".join(strs).encode("ascii")
+    except UnicodeEncodeError:
+        # 含全角数字等非ASCII的行单独清洗
+        strs = [s if s.isascii() else clean(s) for s in strs]
+        blob = "\n".join(strs).encode("ascii")
+    cleaned = blob.translate(None, _DELETE_NON_DIGITS).split(b"\n")
+    if len(cleaned) != len(strs):
+        # 号码本身带换行时退回逐行清洗
+        cleaned = [clean(s).encode("ascii") for s in strs]
+    return cleaned
+
+def _normalize_python(cleaned: List[str]) -> BatchResult:
+    local, intl, kind, status = [], [], [], []
+    for raw in cleaned:
+        if not raw:
+            st, loc, k = STATUS_EMPTY, "", None
+        else:
+            if raw.startswith("81") and len(raw) in (11, 12):
+                loc = "0" + raw[2:]
+            elif raw.startswith("0") and len(raw) == 11:
+                loc = raw
+            else:
+                loc = ""
+            if loc:
+                k = classify(loc)
+                st = STATUS_OK if k == "11" else STATUS_UNCLASSIFIED
+            else:
+                k = classify(raw)
+                st = STATUS_BAD_FORMAT
+        local.append(loc)
+        intl.append("81" + loc[1:] if loc else "")
+        kind.append(k)
+        status.append(st)
+    return BatchResult(cleaned, local, intl, kind, status)
+
+# 合法号码最长14位，定长16足够；更长的行截断后长度仍不合法
+_WIDTH = 16
+
+def _normalize_numpy(np, cleaned: List[bytes]) -> BatchResult:
+    n = len(cleaned)
+    W = _WIDTH
+    lens = np.fromiter(map(len, cleaned), dtype=np.int32, count=n)
+    dig = np.array(cleaned, dtype=f"S{W}").view(np.uint8).reshape(n, W)
+    d = dig.astype(np.int16) - 48  # 空位为 -48，不会误判为数字
+
+    starts81 = (d[:, 0] == 8) & (d[:, 1] == 1)
+    starts0 = d[:, 0] == 0
+    from81 = starts81 & ((lens == 11) | (lens == 12))
+    from0 = starts0 & (lens == 11)
+    sendable = from81 | from0
+
+    # 本地格式：81xxxx → 0xxxx
+    loc = dig.copy()
+    loc[from81, :-1] = dig[from81, 1:]
+    loc[from81, 0] = 48
+    loc[from81, -1] = 0
+    loc[~sendable] = 0
+    loc_len = np.where(from81, lens - 1, lens)
+    ld = loc.astype(np.int16) - 48
+    pat11 = (sendable & (loc_len == 11) & (ld[:, 0] == 0) & np.isin(ld[:, 1], (2, 6, 7, 8, 9))
+             & (ld[:, 2] == 0) & (ld[:, 3] >= 1))
+
+    # 81格式（560兜底）：0xxxx → 81xxxx
+    intl = np.zeros((n, W), dtype=np.uint8)
+    intl[:, 2:] = loc[:, 1:-1]
+    intl[sendable, 0] = ord("8")
+    intl[sendable, 1] = ord("1")
+
+    # 不可发送的行按原始数字分类（与 classify_number 一致）
+    second = np.isin(d[:, 1], (2, 6, 7, 8, 9))
+    raw11 = (lens == 11) & starts0 & second & (d[:, 2] == 0) & (d[:, 3] >= 1)
+    raw14 = (lens == 14) & starts0 & second & (d[:, 2] == 0) & (d[:, 3] == 0)
+    raw81 = (lens == 12) & starts81 & np.isin(d[:, 2], (7, 8, 9)) & (d[:, 3] == 0)
+    kind_code = np.where(sendable, np.where(pat11, 1, 0),
+                         np.select([raw11, raw14, raw81], [1, 2, 3], 0))
+
+    status = np.full(n, STATUS_BAD_FORMAT, dtype=np.int8)
+    status[sendable] = STATUS_UNCLASSIFIED
+    status[pat11] = STATUS_OK
+    status[lens == 0] = STATUS_EMPTY
+
+    # S 定长字节串会自动去掉尾部 \0，整列转回 str 列表
+    as_str = lambda m: m.view(f"S{W}").ravel().astype(f"U{W}").tolist()
+    digits = [c.decode("ascii") for c in cleaned]
+    kind_codes = np.array(_KINDS, dtype=object)
+    return BatchResult(digits, as_str(loc), as_str(intl), kind_codes[kind_code].tolist(), status)
+
+def normalize_batch(numbers: Sequence[Any], use_numpy: Optional[bool] = None) -> BatchResult:
+    """整列规范化，结果与逐个调用 normalize_one 相同"""
+    cleaned = clean_column(numbers)
+    if use_numpy is None:
+        use_numpy = len(cleaned) >= 256
+    np = numpy_or_none() if use_numpy and cleaned else None
+    if np is not None:
+        return _normalize_numpy(np, cleaned)
+    return _normalize_python([c.decode("ascii") for c in cleaned])
+
+def normalize_column(df, column: str, prefix: str = "phone_"):
+    """pandas DataFrame：追加 phone_local / phone_intl / phone_kind / phone_status 列"""
+    if column not in df.columns:
+        raise KeyError(f"column not found: {column}")
+    values = df[column].fillna("").astype(str).tolist()
+    res = normalize_batch(values)
+    out = df.copy()
+    out[prefix + "local"] = res.local
+    out[prefix + "intl"] = res.intl
+    out[prefix + "kind"] = res.kind
+    out[prefix + "status"] = list(res.status)
+    return out
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流水线模式（asyncio，send_sms_firebase.py 模式3 或 RPA_PIPELINE=1 时启用）
+process_one_message 对每封邮件串行执行 抓取→解析→浏览器→SMS→标记已读，总耗时是各步之和。
+这里拆成五个阶段，用有界 asyncio.Queue 连接：
+    邮箱抓取 → MIME/链接解析 → 求职者页面提取（N个浏览器并行）→ SMS发送 → 已读标记提交（批量）
+- 下游变慢时上游 put 会等待（背压），内存中的邮件数不超过各队列容量之和
+- imaplib / Selenium / requests 都是阻塞调用，放到各自的线程池执行，不阻塞事件循环
+- 各阶段同时工作，吞吐量由最慢的阶段（通常是浏览器）决定
+- 浏览器空闲时由 session_keepalive.py 在后台保持站点登录状态
+- 多个浏览器的站点登录按邮箱串行（send_sms_firebase.login_lock），不会互相拿走二步验证码
+- 解析后先领取邮件租约（mail_lease.py），其他进程正在处理的邮件直接跳过
+- 同一应募的重复通知在第一封处理完（发出短信或失败）之前先挂起，之后再查应募索引，不会重复发短信
+"""
+
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Set, Any, Callable
+
+from send_sms_firebase import (
+    get_all_target_unread_messages, parse_mail, make_driver,
+    new_mail_result, open_and_extract_phone,
+    send_applicant_sms, mark_seen, finish_mail_result,
+    applicant_already_handled, remember_applicant, claim_mail,
+)
+from event_log import make_print, log_event
+from poll_scheduler import PollScheduler
+from mail_record import MailRecord
+from results_writer import mail_doc_id
+from applicant_index import applicant_key, DEDUP_ENABLED as APPLICANT_DEDUP
+from session_keepalive import SessionKeeper
+
+print = make_print()
+
+PIPELINE_EXTRACTORS = int(os.getenv("RPA_PIPELINE_EXTRACTORS", "2"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("RPA_PIPELINE_QUEUE", "8"))
+# 已读标记攒批：最多多少封 / 最长等待秒数
+FLAG_BATCH_MAX = int(os.getenv("RPA_FLAG_BATCH", "50"))
+FLAG_BATCH_WAIT = float(os.getenv("RPA_FLAG_BATCH_WAIT", "1.0"))
+
+_DONE = None  # 阶段结束标记
+
+class MailJob:
+    # msg 只在抓取→解析之间持有，解析后只留 record（mail_record.py）
+    __slots__ = ("mid", "msg", "record", "result", "phone", "keys")
+
+    def __init__(self, mid, msg):
+        self.mid = mid
+        self.msg = msg
+        self.record: Optional[MailRecord] = None
+        self.result: Dict[str, Any] = {}
+        self.phone: Optional[str] = None
+        # 占用中的应募键（applicant_index.applicant_key），提交或失败时释放
+        self.keys: Set[str] = set()
+
+def extractor_profile_dir(index: int) -> str:
+    # 同一个 profile 目录不能被两个Chrome同时使用；第0个沿用原目录以复用登录会话
+    return "chrome_user_data" if index == 0 else f"chrome_user_data_{index}"
+
+class Pipeline:
+    def __init__(self, config: Dict, templates: Dict, subject_keyword: str, interval: float = 5,
+                 extractors: int = PIPELINE_EXTRACTORS, queue_size: int = PIPELINE_QUEUE_SIZE,
+                 driver_factory: Optional[Callable[[int], Any]] = None):
+        self.config = config
+        self.templates = templates
+        self.subject_keyword = subject_keyword
+        self.interval = interval
+        self.extractors = max(1, extractors)
+        self.queue_size = max(1, queue_size)
+        self.driver_factory = driver_factory or (lambda i: make_driver(extractor_profile_dir(i)))
+        self.in_flight = set()
+        self.processed = set()
+        # 轮询调度只按第一次见到的邮件计到达：失败后重新抓到、其他进程租约中的邮件不算新到达
+        self.observed = set()
+        # 已进入提取/发送阶段的应募键：应募索引要等短信发出后才写入，这期间到达的重复通知靠它挡住
+        self.inflight_keys: Set[str] = set()
+        self._held: Set[asyncio.Task] = set()
+        self._keys_released: Optional[asyncio.Event] = None
+        self.stats = {"fetched": 0, "parsed": 0, "duplicate": 0, "leased": 0, "held": 0, "extracted": 0,
+                      "sent": 0, "committed": 0, "failed": 0}
+        self._drivers: List[Any] = []
+        self.keeper = SessionKeeper()
+
+    # ====== 工具 ======
+    async def _call(self, executor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    def _fail(self, job: MailJob):
+        finish_mail_result(self.config, job.record, job.result, False)
+        # 失败的邮件保持未读，下一轮抓取时重新进入流水线
+        self.in_flight.discard(job.mid)
+        self._release_keys(job)
+        self.stats["failed"] += 1
+
+    def _release_keys(self, job: MailJob):
+        if not job.keys:
+            return
+        self.inflight_keys -= job.keys
+        job.keys = set()
+        # 唤醒所有挂起的重复通知，各自重新检查自己的键
+        self._keys_released.set()
+        self._keys_released = asyncio.Event()
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {name: q.qsize() for name, q in self._queues.items()}
+
+    # ====== 阶段1：邮箱抓取 ======
+    async def fetcher(self, out: asyncio.Queue, once: bool):
+        poll = 0
+        scheduler = PollScheduler(base=self.interval)
+        while True:
+            poll += 1
+            try:
+                msgs = await self._call(self._io, get_all_target_unread_messages, self.subject_keyword, self.config)
+            except Exception as e:
+                print(f"⚠️ 邮箱抓取失败: {e}")
+                msgs = []
+            new = [(mid, msg) for mid, msg in msgs if mid not in self.in_flight and mid not in self.processed]
+            arrived = [mid for mid, _ in new if mid not in self.observed]
+            self.observed.update(arrived)
+            delay = scheduler.observe(len(arrived))
+            depths = self.queue_depths()
+            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] 第{poll}次轮询 | 新邮件:{len(new)} | "
+                  f"处理中:{len(self.in_flight)} | 队列 " + " ".join(f"{k}:{v}" for k, v in depths.items())
+                  + f" | {scheduler.describe()}")
+            for mid, msg in new:
+                self.in_flight.add(mid)
+                self.stats["fetched"] += 1
+                await out.put(MailJob(mid, msg))
+            if once:
+                await out.put(_DONE)
+                return
+            await asyncio.sleep(delay)
+
+    # ====== 阶段2：MIME/链接解析 ======
+    async def parser(self, inq: asyncio.Queue, out: asyncio.Queue):
+        while True:
+            job = await inq.get()
+            if job is _DONE:
+                # 挂起的重复通知放行后才结束下游
+                while self._held:
+                    await asyncio.gather(*self._held)
+                for _ in range(self.extractors):
+                    await out.put(_DONE)
+                return
+            try:
+                job.record = await self._call(None, parse_mail, job.mid, job.msg)
+            except Exception as e:
+                print(f"⚠️ 邮件解析失败: {e}")
+                job.record = MailRecord(job.mid, mail_id=mail_doc_id(None, job.mid))
+            job.msg = None
+            keys = {k for k in map(applicant_key, job.record.targets) if k} if APPLICANT_DEDUP else set()
+            if keys & self.inflight_keys:
+                # 同一应募的另一封通知正在处理：先挂起，不占用解析阶段
+                self.stats["held"] += 1
+                task = asyncio.create_task(self._hold(job, keys, out))
+                self._held.add(task)
+                task.add_done_callback(self._held.discard)
+                continue
+            await self._admit(job, keys, out)
+
+    async def _hold(self, job: MailJob, keys: Set[str], out: asyncio.Queue):
+        """等占用这些应募键的邮件提交或失败后再放行；先发出的短信已记入应募索引，放行后按重复通知处理"""
+        while keys & self.inflight_keys:
+            await self._keys_released.wait()
+        try:
+            await self._admit(job, keys, out)
+        except Exception as e:
+            print(f"⚠️ 挂起的邮件放行失败: {e}")
+            self.in_flight.discard(job.mid)
+
+    async def _admit(self, job: MailJob, keys: Set[str], out: asyncio.Queue):
+        # 从检查 inflight_keys 到占用键之间没有 await，其他协程插不进来
+        if not claim_mail(self.config, job.record):
+            # 其他进程正在处理（mail_lease.py）
+            self.in_flight.discard(job.mid)
+            self.stats["leased"] += 1
+            return
+        job.result = new_mail_result(job.record)
+        self.stats["parsed"] += 1
+        if not job.record.targets:
+            self._fail(job)
+            return
+        if applicant_already_handled(self.config, job.record.targets, job.result):
+            # 同一应募已发过短信：不占用浏览器，直接标记已读
+            await self._call(self._io, mark_seen, self.config, [job.mid])
+            self.processed.add(job.mid)
+            self.in_flight.discard(job.mid)
+            finish_mail_result(self.config, job.record, job.result, True)
+            self.stats["duplicate"] += 1
+            return
+        job.keys = keys
+        self.inflight_keys |= keys
+        await out.put(job)
+
+    # ====== 阶段3：求职者页面提取（每个worker独占一个浏览器）======
+    async def extractor(self, index: int, inq: asyncio.Queue, out: asyncio.Queue):
+        driver = None
+        while True:
+            job = await inq.get()
+            if job is _DONE:
+                await out.put(_DONE)
+                return
+            if driver is None:
+                try:
+                    driver = await self._call(self._browser, self.driver_factory, index)
+                    self._drivers.append(driver)
+                    self.keeper.watch(driver, self.config)
+                except Exception as e:
+                    print(f"❌ 浏览器{index}启动失败: {e}")
+                    self._fail(job)
+                    continue
+            for target_url in job.record.targets:
+                try:
+                    job.phone = await self._call(self._browser, self.keeper.call, driver, open_and_extract_phone,
+                                                 driver, target_url, self.config, job.result)
+                except Exception as e:
+                    print("发生异常：", e)
+                    job.result.update(status="error", error=str(e)[:300])
+                if job.phone:
+                    break
+            if not job.phone:
+                self._fail(job)
+                continue
+            self.stats["extracted"] += 1
+            await out.put(job)
+
+    # ====== 阶段4：SMS发送 ======
+    async def sms_sender(self, inq: asyncio.Queue, out: asyncio.Queue):
+        finished = 0
+        while True:
+            job = await inq.get()
+            if job is _DONE:
+                finished += 1
+                if finished >= self.extractors:
+                    await out.put(_DONE)
+                    return
+                continue
+            try:
+                ok = await self._call(self._sms, send_applicant_sms, job.phone, job.record, self.config,
+                                      self.templates, job.result)
+            except Exception as e:
+                print("发生异常：", e)
+                job.result.update(status="error", error=str(e)[:300])
+                ok = False
+            if not ok:
+                self._fail(job)
+                continue
+            remember_applicant(self.config, job.result)
+            self.stats["sent"] += 1
+            await out.put(job)
+
+    # ====== 阶段5：已读标记（攒批，一次IMAP登录）======
+    async def flag_committer(self, inq: asyncio.Queue):
+        done = False
+        while not done:
+            batch: List[MailJob] = []
+            job = await inq.get()
+            if job is _DONE:
+                return
+            batch.append(job)
+            deadline = time.monotonic() + FLAG_BATCH_WAIT
+            while len(batch) < FLAG_BATCH_MAX:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    job = await asyncio.wait_for(inq.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if job is _DONE:
+                    done = True
+                    break
+                batch.append(job)
+            await self._call(self._io, mark_seen, self.config, [j.mid for j in batch])
+            for j in batch:
+                # 短信已发出：无论标记是否成功都不再重复处理（与循环模式一致）
+                self.processed.add(j.mid)
+                self.in_flight.discard(j.mid)
+                # 应募索引已在发送后写入，放行挂起的重复通知
+                self._release_keys(j)
+                finish_mail_result(self.config, j.record, j.result, True)
+            self.stats["committed"] += len(batch)
+
+    # ====== 运行 ======
+    async def run(self, once: bool = False):
+        self._io = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pipe-imap")
+        self._browser = ThreadPoolExecutor(max_workers=self.extractors, thread_name_prefix="pipe-browser")
+        self._sms = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipe-sms")
+        self._keys_released = asyncio.Event()
+        self._queues = {
+            "解析": asyncio.Queue(self.queue_size),
+            "提取": asyncio.Queue(self.queue_size),
+            "短信": asyncio.Queue(self.queue_size),
+            "标记": asyncio.Queue(FLAG_BATCH_MAX),
+        }
+        q_parse, q_extract, q_sms, q_flag = self._queues.values()
+        self.keeper.start()
+        tasks = [
+            asyncio.create_task(self.fetcher(q_parse, once)),
+            asyncio.create_task(self.parser(q_parse, q_extract)),
+            *[asyncio.create_task(self.extractor(i, q_extract, q_sms)) for i in range(self.extractors)],
+            asyncio.create_task(self.sms_sender(q_sms, q_flag)),
+            asyncio.create_task(self.flag_committer(q_flag)),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in [*tasks, *self._held]:
+                t.cancel()
+            self.keeper.stop()
+            for driver in self._drivers:
+                try:
+                    driver.quit()
+                except Exception:
+                    pass
+            for ex in (self._io, self._browser, self._sms):
+                ex.shutdown(wait=False)
+            log_event("pipeline_stopped", "info", **self.stats)
+        return self.stats
+
+def run_pipeline(config: Dict, templates: Dict, subject_keyword: str, interval: float = 5,
+                 once: bool = False, extractors: int = PIPELINE_EXTRACTORS) -> Dict[str, int]:
+    pipeline = Pipeline(config, templates, subject_keyword, interval, extractors)
+    print(f"进入流水线模式：浏览器{pipeline.extractors}个，队列容量{pipeline.queue_size}，"
+          f"基准每{interval}秒检查一次新未读邮件。按Ctrl+C退出。")
+    try:
+        return asyncio.run(pipeline.run(once))
+    except KeyboardInterrupt:
+        print("\n已手动退出流水线模式。")
+        return pipeline.stats
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应轮询间隔
+循环模式原来固定每 interval 秒登录一次IMAP：夜间白白登录，早高峰又多等。
+- 按最近的到达率（指数衰减计数）估算间隔：到达越密，间隔越短
+- 发现新邮件后立即回到最小间隔；连续空轮询按倍数放宽，直到最大间隔
+- 加随机抖动，避免多个租户同时轮询
+- 营业时间配置：不同时段用不同的 min/max（默认按日本时间，工作日 8:00-20:00 为高峰）
+
+环境变量：
+    RPA_POLL_ADAPTIVE=0      关闭自适应，固定间隔（原行为）
+    RPA_POLL_MIN / RPA_POLL_MAX / RPA_POLL_JITTER
+    RPA_POLL_TZ              时区（默认 Asia/Tokyo）
+    RPA_POLL_PROFILES        JSON，例如
+        [{"name": "peak", "days": [0,1,2,3,4], "start": "08:00", "end": "20:00", "min": 2, "max": 30},
+         {"name": "night", "start": "22:00", "end": "07:00", "min": 30, "max": 600}]
+        days 为 0=周一 … 6=周日，省略表示每天；跨零点的时段 start > end；都不匹配时用默认 min/max
+"""
+
+import os
+import json
+import math
+import time
+import random
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+
+POLL_ADAPTIVE = os.getenv("RPA_POLL_ADAPTIVE", "1") != "0"
+POLL_MIN = float(os.getenv("RPA_POLL_MIN", "2"))
+POLL_MAX = float(os.getenv("RPA_POLL_MAX", "120"))
+POLL_JITTER = float(os.getenv("RPA_POLL_JITTER", "0.15"))
+POLL_TZ = os.getenv("RPA_POLL_TZ", "Asia/Tokyo")
+# 到达率估计的半衰期（秒）
+RATE_HALF_LIFE = float(os.getenv("RPA_POLL_HALF_LIFE", "900"))
+# 空轮询后间隔放宽倍数
+IDLE_BACKOFF = 1.5
+# 平均每封邮件到达间隔内轮询几次
+POLLS_PER_ARRIVAL = 4.0
+
+DEFAULT_PROFILES = [
+    {"name": "peak", "days": [0, 1, 2, 3, 4], "start": "08:00", "end": "20:00", "min": 2, "max": 30},
+    {"name": "night", "start": "22:00", "end": "07:00", "min": 30, "max": 600},
+]
+
+def _minutes(hhmm: str) -> int:
+    h, m = hhmm.split(":")
+    return int(h) * 60 + int(m)
+
+class PollProfile:
+    __slots__ = ("name", "days", "start", "end", "min", "max")
+
+    def __init__(self, name: str, start: str, end: str, min: float, max: float, days: Optional[List[int]] = None):
+        self.name = name
+        self.days = set(days) if days is not None else None
+        self.start = _minutes(start)
+        self.end = _minutes(end)
+        self.min = float(min)
+        self.max = float(max)
+
+    def matches(self, dt: datetime) -> bool:
+        minute = dt.hour * 60 + dt.minute
+        if self.start <= self.end:
+            in_range = self.start <= minute < self.end
+            day = dt.weekday()
+        else:
+            # 跨零点：凌晨部分算作前一天的时段
+            in_range = minute >= self.start or minute < self.end
+            day = dt.weekday() if minute >= self.start else (dt.weekday() - 1) % 7
+        return in_range and (self.days is None or day in self.days)
+
+def load_profiles(raw: Optional[str] = None) -> List[PollProfile]:
+    raw = os.getenv("RPA_POLL_PROFILES", "") if raw is None else raw
+    items: List[Dict[str, Any]] = DEFAULT_PROFILES
+    if raw.strip():
+        try:
+            items = json.loads(raw)
+        except ValueError as e:
+            print(f"⚠️ RPA_POLL_PROFILES 格式错误，使用默认时段配置: {e}")
+    profiles = []
+    for item in items:
+        try:
+            profiles.append(PollProfile(item.get("name", f"{item['start']}-{item['end']}"), item["start"], item["end"],
+                                        item.get("min", POLL_MIN), item.get("max", POLL_MAX), item.get("days")))
+        except (KeyError, ValueError) as e:
+            print(f"⚠️ 忽略无效的时段配置 {item}: {e}")
+    return profiles
+
+def _tz():
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(POLL_TZ)
+    except Exception:
+        # 没有 tzdata（如部分Windows环境）时按本机时间
+        return None
+
+class PollScheduler:
+    """每次轮询后调用 observe(新邮件数)，返回下次轮询前应等待的秒数"""
+
+    def __init__(self, base: float = 5.0, min_interval: float = POLL_MIN, max_interval: float = POLL_MAX,
+                 jitter: float = POLL_JITTER, profiles: Optional[List[PollProfile]] = None,
+                 adaptive: bool = POLL_ADAPTIVE, half_life: float = RATE_HALF_LIFE,
+                 rng: Optional[random.Random] = None, clock=time.time):
+        self.base = float(base)
+        self.min_interval = min(float(min_interval), self.base)
+        self.max_interval = max(float(max_interval), self.base)
+        self.jitter = max(0.0, jitter)
+        self.profiles = load_profiles() if profiles is None else profiles
+        self.adaptive = adaptive
+        self.half_life = half_life
+        self.rng = rng or random.Random()
+        self.clock = clock
+        self._tz = _tz()
+        self._score = 0.0           # 指数衰减的到达计数
+        self._last_t: Optional[float] = None
+        self._interval = self.base  # 抖动前的间隔
+        self.last_delay = self.base
+        self.profile_name = "default"
+
+    def _bounds(self, now: float):
+        dt = datetime.fromtimestamp(now, self._tz) if self._tz else datetime.fromtimestamp(now)
+        for p in self.profiles:
+            if p.matches(dt):
+                return p.name, p.min, p.max
+        return "default", self.min_interval, self.max_interval
+
+    @property
+    def rate_per_min(self) -> float:
+        # 稳态下 score ≈ rate * half_life / ln2
+        return self._score * math.log(2) / self.half_life * 60.0
+
+    def observe(self, new_count: int) -> float:
+        now = self.clock()
+        if not self.adaptive:
+            self.last_delay = self.base
+            return self.base
+        if self._last_t is not None:
+            self._score *= 0.5 ** ((now - self._last_t) / self.half_life)
+        self._last_t = now
+        self._score += max(0, new_count)
+
+        self.profile_name, lo, hi = self._bounds(now)
+        if new_count > 0:
+            # 有新邮件：同一批后续邮件往往紧接着到达，立刻缩到最小间隔
+            interval = lo
+        else:
+            interval = self._interval * IDLE_BACKOFF
+            rate = self.rate_per_min / 60.0
+            if rate > 0:
+                interval = min(interval, 1.0 / (rate * POLLS_PER_ARRIVAL))
+        interval = min(hi, max(lo, interval))
+        self._interval = interval
+
+        delay = interval
+        if self.jitter:
+            delay *= 1.0 + self.rng.uniform(-self.jitter, self.jitter)
+        self.last_delay = min(hi, max(lo, delay)) if lo < hi else lo
+        return self.last_delay
+
+    def describe(self) -> str:
+        if not self.adaptive:
+            return f"间隔:{self.last_delay:.0f}s(固定)"
+        return f"间隔:{self.last_delay:.1f}s({self.profile_name}, {self.rate_per_min:.2f}封/分)"
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按邮件/请求的性能剖析（默认关闭，可在运行中临时打开）
+- @profiled(kind, tag) 包住 process_one_message 等单条处理函数；打开时每处理一条：
+    cProfile 写 <时间>_<kind>_<uid>_<tag>.prof（可用 snakeviz / pstats 查看）
+    tracemalloc 前后快照对比，写 .txt：峰值内存、分配最多的代码行、cProfile 累计耗时前几名
+- 文件写到 data/profiles/，只保留最近 RPA_PROFILE_KEEP 条，旧的自动删除
+- 同一时间只剖析一条（cProfile/tracemalloc 都是进程级的），其余并发的照常执行不剖析
+
+开关：
+    RPA_PROFILE=1      始终打开
+    RPA_PROFILE=auto   （默认）存在控制文件 data/profiles/ENABLED 且未过期时打开，最多每2秒检查一次
+    RPA_PROFILE=0      装饰器直接返回原函数，完全没有额外开销
+    python profiling.py on --minutes 10   在线上进程不重启的情况下打开10分钟
+    python profiling.py off / status
+    python profiling.py top <文件.prof> [--limit 30]
+"""
+
+import io
+import os
+import re
+import time
+import functools
+import threading
+import contextlib
+from typing import Optional, Callable, Any, List
+
+DATA_DIR = os.getenv("RPA_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+PROFILE_DIR = os.getenv("RPA_PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+PROFILE_MODE = os.getenv("RPA_PROFILE", "auto").lower()
+PROFILE_KEEP = int(os.getenv("RPA_PROFILE_KEEP", "200"))
+PROFILE_TRACEMALLOC = os.getenv("RPA_PROFILE_TRACEMALLOC", "1") != "0"
+PROFILE_FRAMES = int(os.getenv("RPA_PROFILE_FRAMES", "1"))
+PROFILE_TOP = int(os.getenv("RPA_PROFILE_TOP", "25"))
+CONTROL_FILE = os.path.join(PROFILE_DIR, "ENABLED")
+CHECK_INTERVAL = 2.0
+
+_lock = threading.Lock()
+_checked_at = 0.0
+_enabled_cache = False
+
+def _control_file_active() -> bool:
+    try:
+        with open(CONTROL_FILE, "r", encoding="utf-8") as f:
+            raw = f.read().strip()
+    except OSError:
+        return False
+    if not raw:
+        return True
+    try:
+        return time.time() < float(raw)
+    except ValueError:
+        return True
+
+def is_enabled() -> bool:
+    global _checked_at, _enabled_cache
+    if PROFILE_MODE in ("1", "on", "true"):
+        return True
+    now = time.monotonic()
+    if now - _checked_at >= CHECK_INTERVAL:
+        _checked_at = now
+        _enabled_cache = _control_file_active()
+    return _enabled_cache
+
+def _safe(value: Any) -> str:
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", errors="replace")
+    return re.sub(r"[^\w.-]+", "_", str(value))[:40] or "-"
+
+def _current_uid() -> str:
+    try:
+        from event_log import get_logger
+        return str(get_logger().context.get("uid") or "")
+    except Exception:
+        return ""
+
+def _rotate(directory: str, keep: int):
+    try:
+        profs = sorted(p for p in os.listdir(directory) if p.endswith(".prof"))
+    except OSError:
+        return
+    for name in profs[:max(0, len(profs) - keep)]:
+        base = os.path.join(directory, name[:-len(".prof")])
+        for ext in (".prof", ".txt"):
+            try:
+                os.remove(base + ext)
+            except OSError:
+                pass
+
+def _report(kind: str, tag: str, uid: str, elapsed: float, status: str, profiler, before, after, peak: int) -> str:
+    import pstats
+    out = io.StringIO()
+    out.write(f"kind: {kind}\ntag: {tag}\nuid: {uid}\nstatus: {status}\nelapsed_ms: {elapsed * 1000:.1f}\n")
+    if after is not None:
+        out.write(f"traced_peak_kb: {peak / 1024:.1f}\n\n")
+        out.write(f"== 分配增量前{PROFILE_TOP}（按代码行）==\n")
+        for stat in after.compare_to(before, "lineno")[:PROFILE_TOP]:
+            out.write(f"{stat}\n")
+    out.write(f"\n== cProfile 累计耗时前{PROFILE_TOP} ==\n")
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+    return out.getvalue()
+
+@contextlib.contextmanager
+def profile_message(kind: str, tag: Any = ""):
+    """剖析 with 块内的一次处理；未打开或已有剖析在进行时什么也不做"""
+    if not is_enabled() or not _lock.acquire(blocking=False):
+        yield None
+        return
+    # 只在真正剖析时才导入（send_personal_sms 的启动耗时有预算）
+    import cProfile
+    import tracemalloc
+    started_tracing = False
+    before = after = None
+    peak = 0
+    profiler = cProfile.Profile()
+    status = "error"
+    t0 = time.perf_counter()
+    try:
+        if PROFILE_TRACEMALLOC:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(PROFILE_FRAMES)
+                started_tracing = True
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+        profiler.enable()
+        try:
+            yield profiler
+            status = "ok"
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - t0
+            if before is not None:
+                after = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+            _write(kind, _safe(tag), elapsed, status, profiler, before, after, peak)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _lock.release()
+
+def _write(kind: str, tag: str, elapsed: float, status: str, profiler, before, after, peak: int):
+    # 写文件失败不影响业务处理
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        uid = _safe(_current_uid())
+        base = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}_{int(time.time() * 1000) % 1000:03d}"
+                                         f"_{kind}_{uid}_{tag}")
+        profiler.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(_report(kind, tag, uid, elapsed, status, profiler, before, after, peak))
+        _rotate(PROFILE_DIR, PROFILE_KEEP)
+        from event_log import log_event
+        log_event("profile_written", "debug", path=base + ".prof", kind=kind, tag=tag,
+                  elapsed_ms=round(elapsed * 1000, 1), peak_kb=round(peak / 1024, 1))
+    except Exception as e:
+        print(f"⚠️ 写入剖析结果失败: {e}")
+
+def profiled(kind: str, tag: Optional[Callable[..., Any]] = None):
+    """tag(*args, **kwargs) 返回文件名中的标识（如邮件UID）；RPA_PROFILE=0 时直接返回原函数"""
+    def decorator(func):
+        if PROFILE_MODE in ("0", "off", "false"):
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            try:
+                label = tag(*args, **kwargs) if tag else ""
+            except Exception:
+                label = ""
+            with profile_message(kind, label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# ====== 命令行 ======
+def enable(minutes: float = 0.0) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(CONTROL_FILE, "w", encoding="utf-8") as f:
+        f.write(str(time.time() + minutes * 60) if minutes > 0 else "")
+    return CONTROL_FILE
+
+def disable():
+    try:
+        os.remove(CONTROL_FILE)
+    except FileNotFoundError:
+        pass
+
+def list_profiles() -> List[str]:
+    try:
+        return sorted(os.path.join(PROFILE_DIR, p) for p in os.listdir(PROFILE_DIR) if p.endswith(".prof"))
+    except OSError:
+        return []
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="按邮件/请求的性能剖析开关")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_on = sub.add_parser("on", help="打开剖析（运行中的进程2秒内生效）")
+    p_on.add_argument("--minutes", type=float, default=10.0, help="多少分钟后自动关闭，0为不自动关闭")
+    sub.add_parser("off", help="关闭剖析")
+    sub.add_parser("status", help="查看开关状态与已有结果")
+    p_top = sub.add_parser("top", help="打印 .prof 文件的累计耗时排行")
+    p_top.add_argument("path")
+    p_top.add_argument("--limit", type=int, default=30)
+    p_top.add_argument("--sort", default="cumulative")
+    args = parser.parse_args()
+
+    if args.cmd == "on":
+        path = enable(args.minutes)
+        until = f"，{args.minutes:g}分钟后自动关闭" if args.minutes > 0 else ""
+        print(f"✅ 已打开剖析{until}（控制文件 {path}）")
+        if PROFILE_MODE in ("0", "off", "false"):
+            print("⚠️ 当前环境 RPA_PROFILE=0，以此环境启动的进程不会剖析")
+    elif args.cmd == "off":
+        disable()
+        print("✅ 已关闭剖析")
+    elif args.cmd == "status":
+        print(f"模式: RPA_PROFILE={PROFILE_MODE} | 控制文件: {'生效' if _control_file_active() else '无/已过期'}")
+        profiles = list_profiles()
+        print(f"目录: {PROFILE_DIR} | 结果: {len(profiles)} 条（保留最近 {PROFILE_KEEP} 条）")
+        for path in profiles[-10:]:
+            print(f"  {os.path.basename(path)}")
+    else:
+        import pstats
+        stats = pstats.Stats(args.path)
+        stats.sort_stats(args.sort).print_stats(args.limit)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+处理结果持久化（Firestore，批量写入）
+每封处理过的邮件、每次SMS发送结果写入：
+    rpa_results/{uid}/mails/{mail_id}
+    rpa_results/{uid}/sms/{smsid}
+- 调用方只把记录放进内存队列，不等网络；后台线程按 RESULTS_FLUSH_INTERVAL 或攒满一批时 batch.commit()
+- 提交失败（断网、Firestore不可用、Firebase未初始化）时追加到本地 JSONL 溢出文件，恢复后自动重放；
+  重放的旧记录与新记录放在同一次提交里、排在前面，同一文档的旧状态不会盖掉新状态（merge=True 按顺序生效）。
+  失败后 RESULTS_RETRY_INTERVAL 秒内新记录直接追加到溢出文件，不在断网期间反复读写溢出文件
+- 同一 DATA_DIR 下可能有多个进程：各进程只写自己的溢出文件（results_spill.<pid>.jsonl）并重放它；
+  其他进程的文件只有在 REPLAY_STALE_SECONDS 内没有写入（进程已退出）时才接手。认领一律先原子改名，
+  一个文件只会被一个进程重放
+- 设置 FIRESTORE_EMULATOR_HOST 即写入本地模拟器（firebase_admin 自动识别）
+"""
+
+import os
+import glob
+import json
+import time
+import atexit
+import hashlib
+import threading
+from typing import Optional, List, Dict, Any, Callable, Tuple
+
+DATA_DIR = os.getenv("RPA_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+RESULTS_ENABLED = os.getenv("RPA_RESULTS", "1") != "0"
+RESULTS_COLLECTION = os.getenv("RESULTS_COLLECTION", "rpa_results")
+RESULTS_FLUSH_INTERVAL = float(os.getenv("RESULTS_FLUSH_INTERVAL", "2"))
+# Firestore 单个 batch 最多500个写操作
+RESULTS_BATCH_SIZE = min(500, int(os.getenv("RESULTS_BATCH_SIZE", "200")))
+RESULTS_SPILL_PATH = os.getenv("RESULTS_SPILL_PATH", os.path.join(DATA_DIR, "results_spill.jsonl"))
+# 溢出文件上限，超过后丢弃新记录并告警
+RESULTS_SPILL_MAX_BYTES = int(os.getenv("RESULTS_SPILL_MAX_BYTES", str(50 * 1024 * 1024)))
+# 其他进程的溢出文件超过这个时间没有写入、或认领后超过这个时间仍未删除的 .replay 文件，
+# 视为该进程已退出，由其他进程接手（秒）
+REPLAY_STALE_SECONDS = 600
+# 提交失败后多久再试（秒）；期间的新记录直接进溢出文件
+RESULTS_RETRY_INTERVAL = float(os.getenv("RESULTS_RETRY_INTERVAL", "30"))
+
+def mail_doc_id(msg, fallback: Any = "") -> str:
+    """Message-ID 可能含 / 等字符，不能直接作文档ID，取哈希"""
+    key = (msg.get("Message-ID") if msg is not None else None) or ""
+    key = key.strip() or (fallback.decode() if isinstance(fallback, bytes) else str(fallback))
+    return hashlib.sha1(key.encode("utf-8", errors="ignore")).hexdigest()[:24]
+
+def _default_db():
+    # Firebase 未初始化时返回 None，记录进入溢出文件
+    try:
+        import firebase_admin
+        if not firebase_admin._apps:
+            return None
+        from firebase_admin import firestore
+        return firestore.client()
+    except Exception:
+        return None
+
+class ResultsWriter:
+    def __init__(self, db_factory: Optional[Callable[[], Any]] = None,
+                 collection: str = RESULTS_COLLECTION,
+                 flush_interval: float = RESULTS_FLUSH_INTERVAL,
+                 batch_size: int = RESULTS_BATCH_SIZE,
+                 spill_path: str = RESULTS_SPILL_PATH,
+                 spill_max_bytes: int = RESULTS_SPILL_MAX_BYTES):
+        self.db_factory = db_factory or _default_db
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, min(500, batch_size))
+        self.spill_path = spill_path
+        root, ext = os.path.splitext(spill_path)
+        self._spill_root, self._spill_ext = root, ext or ".jsonl"
+        self._own_spill = f"{root}.{os.getpid()}{self._spill_ext}"
+        self.spill_max_bytes = spill_max_bytes
+        self._cond = threading.Condition()
+        self._pending: List[Tuple[str, Dict[str, Any]]] = []
+        self._flush_requested = False
+        self._inflight = 0
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+        self._spill_lock = threading.Lock()
+        self._retry_at = 0.0
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "spilled": 0, "replayed": 0, "dropped": 0}
+
+    # ====== 写入接口（不阻塞）======
+    def record_mail(self, uid: str, mail_id: str, data: Dict[str, Any]):
+        self._put(f"{self.collection}/{uid or '_'}/mails/{mail_id}", data)
+
+    def record_sms(self, uid: str, smsid: str, data: Dict[str, Any]):
+        self._put(f"{self.collection}/{uid or '_'}/sms/{smsid}", data)
+
+    def _put(self, path: str, data: Dict[str, Any]):
+        doc = dict(data)
+        doc.setdefault("updated_at", time.time())
+        with self._cond:
+            self._pending.append((path, doc))
+            self.stats["queued"] += 1
+            if self._thread is None:
+                self._start()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name="results-writer", daemon=True)
+        self._thread.start()
+
+    # ====== 后台刷新 ======
+    def _run(self):
+        self._flush_items([])
+        while True:
+            with self._cond:
+                if not self._stop and not self._flush_requested and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                items, self._pending = self._pending, []
+                self._flush_requested = False
+                self._inflight = len(items)
+                stop = self._stop
+            if items:
+                self._flush_items(items, force=stop)
+            with self._cond:
+                self._inflight = 0
+                self._cond.notify_all()
+            if stop:
+                return
+
+    def _flush_items(self, items: List[Tuple[str, Dict[str, Any]]], force: bool = False):
+        """先取出溢出文件里的旧记录，与 items 按先后顺序一次提交；最近失败过时（除非 force）直接溢出"""
+        if not force and time.monotonic() < self._retry_at:
+            self._spill(items)
+            return
+        replayed = self._take_spill()
+        if not replayed and not items:
+            return
+        if replayed:
+            print(f"🔁 重放本地暂存的结果记录 {len(replayed)} 条")
+        # 失败部分（含重放的记录）按原顺序重新进入溢出文件
+        if self._commit(replayed + items):
+            self.stats["replayed"] += len(replayed)
+            self._retry_at = 0.0
+        else:
+            self._retry_at = time.monotonic() + RESULTS_RETRY_INTERVAL
+
+    def _commit(self, items: List[Tuple[str, Dict[str, Any]]]) -> bool:
+        """提交成功返回True；失败的部分写入溢出文件"""
+        db = None
+        try:
+            db = self.db_factory()
+        except Exception as e:
+            print(f"⚠️ 结果写入：获取Firestore客户端失败: {e}")
+        if db is None:
+            self._spill(items)
+            return False
+        for i in range(0, len(items), self.batch_size):
+            chunk = items[i:i + self.batch_size]
+            try:
+                batch = db.batch()
+                for path, data in chunk:
+                    batch.set(db.document(path), data, merge=True)
+                batch.commit()
+                self.stats["written"] += len(chunk)
+                self.stats["batches"] += 1
+            except Exception as e:
+                print(f"⚠️ 结果写入Firestore失败，暂存本地（{len(items) - i}条）: {e}")
+                self._spill(items[i:])
+                return False
+        return True
+
+    # ====== 本地溢出文件 ======
+    def _spill(self, items: List[Tuple[str, Dict[str, Any]]]):
+        with self._spill_lock:
+            try:
+                os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+                size = os.path.getsize(self._own_spill) if os.path.exists(self._own_spill) else 0
+                if size >= self.spill_max_bytes:
+                    self.stats["dropped"] += len(items)
+                    print(f"❌ 结果溢出文件已满（{size}字节），丢弃{len(items)}条记录")
+                    return
+                with open(self._own_spill, "a", encoding="utf-8") as f:
+                    for path, data in items:
+                        f.write(json.dumps({"path": path, "data": data}, ensure_ascii=False, default=str) + "\n")
+                self.stats["spilled"] += len(items)
+            except OSError as e:
+                self.stats["dropped"] += len(items)
+                print(f"❌ 写入结果溢出文件失败: {e}")
+
+    def _claim_spill_files(self) -> List[str]:
+        """把待重放的溢出文件改名为本进程的 .replay 文件（按写入先后排序）；改名失败说明已被其他进程认领"""
+        now = time.time()
+        own = [self._own_spill]
+        # 其他进程的溢出文件（含旧版本共用的文件）：只接手已经不再写入的，正在写的留给它自己重放
+        others = [self.spill_path, f"{self.spill_path}.replay"]
+        others += [p for p in glob.glob(f"{glob.escape(self._spill_root)}.*{self._spill_ext}") if p != self._own_spill]
+        for path in glob.glob(f"{glob.escape(self._spill_root)}.*.replay"):
+            # {root}.{pid}.{认领时刻}.{序号}.replay
+            try:
+                claimed_at = int(path[:-len(".replay")].split(".")[-2])
+            except (ValueError, IndexError):
+                continue
+            if now - claimed_at > REPLAY_STALE_SECONDS:
+                own.append(path)
+        candidates = []
+        for path in own + others:
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            if path in others and now - mtime <= REPLAY_STALE_SECONDS:
+                continue
+            candidates.append((mtime, path))
+        candidates.sort()
+        claimed = []
+        for i, (_, path) in enumerate(candidates):
+            replay_path = f"{self._spill_root}.{os.getpid()}.{int(now)}.{i}.replay"
+            try:
+                os.replace(path, replay_path)
+            except OSError:
+                continue
+            claimed.append(replay_path)
+        return claimed
+
+    def _take_spill(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """认领并读出溢出记录（读完即删除，提交失败时由 _commit 重新写入溢出文件）；出错不抛出"""
+        items = []
+        try:
+            with self._spill_lock:
+                claimed = self._claim_spill_files()
+        except Exception as e:
+            # 重放失败不能结束写入线程，否则之后的记录都不再提交
+            print(f"⚠️ 认领结果溢出文件失败: {e}")
+            return items
+        for replay_path in claimed:
+            try:
+                with open(replay_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            rec = json.loads(line)
+                            items.append((rec["path"], rec["data"]))
+                        except (ValueError, KeyError):
+                            continue
+                os.remove(replay_path)
+            except OSError as e:
+                print(f"⚠️ 读取结果溢出文件失败 {replay_path}: {e}")
+        return items
+
+    # ====== 控制 ======
+    def flush(self, timeout: float = 10.0) -> bool:
+        """请求立即提交并等待队列清空"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if self._thread is None:
+                return True
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._pending or self._inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        with self._cond:
+            if self._thread is None:
+                return
+            self._stop = True
+            self._cond.notify_all()
+            thread = self._thread
+        thread.join(timeout)
+
+_default_writer: Optional[ResultsWriter] = None
+
+def get_results_writer() -> ResultsWriter:
+    global _default_writer
+    if _default_writer is None:
+        _default_writer = ResultsWriter()
+        atexit.register(_default_writer.close)
+    return _default_writer
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+手机号发送历史（跨进程共享）
+替代各脚本里模块级的 phone_send_cache 字典：
+- SQLite（WAL）文件，多个RPA进程 / send_personal_sms.py 共用
+- 按 TTL 过期淘汰 + 行数上限，长期循环模式下占用有上限
+- rotate_content() 在一个写事务内完成“读取→决定A/B→写回”，不会被并发进程打断；
+  只看 A/B 模板的发送（ab_time / ab_content 列），send_personal_sms.py 的个别发送不参与轮换
+- 行数由触发器维护在 send_history_meta 里，淘汰时不必对整表 COUNT(*)
+- get() 返回 SendRecord（__slots__），不再是 {"last_time", "last_content"} 字典
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+from typing import Optional, Tuple
+
+# ====== 配置 ======
+DATA_DIR = os.getenv("RPA_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+SEND_HISTORY_DB = os.getenv("SEND_HISTORY_DB", os.path.join(DATA_DIR, "send_history.db"))
+# 记录保留时间（秒），至少要覆盖A/B轮换窗口
+SEND_HISTORY_TTL = int(os.getenv("SEND_HISTORY_TTL", str(24 * 3600)))
+# 行数上限，超出时淘汰最早过期的记录
+SEND_HISTORY_MAX_ROWS = int(os.getenv("SEND_HISTORY_MAX_ROWS", "2000000"))
+# 每写入多少次顺带做一次过期清理
+EVICT_EVERY = 500
+
+def phone_key(phone: str) -> str:
+    """统一成0开头的本地格式，保证 +81 90... / 090-... 命中同一条记录"""
+    digits = re.sub(r"\D", "", str(phone))
+    if digits.startswith("81") and len(digits) in (11, 12):
+        return "0" + digits[2:]
+    return digits
+
+class SendRecord:
+    __slots__ = ("phone", "last_time", "last_content")
+
+    def __init__(self, phone: str, last_time: float, last_content: Optional[str]):
+        self.phone = phone
+        self.last_time = last_time
+        self.last_content = last_content
+
+    def __repr__(self):
+        return f"SendRecord({self.phone!r}, last_time={self.last_time}, last_content={self.last_content!r})"
+
+class SendHistory:
+    def __init__(self, db_path: str = SEND_HISTORY_DB, ttl: int = SEND_HISTORY_TTL,
+                 max_rows: int = SEND_HISTORY_MAX_ROWS):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_rows = max_rows
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        # isolation_level=None：事务由下面显式的 BEGIN IMMEDIATE 控制
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS send_history (
+                phone        TEXT PRIMARY KEY,
+                last_time    REAL NOT NULL,
+                last_content TEXT,
+                expires_at   REAL NOT NULL,
+                ab_time      REAL,
+                ab_content   TEXT
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_send_history_expires ON send_history(expires_at);
+            """
+        )
+        self._migrate()
+
+    def _migrate(self):
+        """旧库补上 A/B 列和行数计数（只在第一次打开时做一次全表操作）"""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(send_history)")}
+            if "ab_time" not in columns:
+                self._conn.execute("ALTER TABLE send_history ADD COLUMN ab_time REAL")
+                self._conn.execute("ALTER TABLE send_history ADD COLUMN ab_content TEXT")
+                self._conn.execute(
+                    "UPDATE send_history SET ab_time = last_time, ab_content = last_content "
+                    "WHERE last_content IN ('A', 'B')"
+                )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS send_history_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            if not self._conn.execute("SELECT 1 FROM send_history_meta WHERE name = 'rows'").fetchone():
+                self._conn.execute(
+                    "INSERT INTO send_history_meta (name, value) SELECT 'rows', COUNT(*) FROM send_history"
+                )
+            # 写入一律用 UPSERT（不用 INSERT OR REPLACE），覆盖已有行时只触发 UPDATE，计数不变
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS send_history_count_ins AFTER INSERT ON send_history BEGIN "
+                "UPDATE send_history_meta SET value = value + 1 WHERE name = 'rows'; END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS send_history_count_del AFTER DELETE ON send_history BEGIN "
+                "UPDATE send_history_meta SET value = value - 1 WHERE name = 'rows'; END"
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, phone: str, now: Optional[float] = None) -> Optional[SendRecord]:
+        now = time.time() if now is None else now
+        key = phone_key(phone)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_time, last_content FROM send_history WHERE phone = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+        if not row:
+            return None
+        return SendRecord(key, row[0], row[1])
+
+    def record(self, phone: str, content: Optional[str], now: Optional[float] = None):
+        """
+        登记一次发送。content 为 A / B 时同时更新轮换状态；
+        其他内容（如 "personal"）只更新最近发送，rotate_content 不把它当作A/B发送
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if content in ("A", "B"):
+                self._upsert(phone_key(phone), now, content)
+            else:
+                self._conn.execute(
+                    "INSERT INTO send_history (phone, last_time, last_content, expires_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(phone) DO UPDATE SET last_time = excluded.last_time, "
+                    "last_content = excluded.last_content, expires_at = MAX(expires_at, excluded.expires_at)",
+                    (phone_key(phone), now, content, now + self.ttl),
+                )
+            self._after_write(now)
+
+    def rotate_content(self, phone: str, window: float = 60.0, now: Optional[float] = None) -> Tuple[str, bool]:
+        """
+        原子地决定本次发A还是B并写回。
+        window 秒内发过：与上次内容相反；否则默认A。
+        返回 (内容标识, 是否在窗口内重复)
+        """
+        now = time.time() if now is None else now
+        key = phone_key(phone)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT ab_time, ab_content FROM send_history WHERE phone = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+                repeated = bool(row) and row[0] is not None and now - float(row[0]) < window
+                if repeated:
+                    content = "B" if row[1] == "A" else "A"
+                else:
+                    content = "A"
+                self._upsert(key, now, content)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._after_write(now)
+        return content, repeated
+
+    def evict_expired(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._evict(now)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._row_count()
+
+    # 调用方已持有 self._lock
+    def _upsert(self, key: str, now: float, content: str):
+        self._conn.execute(
+            "INSERT INTO send_history (phone, last_time, last_content, expires_at, ab_time, ab_content) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(phone) DO UPDATE SET last_time = excluded.last_time, last_content = excluded.last_content, "
+            "expires_at = excluded.expires_at, ab_time = excluded.ab_time, ab_content = excluded.ab_content",
+            (key, now, content, now + self.ttl, now, content),
+        )
+
+    def _row_count(self) -> int:
+        row = self._conn.execute("SELECT value FROM send_history_meta WHERE name = 'rows'").fetchone()
+        return row[0] if row else 0
+
+    def _after_write(self, now: float):
+        self._writes += 1
+        if self._writes % EVICT_EVERY == 0:
+            self._evict(now)
+
+    def _evict(self, now: float) -> int:
+        removed = self._conn.execute("DELETE FROM send_history WHERE expires_at <= ?", (now,)).rowcount
+        count = self._row_count()
+        if count > self.max_rows:
+            removed += self._conn.execute(
+                "DELETE FROM send_history WHERE phone IN ("
+                "SELECT phone FROM send_history ORDER BY expires_at LIMIT ?)",
+                (count - self.max_rows,),
+            ).rowcount
+        return removed
+
+_default_history: Optional[SendHistory] = None
+
+def get_history() -> SendHistory:
+    """进程内共用一个连接"""
+    global _default_history
+    if _default_history is None:
+        _default_history = SendHistory()
+    return _default_history
@@ -13,6 +13,10 @@ import base64
 import time
 import requests
 
+from sms_codes import SMS_CODE_MAP
+from event_log import get_logger
+from profiling import profiled, profile_message
+
 # Windows编码设置
 import locale
 try:
@@ -25,69 +29,30 @@ except Exception as e:
     # 如果设置失败，继续执行，但可能会有编码问题
     pass
 
-# 安全的print函数，支持日语字符 - 针对Windows优化
+# 安全的print函数，支持日语字符
+# 经由 event_log 的写线程输出：编码兜底与批量flush统一在那里处理，不再每条都flush
 def safe_print(message):
-    try:
-        # 尝试直接输出
-        print(str(message))
-        # 在Node.js子进程中，flush可能会有问题，所以加try-catch
-        try:
-            sys.stdout.flush()
-        except:
-            pass
-    except UnicodeEncodeError:
-        try:
-            # 如果有编码问题，尝试用UTF-8编码
-            encoded_msg = str(message).encode('utf-8', errors='replace').decode('utf-8')
-            print(encoded_msg)
-            try:
-                sys.stdout.flush()
-            except:
-                pass
-        except:
-            # 最后的备选方案：输出无日语的简化版本
-            try:
-                # 尝试只保留ASCII字符和数字
-                ascii_msg = ''.join(char if ord(char) < 128 else '?' for char in str(message))
-                print(f"[INFO] {ascii_msg}")
-                try:
-                    sys.stdout.flush()
-                except:
-                    pass
-            except:
-                print("[MESSAGE_ENCODING_HANDLED]")
-                try:
-                    sys.stdout.flush()
-                except:
-                    pass
-    except Exception as e:
-        try:
-            print(f"[PRINT_ERROR] {type(e).__name__}")
-            try:
-                sys.stdout.flush()
-            except:
-                pass
-        except:
-            pass
+    get_logger().print(str(message))
 
-# Firebase Admin SDK
-try:
-    import firebase_admin
-    from firebase_admin import credentials, firestore
-    safe_print("Firebase Admin SDK imported successfully")
-except ImportError:
-    safe_print("Firebase Admin SDK not installed. Run: pip install firebase-admin")
-    sys.exit(1)
+# Firebase Admin SDK（延迟导入：配置缓存命中时完全不加载）
+from lazy_import import lazy_module, is_available
+firebase_admin = lazy_module("firebase_admin")
+credentials = lazy_module("firebase_admin.credentials")
+firestore = lazy_module("firebase_admin.firestore")
 
 # ====== Firebase配置 ======
 class FirebaseConfig:
     def __init__(self):
         self.user_uid = None
         self.user_config = None
+        self.user_config_version = None
         self.db = None
         
     def initialize_firebase(self, user_uid: str):
         """初始化Firebase并获取用户配置"""
+        if not is_available("firebase_admin"):
+            safe_print("Firebase Admin SDK not installed. Run: pip install firebase-admin")
+            return False
         try:
             # 初始化Firebase Admin（使用服务账户密钥）
             if not firebase_admin._apps:
@@ -138,6 +103,7 @@ class FirebaseConfig:
             
             if doc.exists:
                 self.user_config = doc.to_dict()
+                self.user_config_version = str(getattr(doc, "update_time", "") or "")
                 safe_print(f"User config retrieved successfully: {user_uid}")
                 return True
             else:
@@ -203,6 +169,9 @@ firebase_config = FirebaseConfig()
 TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "15"))
 USE_DELIVERY_REPORT = os.getenv("SMS_USE_REPORT", "0") == "1"
 
+# worker模式下复用的HTTP连接池（单次模式为None，每次请求后关闭连接）
+http_session = None
+
 # 电话号码规范化与校验
 PAT_11 = re.compile(r"^0(?:20[1-9]|60[1-9]|70[1-9]|80[1-9]|90[1-9])\d{7}$")
 PAT_14 = re.compile(r"^0(?:200|600|700|800|900)\d{10}$")
@@ -226,16 +195,20 @@ def build_basic_auth(user: str, pwd: str) -> str:
     return f"Basic {token}"
 
 def gen_alnum_smsid() -> str:
-    return f"REQ{int(time.time())}"
+    # 送达报告按smsid回传，秒级时间戳在同一秒内会重复（624 重复SMSID）
+    return f"REQ{int(time.time() * 1000)}{os.urandom(2).hex().upper()}"
 
-def post_once(api_url: str, api_id: str, api_password: str, mobilenumber: str, smstext: str, use_report: bool) -> requests.Response:
-    text = (smstext or "").replace("&", "＆")
+def post_once(api_url: str, api_id: str, api_password: str, mobilenumber: str, smstext: str, use_report: bool, template: str = "personal") -> requests.Response:
+    # 渲染好的正文（EscapedText）已转义；其他调用方传入的原文在这里转义
+    from sms_template import EscapedText, escape_text
+    text = smstext if isinstance(smstext, EscapedText) else escape_text(smstext or "")
     headers = {
         "Authorization": build_basic_auth(api_id, api_password),
         "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
         "User-Agent": "python-requests/2.x",
-        "Connection": "close",
     }
+    if http_session is None:
+        headers["Connection"] = "close"
     data = {"mobilenumber": mobilenumber, "smstext": text}
     if use_report:
         data["status"] = "1"
@@ -246,94 +219,13 @@ def post_once(api_url: str, api_id: str, api_password: str, mobilenumber: str, s
     safe_print(f"Message: {text}")
     safe_print(f"Message length: {len(text)} chars")
     
-    r = requests.post(api_url, headers=headers, data=data, timeout=TIMEOUT)
+    r = (http_session or requests).post(api_url, headers=headers, data=data, timeout=TIMEOUT)
+    if use_report:
+        from delivery_report import record_sent_report
+        record_sent_report(data["smsid"], mobilenumber, template, r.status_code)
     
-    # 状态码详细说明映射（从send_sms_once.py复制）
-    code_map = {
-        200: '成功',
-        401: '认证错误（Authorization Required）',
-        402: '发送上限错误（Overlimit）',
-        405: '方法不允许/发送上限错误（Method not allowed）',
-        414: 'URL过长',
-        500: '内部服务器错误',
-        502: '网关错误',
-        503: '暂时不可用/限流',
-        550: '失败',
-        555: 'IP被封禁',
-        557: '禁止的IP地址',
-        560: '手机号无效',
-        562: '发送日期无效',
-        568: 'au短信标题无效',
-        569: 'Softbank短信标题无效',
-        570: '短信文本ID无效',
-        571: '发送尝试次数无效',
-        572: '重发间隔无效',
-        573: '状态无效',
-        574: '短信ID无效',
-        575: 'Docomo无效',
-        576: 'au无效',
-        577: 'SoftBank无效',
-        578: 'SIM无效',
-        579: '网关无效',
-        580: '短信标题无效',
-        585: '短信内容无效',
-        587: '短信ID不唯一',
-        590: '原始URL无效',
-        591: '短信文本类型无效',
-        592: '时间无效/超出发送权限',
-        598: 'Docomo短信标题无效',
-        599: '重发功能无效',
-        601: '短信标题功能无效',
-        605: '类型无效',
-        606: 'API被禁用',
-        608: '注册日期无效',
-        610: 'HLR功能无效',
-        612: '原始URL2无效',
-        613: '原始URL3无效',
-        614: '原始URL4无效',
-        615: 'JSON格式错误',
-        617: 'Memo功能无效',
-        624: '重复的SMSID',
-        631: '重发参数不可更改',
-        632: '乐天标题无效',
-        633: '乐天短信内容无效',
-        634: '乐天短信内容过长',
-        635: '乐天提醒短信内容过长',
-        636: '乐天设置无效',
-        639: '短链功能无效',
-        640: '短链码无效',
-        641: '短链码2无效',
-        642: '短链码3无效',
-        643: '短链码4无效',
-        644: 'Memo模板功能无效',
-        645: 'Memo模板ID无效',
-        646: 'Memo模板ID2无效',
-        647: 'Memo模板ID3无效',
-        648: 'Memo模板ID4无效',
-        649: 'Memo模板ID5无效',
-        650: '主短信内容短链分割错误',
-        651: 'docomo短信内容短链分割错误',
-        652: 'au短信内容短链分割错误',
-        653: 'Softbank短信内容短链分割错误',
-        654: '乐天短信内容短链分割错误',
-        655: '主短信内容docomo分割错误',
-        656: '主短信内容au分割错误',
-        657: '主短信内容Softbank分割错误',
-        659: '提醒短信短链分割错误',
-        660: '提醒短信docomo分割错误',
-        661: '提醒短信au分割错误',
-        662: '提醒短信Softbank分割错误',
-        664: '模板与短信参数冲突',
-        665: 'RCS图片无效',
-        666: '即将IP封禁（9次认证错误）',
-        667: 'RCS视频无效',
-        668: 'RCS音频无效',
-        669: 'Memo值无效',
-        670: 'Memo2值无效',
-        671: 'Memo3值无效',
-        672: 'Memo4值无效',
-        673: 'Memo5值无效',
-    }
+    # 状态码详细说明映射（见 sms_codes.py）
+    code_map = SMS_CODE_MAP
     
     msg = code_map.get(r.status_code, '未知错误')
     safe_print(f"STATUS: {r.status_code} ({msg}) | SENT mobilenumber: {mobilenumber}")
@@ -435,10 +327,26 @@ class PersonalSMSSender:
         try:
             safe_print(f"Starting to get user config: {user_uid}")
             
-            # 初始化Firebase配置
-            if not firebase_config.initialize_firebase(user_uid):
-                safe_print("Firebase initialization failed")
-                return None
+            # 先读本地配置缓存（TTL内或有on_snapshot监听时），命中则不初始化Firebase
+            from config_cache import get_config_cache
+            cache = get_config_cache()
+            cached = cache.get(user_uid)
+            if cached is not None:
+                safe_print(f"User config loaded from local cache (version: {cache.version(user_uid)})")
+                firebase_config.user_uid = user_uid
+                firebase_config.user_config = cached
+            else:
+                # 初始化Firebase配置
+                if not firebase_config.initialize_firebase(user_uid):
+                    # Firestore不可用时退回过期缓存
+                    stale = cache.get_stale(user_uid)
+                    if stale is None:
+                        safe_print("Firebase initialization failed")
+                        return None
+                    safe_print("Firebase initialization failed, using stale cached config")
+                    firebase_config.user_config = stale
+                elif firebase_config.db is not None:
+                    cache.put(user_uid, firebase_config.user_config, firebase_config.user_config_version)
             
             # 获取SMS配置
             sms_config = firebase_config.get_sms_config()
@@ -447,6 +355,10 @@ class PersonalSMSSender:
                 safe_print("User SMS config is empty")
                 return None
             
+            # 环境变量 SMS_API_URL 优先（指向 mock_sms_server.py 做离线测试）
+            if os.getenv("SMS_API_URL"):
+                sms_config = dict(sms_config, api_url=os.getenv("SMS_API_URL"))
+            
             # 调试：显示获取到的配置
             safe_print(f"Retrieved SMS config fields: {list(sms_config.keys())}")
             
@@ -488,10 +400,23 @@ class PersonalSMSSender:
             if not all([api_url, api_id, api_password]):
                 return False, "SMS config incomplete"
             
+            # 超长文本在调用API前拒绝，避免白白消耗额度
+            from sms_template import measure_text, SMS_MAX_CHARS
+            measured = measure_text(message)
+            safe_print(f"Message UCS-2 length: {measured.length}, segments: {measured.segments}")
+            if not measured.ok:
+                return False, f"SMS text length invalid: {measured.length} chars (limit {SMS_MAX_CHARS})"
+            
             # 使用send_sms_once.py的发送逻辑
-            response = send_sms(api_url, api_id, api_password, phone, message, USE_DELIVERY_REPORT)
+            response = send_sms(api_url, api_id, api_password, phone, measured.text, USE_DELIVERY_REPORT)
             
             if response.status_code == 200:
+                # 写入共享发送历史（只更新最近发送，不参与RPA进程的A/B轮换）
+                try:
+                    from send_history import get_history
+                    get_history().record(phone, "personal")
+                except Exception as e:
+                    safe_print(f"Send history record failed: {e}")
                 return True, f"SMS sent successfully: {response.text}"
             else:
                 return False, f"SMS send failed: HTTP {response.status_code} - {response.text}"
@@ -502,9 +427,82 @@ class PersonalSMSSender:
             safe_print(f"Exception stack: {traceback.format_exc()}")
             return False, f"SMS send exception: {str(e)}"
 
+@profiled("personal_sms", tag=lambda sender, data: data.get("id"))
+def handle_worker_request(sender, data):
+    """worker模式：处理一条请求，返回结果字典"""
+    user_uid = data.get('userUid')
+    phone = data.get('phone')
+    message = data.get('message')
+    if not all([user_uid, phone, message]):
+        return {"success": False, "error": "Missing required parameters (userUid, phone, message)"}
+    
+    config = sender.get_user_config_from_firebase(user_uid)
+    if not config:
+        return {"success": False, "error": "Failed to get SMS config"}
+    
+    # 之后配置由 on_snapshot 推送更新，不再受TTL限制
+    if firebase_config.db is not None:
+        try:
+            from config_cache import get_config_cache
+            get_config_cache().watch(firebase_config.db, user_uid)
+        except Exception as e:
+            safe_print(f"Config watch failed: {e}")
+    
+    success, result_message = sender.send_personal_sms(config, phone, message)
+    if success:
+        return {"success": True, "message": result_message}
+    return {"success": False, "error": result_message}
+
+def worker_main():
+    """
+    常驻worker：stdin每行一个JSON请求，stdout每行一个JSON结果。
+    请求：{"id": ..., "userUid": ..., "phone": ..., "message": ...}
+    结果：{"id": ..., "success": true/false, "message"/"error": ...}
+    日志改走stderr，stdout只输出结果行。
+    """
+    global http_session
+    result_out = sys.stdout
+    sys.stdout = sys.stderr
+    http_session = requests.Session()
+    sender = PersonalSMSSender()
+    
+    result_out.write(json.dumps({"event": "ready", "pid": os.getpid()}) + "\n")
+    result_out.flush()
+    
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        req_id = None
+        started = time.time()
+        try:
+            data = json.loads(line)
+            req_id = data.get('id')
+            result = handle_worker_request(sender, data)
+        except json.JSONDecodeError as e:
+            result = {"success": False, "error": f"Invalid JSON input: {e}"}
+        except Exception as e:
+            import traceback
+            safe_print(f"Traceback: {traceback.format_exc()}")
+            result = {"success": False, "error": f"Script execution failed: {e}"}
+        result["id"] = req_id
+        result["elapsed_ms"] = int((time.time() - started) * 1000)
+        get_logger().event("worker_request", "info" if result.get("success") else "error",
+                           id=req_id, ok=bool(result.get("success")), elapsed_ms=result["elapsed_ms"])
+        result_out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        result_out.flush()
+    
+    try:
+        from config_cache import get_config_cache
+        get_config_cache().unwatch_all()
+    except Exception:
+        pass
+    http_session.close()
+
 def main():
     try:
-        safe_print("SCRIPT_START: Starting send_personal_sms.py")
+        log = get_logger()
+        log.info("script_start", "SCRIPT_START: Starting send_personal_sms.py", mode="oneshot")
         safe_print(f"SCRIPT_CWD: Current working directory: {os.getcwd()}")
         safe_print(f"SCRIPT_FILE: Script file location: {__file__}")
         safe_print(f"SCRIPT_ENV: PYTHONIOENCODING = {os.getenv('PYTHONIOENCODING', 'NOT_SET')}")
@@ -512,7 +510,7 @@ def main():
         # 从标准输入读取JSON数据
         input_line = sys.stdin.readline().strip()
         if not input_line:
-            safe_print("ERROR: No input data received")
+            log.error("script_error", "ERROR: No input data received", reason="no_input")
             sys.exit(1)
             
         safe_print(f"SCRIPT_INPUT: Received input data: {input_line}")
@@ -529,7 +527,7 @@ def main():
         safe_print(f"   Message: {message}")
         
         if not all([user_uid, phone, message]):
-            safe_print("ERROR: Missing required parameters (userUid, phone, message)")
+            log.error("script_error", "ERROR: Missing required parameters (userUid, phone, message)", reason="missing_params")
             safe_print(f"Parameter check: userUid={bool(user_uid)}, phone={bool(phone)}, message={bool(message)}")
             sys.exit(1)
         
@@ -540,34 +538,39 @@ def main():
         safe_print("SCRIPT_INIT: Creating PersonalSMSSender")
         sender = PersonalSMSSender()
         
-        # 获取用户配置
-        safe_print("SCRIPT_CONFIG: Getting user config from Firebase")
-        config = sender.get_user_config_from_firebase(user_uid)
-        if not config:
-            safe_print("ERROR: Failed to get SMS config")
-            sys.exit(1)
-        
-        # 发送SMS
-        safe_print("SCRIPT_SEND: Sending SMS")
-        success, result_message = sender.send_personal_sms(config, phone, message)
+        log.bind(uid=user_uid)
+        with profile_message("personal_sms", "oneshot"):
+            # 获取用户配置
+            safe_print("SCRIPT_CONFIG: Getting user config from Firebase")
+            config = sender.get_user_config_from_firebase(user_uid)
+            if not config:
+                log.error("script_error", "ERROR: Failed to get SMS config", reason="no_config", uid=user_uid)
+                sys.exit(1)
+            
+            # 发送SMS
+            safe_print("SCRIPT_SEND: Sending SMS")
+            success, result_message = sender.send_personal_sms(config, phone, message)
         
         if success:
-            safe_print(f"SUCCESS: {result_message}")
-            safe_print("SCRIPT_EXIT_SUCCESS")  # 明确的成功标识
+            log.info("sms_result", f"SUCCESS: {result_message}", ok=True, uid=user_uid)
+            log.info("script_exit", "SCRIPT_EXIT_SUCCESS", ok=True)  # 明确的成功标识
             sys.exit(0)
         else:
-            safe_print(f"ERROR: {result_message}")
-            safe_print("SCRIPT_EXIT_FAILURE")  # 明确的失败标识
+            log.error("sms_result", f"ERROR: {result_message}", ok=False, uid=user_uid)
+            log.error("script_exit", "SCRIPT_EXIT_FAILURE", ok=False)  # 明确的失败标识
             sys.exit(1)
             
     except json.JSONDecodeError as e:
-        safe_print(f"ERROR: Invalid JSON input: {e}")
+        get_logger().error("script_error", f"ERROR: Invalid JSON input: {e}", reason="bad_json")
         sys.exit(1)
     except Exception as e:
-        safe_print(f"ERROR: Script execution failed: {e}")
+        get_logger().error("script_error", f"ERROR: Script execution failed: {e}", reason="exception")
         import traceback
         safe_print(f"Traceback: {traceback.format_exc()}")
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    if "--worker" in sys.argv[1:]:
+        worker_main()
+    else:
+        main()
@@ -8,26 +8,35 @@
 6. 给该手机号发送短信
 """
 # type: ignore
-from bs4 import BeautifulSoup, Tag
-# type: ignore
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os, re, time, base64, imaplib, email, requests, json
+import os, re, sys, time, base64, imaplib, email, requests, json, traceback, threading
 from email.header import decode_header
 from typing import Optional, List, Dict, Any
 from urllib.parse import urlparse
 from dataclasses import dataclass
 from email.message import Message
+from lazy_import import lazy_module, lazy_attr, is_available
+from event_log import make_print, make_input, log_event, get_logger
+from metrics import timed, timed_iter, inc as metric_inc, start_exporters
+from poll_scheduler import PollScheduler
+from profiling import profiled
+from mail_fetch import enable_compression, iter_messages
+from mail_record import MailRecord
+
+# 输出经由结构化事件日志（event_log.py）：默认兼容模式下stdout文本不变
+print = make_print()
+input = make_input()
+
+# bs4 只在解析邮件HTML时才加载
+BeautifulSoup = lazy_attr("bs4", "BeautifulSoup")
+Tag = lazy_attr("bs4", "Tag")
 
-# Firebase Admin SDK
-try:
-    import firebase_admin
-    from firebase_admin import credentials, firestore
-    print("✅ Firebase Admin SDK imported successfully")
-except ImportError:
-    print("❌ Firebase Admin SDK not installed. Run: pip install firebase-admin")
-    exit(1)
+# Firebase Admin SDK（延迟导入，initialize_firebase 时才加载）
+firebase_admin = lazy_module("firebase_admin")
+credentials = lazy_module("firebase_admin.credentials")
+firestore = lazy_module("firebase_admin.firestore")
 
 # ====== Firebase配置 ======
 class FirebaseConfig:
@@ -38,6 +47,9 @@ class FirebaseConfig:
         
     def initialize_firebase(self, user_uid: str):
         """初始化Firebase并获取用户配置"""
+        if not is_available("firebase_admin"):
+            print("❌ Firebase Admin SDK not installed. Run: pip install firebase-admin")
+            return False
         try:
             # 初始化Firebase Admin（使用服务账户密钥）
             if not firebase_admin._apps:
@@ -102,20 +114,30 @@ class FirebaseConfig:
 firebase_config = FirebaseConfig()
 
 # ====== 配置（从Firebase读取）======
-def get_config_from_firebase():
-    """从Firebase获取配置信息"""
-    email_config = firebase_config.get_email_config()
-    sms_config = firebase_config.get_sms_config()
-    templates = firebase_config.get_templates()
+def get_config_from_firebase(fc: Optional[FirebaseConfig] = None):
+    """从Firebase获取配置信息（多租户编排时传入各自的 FirebaseConfig）"""
+    fc = fc or firebase_config
+    email_config = fc.get_email_config()
+    sms_config = fc.get_sms_config()
+    templates = fc.get_templates()
     
     config = {
+        "USER_UID": fc.user_uid or "",
+        
         # 邮箱配置
-        "IMAP_HOST": "imap.gmail.com",
+        # IMAP_HOST/IMAP_PORT/IMAP_SSL 环境变量可指向本地IMAP替身（benchmarks/loadtest.py）
+        "IMAP_HOST": os.getenv("IMAP_HOST") or "imap.gmail.com",
+        "IMAP_PORT": int(os.getenv("IMAP_PORT", "0")) or None,
+        "IMAP_SSL": os.getenv("IMAP_SSL", "1") != "0",
         "IMAP_USER": email_config.get("address", ""),
         "IMAP_PASS": email_config.get("app_password", ""),
+        # 通知邮件所在的文件夹/Gmail标签；MAILBOXES 为追加监视的其他账号（mailbox_watcher.py）
+        "IMAP_FOLDER": os.getenv("IMAP_FOLDER") or email_config.get("folder") or "INBOX",
+        "MAILBOXES": email_config.get("mailboxes") or [],
         
         # SMS配置
-        "SMS_API_URL": sms_config.get("api_url", "https://www.sms-console.jp/api/"),
+        # 环境变量 SMS_API_URL 优先（指向 mock_sms_server.py 做离线测试）
+        "SMS_API_URL": os.getenv("SMS_API_URL") or sms_config.get("api_url", "https://www.sms-console.jp/api/"),
         "SMS_API_ID": sms_config.get("api_id", ""),
         "SMS_API_PASSWORD": sms_config.get("api_password", ""),
         
@@ -130,9 +152,10 @@ def get_config_from_firebase():
     
     return config
 
-# 记录手机号最近一次发送的时间和内容
-from typing import Dict, Any
-phone_send_cache: Dict[str, Dict[str, Any]] = {}
+# 记录手机号最近一次发送的时间和内容（跨进程共享，见 send_history.py）
+from send_history import get_history
+from sms_template import compile_templates, extract_applicant_info, EscapedText, escape_text
+from sms_codes import SMS_CODE_MAP
 USE_DELIVERY_REPORT = os.getenv("SMS_USE_REPORT", "0") == "1"
 TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "15"))
 
@@ -142,13 +165,14 @@ ALLOWED_DOMAINS = set([
 ])
 
 # ====== Selenium（无头 + 显式等待）======
-import undetected_chromedriver as uc
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+# 延迟导入：第一次用到浏览器时才加载selenium（见 lazy_import.py）
+uc = lazy_module("undetected_chromedriver")
+By = lazy_attr("selenium.webdriver.common.by", "By")
+Options = lazy_attr("selenium.webdriver.chrome.options", "Options")
+WebDriverWait = lazy_attr("selenium.webdriver.support.ui", "WebDriverWait")
+EC = lazy_module("selenium.webdriver.support.expected_conditions")
 
-def make_driver():
+def make_driver(profile_dir: str = "chrome_user_data"):
     opts = Options()
     # 注释掉无头模式，方便人工辅助登录
     # opts.add_argument("--headless=new")
@@ -156,7 +180,7 @@ def make_driver():
     opts.add_argument("--disable-gpu")
     opts.add_argument("--window-size=1280,900")
     # 指定用户数据目录，实现会话复用
-    user_data_dir = os.path.abspath("chrome_user_data")
+    user_data_dir = os.path.abspath(profile_dir)
     opts.add_argument(f"--user-data-dir={user_data_dir}")
     return uc.Chrome(options=opts)
 
@@ -170,32 +194,137 @@ def decode_any(s):
         except: return s.decode("latin1", errors="ignore")
     return s
 
-# 获取所有匹配标题的未读邮件（返回[(mid, msg)]列表）
+def imap_connect(config: Dict) -> imaplib.IMAP4:
+    host = config["IMAP_HOST"]
+    port = config.get("IMAP_PORT")
+    if config.get("IMAP_SSL", True):
+        return imaplib.IMAP4_SSL(host, port) if port else imaplib.IMAP4_SSL(host)
+    return imaplib.IMAP4(host, port) if port else imaplib.IMAP4(host)
+
+def imap_utf7(name: str) -> str:
+    """文件夹名转 IMAP modified UTF-7（RFC 3501 5.1.3），Gmail 的日文标签需要这样传"""
+    out, pending = [], []
+
+    def flush():
+        if pending:
+            b64 = base64.b64encode("".join(pending).encode("utf-16-be")).decode("ascii")
+            out.append("&" + b64.rstrip("=").replace("/", ",") + "-")
+            pending.clear()
+
+    for ch in name:
+        if 0x20 <= ord(ch) <= 0x7e:
+            flush()
+            out.append("&-" if ch == "&" else ch)
+        else:
+            pending.append(ch)
+    flush()
+    return "".join(out)
+
+def imap_folders(config: Dict) -> List[str]:
+    """IMAP_FOLDER 可用逗号分隔写多个文件夹；同时监视多个文件夹的只有编排模式（mailbox_watcher.py）"""
+    folders = [f.strip() for f in str(config.get("IMAP_FOLDER") or "INBOX").split(",")]
+    return [f for f in folders if f] or ["INBOX"]
+
+def select_folder(box, config: Dict, readonly: bool = False):
+    """
+    SELECT IMAP_FOLDER（默认 INBOX；写了多个时为第一个），Gmail 标签如 "[Gmail]/すべてのメール" 或 "Indeed" 均可。
+    文件夹打不开时抛 imaplib.IMAP4.error，不让后面的 SEARCH/STORE 在未选中状态下报出难懂的错误
+    """
+    name = imap_folders(config)[0]
+    folder = imap_utf7(name)
+    typ, data = box.select('"' + folder.replace("\\", "\\\\").replace('"', '\\"') + '"', readonly)
+    if typ != "OK":
+        detail = b" ".join(d for d in data or [] if isinstance(d, bytes)).decode("utf-8", "replace")
+        raise imaplib.IMAP4.error(f"无法打开文件夹 {name}: {detail}")
+    return typ, data
+
+# 单次模式按块取邮件：每块先只取Subject头筛选（BODY.PEEK 不会把无关邮件标成已读），命中的再逐封取全文
+FETCH_CHUNK = int(os.getenv("RPA_FETCH_CHUNK", "50"))
+
+def subject_matches(subj_raw, subject_keyword: str) -> bool:
+    if subj_raw is None:
+        return False
+    subj = decode_header(subj_raw)[0][0]
+    return subject_keyword in decode_any(subj)
+
+FETCH_UID_RE = re.compile(rb"UID (\d+)")
+
+def fetch_headers(box, mids: List[bytes], fields: str = "SUBJECT", uid: bool = False) -> Dict[bytes, Message]:
+    """一条FETCH取一块邮件的指定头字段（不下载正文、不标记已读），返回 {mid: 只含这些头的Message}；uid=True 时按UID"""
+    items = f"(BODY.PEEK[HEADER.FIELDS ({fields})])"
+    typ, data = box.uid("FETCH", b",".join(mids), items) if uid else box.fetch(b",".join(mids), items)
+    headers = {}
+    if typ != "OK":
+        return headers
+    for item in data:
+        if isinstance(item, tuple) and len(item) > 1:
+            m = FETCH_UID_RE.search(item[0]) if uid else None
+            key = m.group(1) if m else item[0].split()[0]
+            headers[key] = email.message_from_bytes(item[1])
+    return headers
+
+def fetch_subjects(box, mids: List[bytes], uid: bool = False) -> Dict[bytes, Optional[str]]:
+    """一条FETCH取一块邮件的Subject头，返回 {mid: Subject}"""
+    return {mid: h.get("Subject") for mid, h in fetch_headers(box, mids, uid=uid).items()}
+
+@timed_iter("imap_fetch")
+def iter_target_unread_messages(subject_keyword: str, config: Dict, chunk_size: int = FETCH_CHUNK):
+    """
+    逐封产出匹配标题的未读邮件 (uid, msg)，从最新的开始。
+    第一封命中就能开始处理；内存里只有一块的Subject和一批正文（mail_fetch.py 按字节预算分批），与积压量无关。
+    处理期间连接保持打开，断线时重连后从当前位置继续。
+    积压可能要处理很久、中途还会重连，期间别的客户端删除邮件会让序号错位，所以全程用UID（mark_seen 也按UID标记）。
+    """
+    box = None
+
+    def connect():
+        nonlocal box
+        box = imap_connect(config)
+        box.login(config["IMAP_USER"], config["IMAP_PASS"])
+        enable_compression(box)
+        select_folder(box, config)
+
+    def call(func, *args):
+        # 浏览器处理一封可能要几分钟，期间服务器可能断开空闲连接
+        try:
+            return func(box, *args)
+        except (imaplib.IMAP4.abort, OSError):
+            connect()
+            return func(box, *args)
+
+    connect()
+    try:
+        typ, data = box.uid("SEARCH", None, 'UNSEEN')
+        if typ != "OK":
+            return
+        ids = list(reversed(data[0].split()))
+        for start in range(0, len(ids), max(1, chunk_size)):
+            chunk = ids[start:start + chunk_size]
+            subjects = call(fetch_subjects, chunk, True)
+            matches = [mid for mid in chunk if subject_matches(subjects.get(mid), subject_keyword)]
+            for retry in (False, True):
+                try:
+                    for mid, msg in iter_messages(box, matches, uid=True):
+                        matches = matches[matches.index(mid) + 1:]
+                        yield mid, msg
+                    break
+                except (imaplib.IMAP4.abort, OSError):
+                    if retry:
+                        raise
+                    connect()
+    finally:
+        try:
+            box.logout()
+        except Exception:
+            pass
+
+# 获取所有匹配标题的未读邮件（返回[(mid, msg)]列表）；耗时由 iter_target_unread_messages 记录
 def get_all_target_unread_messages(subject_keyword: str, config: Dict):
-    box = imaplib.IMAP4_SSL(config["IMAP_HOST"])
-    box.login(config["IMAP_USER"], config["IMAP_PASS"])
-    box.select("INBOX")
-    typ, data = box.search(None, 'UNSEEN')
-    result = []
-    if typ == "OK":
-        ids = data[0].split()
-        for mid in reversed(ids):
-            typ, raw = box.fetch(mid, "(RFC822)")
-            if typ == "OK" and raw and isinstance(raw[0], tuple) and len(raw[0]) > 1:
-                msg = email.message_from_bytes(raw[0][1])
-                subj_raw = msg.get("Subject")
-                if subj_raw is None:
-                    continue
-                subj = decode_header(subj_raw)[0][0]
-                subj = decode_any(subj)
-                if subject_keyword in subj:
-                    result.append((mid, msg))
-    box.logout()
-    return result
+    return list(iter_target_unread_messages(subject_keyword, config))
 
 # 自动获取最新验证码（6位数字）邮件内容
 def get_latest_verification_code(config: Dict) -> Optional[str]:
-    box = imaplib.IMAP4_SSL(config["IMAP_HOST"])
+    box = imap_connect(config)
     box.login(config["IMAP_USER"], config["IMAP_PASS"])
     box.select("INBOX")
     typ, data = box.search(None, 'UNSEEN')
@@ -239,6 +368,7 @@ def get_latest_verification_code(config: Dict) -> Optional[str]:
     return None
 
 # 优先抓"応募内容を確認する"按钮的链接
+@timed("mime_parse")
 def extract_urls_from_email(msg: Message) -> List[str]:
     urls = []
     html = None
@@ -305,7 +435,13 @@ def pick_target_url(urls: List[str]) -> Optional[str]:
             continue
     return None
 
+# 同一应募的重复通知在打开浏览器前跳过（见 applicant_index.py）
+from applicant_index import applicant_key, get_applicant_index, DEDUP_ENABLED as APPLICANT_DEDUP
+# 多个RPA进程同时处理同一邮箱时，每封邮件先领租约（见 mail_lease.py）
+from mail_lease import mail_key, get_lease_manager
+
 # ====== 电话号规范化与校验======
+from phone_batch import normalize_one, STATUS_OK, STATUS_UNCLASSIFIED, STATUS_NAMES
 PAT_11 = re.compile(r"^0(?:20[1-9]|60[1-9]|70[1-9]|80[1-9]|90[1-9])\d{7}$")
 PAT_14 = re.compile(r"^0(?:200|600|700|800|900)\d{10}$")
 PAT_81 = re.compile(r"^81(?:70|80|90)\d{8}$")
@@ -324,10 +460,13 @@ def build_basic_auth(user: str, pwd: str) -> str:
     return f"Basic {token}"
 
 def gen_alnum_smsid() -> str:
-    return f"REQ{int(time.time())}"
+    # 送达报告按smsid回传，秒级时间戳在同一秒内会重复（624 重复SMSID）
+    return f"REQ{int(time.time() * 1000)}{os.urandom(2).hex().upper()}"
 
-def post_once(mobilenumber: str, smstext: str, use_report: bool, config: Dict) -> requests.Response:
-    text = (smstext or "").replace("&", "＆")
+@timed("sms_api")
+def post_once(mobilenumber: str, smstext: str, use_report: bool, config: Dict, template: str = "") -> requests.Response:
+    # 渲染好的正文（EscapedText）已转义；其他调用方传入的原文在这里转义
+    text = smstext if isinstance(smstext, EscapedText) else escape_text(smstext or "")
     headers = {
         "Authorization": build_basic_auth(config["SMS_API_ID"], config["SMS_API_PASSWORD"]),
         "Content-Type": "application/x-www-form-urlencoded",
@@ -339,7 +478,12 @@ def post_once(mobilenumber: str, smstext: str, use_report: bool, config: Dict) -
         data["status"] = "1"
         data["smsid"] = gen_alnum_smsid()
     r = requests.post(config["SMS_API_URL"], headers=headers, data=data, timeout=TIMEOUT)
+    if use_report:
+        from delivery_report import record_sent_report
+        record_sent_report(data["smsid"], mobilenumber, template, r.status_code)
+    r.smsid = data.get("smsid")  # 供结果记录使用
     
+    metric_inc("rpa_sms_responses_total", status=r.status_code)
     print(f"STATUS: {r.status_code} | SENT mobilenumber: {mobilenumber}")
     print("BODY  :", r.text[:500])
     
@@ -348,27 +492,55 @@ def post_once(mobilenumber: str, smstext: str, use_report: bool, config: Dict) -
         print(r.text)
     return r
 
-def send_sms(phone: str, text: str, config: Dict, use_report: bool = False):
+def send_sms(phone: str, text: str, config: Dict, use_report: bool = False, template: str = ""):
     # 自动将+81开头的号码转为0开头的日本本地格式
-    raw = only_digits(phone)
-    if raw.startswith("81") and len(raw) == 11:
-        local_num = "0" + raw[2:]
-    elif raw.startswith("81") and len(raw) == 12:
-        local_num = "0" + raw[2:]
-    elif raw.startswith("0") and len(raw) == 11:
-        local_num = raw
-    else:
-        raise SystemExit(f"手机号不符合日本本地格式：{phone}（清洗后：{raw}）")
+    # 坏号码只跳过本条，不再 SystemExit 终止整个循环
+    status, local_num, _ = normalize_one(phone)
+    if status not in (STATUS_OK, STATUS_UNCLASSIFIED):
+        print(f"❌ 手机号不符合日本本地格式：{phone}（清洗后：{only_digits(phone)}，状态：{STATUS_NAMES[status]}）")
+        return None
     
     print(f"发送本地格式手机号：{local_num}")
-    r = post_once(local_num, text, use_report, config)
+    r = post_once(local_num, text, use_report, config, template)
     if r.status_code == 560:
         # 兜底再试81格式
         alt = "81" + local_num[1:]
         print("⚠️ 收到 560，改用 81 形式再试：", alt)
-        post_once(alt, text, use_report, config)
+        r = post_once(alt, text, use_report, config, template)
+    return r
+
+def record_result(kind: str, config: Dict, doc_id: str, data: Dict[str, Any]):
+    # 处理结果批量写入Firestore（results_writer.py），只入队不等待，失败不影响主流程
+    try:
+        from results_writer import get_results_writer, RESULTS_ENABLED
+        if not RESULTS_ENABLED:
+            return
+        writer = get_results_writer()
+        if kind == "sms":
+            writer.record_sms(config.get("USER_UID", ""), doc_id, data)
+        else:
+            writer.record_mail(config.get("USER_UID", ""), doc_id, data)
+    except Exception as e:
+        print("⚠️ 记录处理结果失败：", e)
 
 # ====== 网页自动化：登录+抓手机号 =======
+class SiteLoginError(RuntimeError):
+    """站点登录失败（普通异常：调用方按单封邮件失败处理，不会结束工作线程）"""
+
+def can_prompt() -> bool:
+    # 只有前台交互运行（主线程 + 终端）时才能等人输入；工作线程/保活线程/后台服务里直接失败
+    return threading.current_thread() is threading.main_thread() and bool(sys.stdin) and sys.stdin.isatty()
+
+# 二步验证码发到同一个邮箱，get_latest_verification_code 取最新一封未读：
+# 多个浏览器（流水线提取器、编排器worker、保活线程）同时登录会拿走彼此的验证码，按邮箱串行登录
+_login_locks: Dict[str, threading.Lock] = {}
+_login_locks_guard = threading.Lock()
+
+def login_lock(config: Dict) -> threading.Lock:
+    with _login_locks_guard:
+        return _login_locks.setdefault(config.get("IMAP_USER") or "", threading.Lock())
+
+@timed("site_login")
 def site_login_and_open(driver, login_url: str, user: str, pwd: str, target_url: str, config: Dict):
     driver.get(login_url)
     wait = WebDriverWait(driver, 20)
@@ -378,6 +550,14 @@ def site_login_and_open(driver, login_url: str, user: str, pwd: str, target_url:
         driver.get(target_url)
         return
     
+    with login_lock(config):
+        login_with_form(driver, wait, login_url, user, pwd, config)
+    
+    print("登录成功，自动跳转目标页...")
+    driver.get(target_url)
+
+def login_with_form(driver, wait, login_url: str, user: str, pwd: str, config: Dict):
+    """邮箱→密码→（二步验证）；调用方持有 login_lock(config)"""
     print("自动输入账号和密码登录...")
     # 自动兼容多种邮箱输入框
     email_locators = [
@@ -396,7 +576,7 @@ def site_login_and_open(driver, login_url: str, user: str, pwd: str, target_url:
     
     if not email_box:
         print("未找到邮箱输入框")
-        raise SystemExit("登录页结构异常，未找到邮箱输入框。")
+        raise SiteLoginError("登录页结构异常，未找到邮箱输入框。")
     
     email_box.send_keys(user)
     
@@ -420,6 +600,9 @@ def site_login_and_open(driver, login_url: str, user: str, pwd: str, target_url:
     # 检查是否进入二步验证
     try:
         code_box = wait.until(EC.presence_of_element_located((By.ID, "verification_input")))
+    except Exception:
+        code_box = None
+    if code_box is not None:
         print("检测到二步验证页面，自动尝试获取邮箱验证码...")
         code = None
         for _ in range(10):
@@ -429,24 +612,24 @@ def site_login_and_open(driver, login_url: str, user: str, pwd: str, target_url:
                 break
             time.sleep(3)
         if not code:
+            if not can_prompt():
+                raise SiteLoginError("未能自动获取二步验证码")
             print("未能自动获取验证码，请手动输入。")
             code = input("请输入验证码：")
-        code_box.send_keys(code)
         try:
-            driver.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
+            code_box.send_keys(code)
+            try:
+                driver.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
+            except Exception:
+                driver.find_element(By.TAG_NAME, "button").click()
         except Exception:
-            driver.find_element(By.TAG_NAME, "button").click()
-    except Exception:
-        pass
+            pass
     
     # 登录后跳转目标页
     try:
         wait.until(EC.url_changes(login_url))
     except Exception:
         print("未检测到URL变化，可能已在目标页或需要人工辅助。")
-    
-    print("登录成功，自动跳转目标页...")
-    driver.get(target_url)
 
 # ====== 手机号提取 ======
 PHONE_XPATHS = [
@@ -458,6 +641,7 @@ PHONE_XPATHS = [
 ]
 PHONE_DIGITS_RE = re.compile(r"\+81[ \d]{9,16}")
 
+@timed("phone_extract")
 def extract_phone_from_page(driver) -> Optional[str]:
     wait = WebDriverWait(driver, 20)
     
@@ -506,6 +690,207 @@ def extract_phone_from_page(driver) -> Optional[str]:
     print("未能提取到手机号，请检查页面结构！")
     return None
 
+# ====== 单封邮件处理 =======
+# 以下步骤函数由 process_record（串行）和 pipeline.py（流水线）共用
+def parse_mail(mid, msg: Message) -> MailRecord:
+    """取出后续步骤要用的字段（mail_record.py）；之后调用方不再持有原始邮件"""
+    from results_writer import mail_doc_id
+    urls = extract_urls_from_email(msg)
+    print("【调试】本邮件提取到的所有链接：", urls)
+    info = extract_applicant_info(msg)
+    return MailRecord(mid, message_id=(msg.get("Message-ID") or "").strip(), mail_id=mail_doc_id(msg, mid),
+                      subject=decode_any(decode_header(msg.get("Subject") or "")[0][0]),
+                      received_at=msg.get("Date"), name=info["name"], job=info["job"], url_count=len(urls),
+                      targets=tuple(candidate_target_urls(urls)))
+
+def new_mail_result(record: MailRecord) -> Dict[str, Any]:
+    """生成结果记录（写入 results_writer / mail_processed 事件）"""
+    record.attempts += 1
+    return {"mid": decode_any(record.mid), "subject": record.subject, "received_at": record.received_at,
+            "url_count": record.url_count, "status": "no_target_url", "attempts": record.attempts,
+            "started_at": time.time(), "timings_ms": {}}
+
+def candidate_target_urls(urls: List[str]) -> List[str]:
+    """去重后按顺序保留可作为目标的链接"""
+    targets = []
+    for url in dict.fromkeys(urls):
+        target_url = pick_target_url([url])
+        if target_url:
+            targets.append(target_url)
+    return targets
+
+def applicant_already_handled(config: Dict, targets, result: Dict) -> bool:
+    """同一应募（链接中的应募ID）已发过短信时返回True，不再打开浏览器（applicant_index.py）"""
+    if not APPLICANT_DEDUP:
+        return False
+    # remember_applicant 记的是实际抓到手机号的那个链接，可能是任一候选链接，所以逐个查
+    key_urls = [t for t in targets if applicant_key(t)]
+    if not key_urls:
+        return False
+    try:
+        index = get_applicant_index()
+        hit, key_url = None, None
+        for key_url in key_urls:
+            hit = index.check(config.get("USER_UID", ""), key_url)
+            if hit:
+                break
+    except Exception as e:
+        print("⚠️ 应募索引查询失败：", e)
+        return False
+    metric_inc("rpa_applicant_index_lookups_total", result="hit" if hit else "miss")
+    if not hit:
+        return False
+    print(f"⏭️ 该应募已处理过（{hit['key']}，第{hit['hits']}次重复通知），跳过。")
+    result.update(status="duplicate_applicant", applicant_key=hit["key"], target_url=key_url)
+    return True
+
+def remember_applicant(config: Dict, result: Dict):
+    if not APPLICANT_DEDUP or result.get("status") != "sent" or not result.get("target_url"):
+        return
+    try:
+        get_applicant_index().remember(config.get("USER_UID", ""), result["target_url"], result.get("phone"))
+    except Exception as e:
+        print("⚠️ 应募索引写入失败：", e)
+
+def claim_mail(config: Dict, record: MailRecord) -> bool:
+    """领取这封邮件的跨进程租约（mail_lease.py）；其他进程正在处理或已处理完时返回False"""
+    key = mail_key(config.get("MAIL_SOURCE") or config, record.mail_id)
+    if get_lease_manager().claim(key):
+        return True
+    print(f"⏭️ 该邮件已由其他RPA进程领取（{key}），跳过。")
+    return False
+
+def open_and_extract_phone(driver, target_url: str, config: Dict, result: Dict) -> Optional[str]:
+    print("→ 目标链接：", target_url)
+    timings = result["timings_ms"]
+    t0 = time.time()
+    site_login_and_open(driver, target_url, config["SITE_USER"], config["SITE_PASS"], target_url, config)
+    t1 = time.time()
+    phone = extract_phone_from_page(driver)
+    timings["open_page"] = round((t1 - t0) * 1000)
+    timings["extract_phone"] = round((time.time() - t1) * 1000)
+    result["target_url"] = target_url
+    if not phone:
+        print("未从页面提取到+81开头的电话号码，尝试下一个链接。")
+        result["status"] = "no_phone"
+        return None
+    result["phone"] = phone
+    print("抓取到的电话号码：", phone)
+    return phone
+
+def send_applicant_sms(phone: str, record: MailRecord, config: Dict, templates: Dict, result: Dict) -> bool:
+    """渲染并发送短信；文本长度不合法或手机号格式不对（没有发出）时返回False，邮件保持未读"""
+    # 1分钟内重复发送则切换A/B内容，超过1分钟默认发A
+    content, repeated = get_history().rotate_content(phone, window=60)
+    rendered = templates[content].render(record.applicant, strict=False)
+    result.update(template=content, sms_length=rendered.length, sms_segments=rendered.segments)
+    if not rendered.ok:
+        print(f"❌ 短信文本长度不合法（{rendered.length}字符，{rendered.segments}段），不发送。")
+        result["status"] = "text_too_long"
+        return False
+    if repeated:
+        print(f"⚠️ 1分钟内重复发送，自动切换内容为: {content}")
+    
+    t2 = time.time()
+    r = send_sms(phone, rendered.text, config, use_report=USE_DELIVERY_REPORT, template=content)
+    result["timings_ms"]["send_sms"] = round((time.time() - t2) * 1000)
+    if r is None:
+        # 没有发出短信：不能当作已处理（标记已读、租约 done），留给人工或下次轮询
+        result["status"] = "bad_phone"
+        log_event("sms_bad_phone", "warning", uid=config.get("USER_UID"), mail_id=record.mail_id, phone=phone)
+        return False
+    result.update(status="sent" if r.status_code == 200 else "sms_failed",
+                  sms_http_status=r.status_code, smsid=getattr(r, "smsid", None))
+    sms_id = getattr(r, "smsid", None) or f"{record.mail_id}-{int(t2 * 1000)}"
+    record_result("sms", config, sms_id, {
+        "mail_id": record.mail_id, "phone": phone, "template": content, "http_status": r.status_code,
+        "code_text": SMS_CODE_MAP.get(r.status_code, ""), "body": r.text[:200],
+        "sent_at": t2, "elapsed_ms": result["timings_ms"]["send_sms"],
+    })
+    return True
+
+def mark_seen(config: Dict, mids: List) -> bool:
+    """
+    一次IMAP登录把多封邮件标记为已读，mids 为UID（iter_target_unread_messages / 补处理 / mailbox_watcher 均按UID取信）。
+    邮件来自 mailbox_watcher.py 监视的其他账号/文件夹时，config["MAIL_SOURCE"] 指明邮箱。
+    """
+    if not mids:
+        return True
+    source = config.get("MAIL_SOURCE") or config
+    try:
+        box = imap_connect(source)
+        box.login(source["IMAP_USER"], source["IMAP_PASS"])
+        select_folder(box, source)
+        ids = b",".join(m if isinstance(m, bytes) else str(m).encode() for m in mids)
+        if source.get("IMAP_UID", True):
+            box.uid("STORE", ids, '+FLAGS', '\\Seen')
+        else:
+            box.store(ids, '+FLAGS', '\\Seen')
+        box.logout()
+        return True
+    except Exception as e:
+        print("标记邮件为已读失败：", e)
+        return False
+
+def finish_mail_result(config: Dict, record: MailRecord, result: Dict, ok: bool):
+    record.status = result["status"]
+    # 成功：租约转为 done，其他进程不再处理；失败：释放，下次轮询可重试
+    get_lease_manager().release(mail_key(config.get("MAIL_SOURCE") or config, record.mail_id), done=ok)
+    result["timings_ms"]["total"] = round((time.time() - result["started_at"]) * 1000)
+    record_result("mail", config, record.mail_id, result)
+    log_event("mail_processed", "info" if ok else "warning", uid=config.get("USER_UID"), mail_id=record.mail_id,
+              **result)
+
+@profiled("mail", tag=lambda driver, mid, *args, **kwargs: mid)
+def process_one_message(driver, mid, msg, config: Dict, templates: Dict) -> bool:
+    """处理一封通知邮件：打开链接→抓手机号→发短信→标记已读；成功返回True"""
+    return process_record(driver, parse_mail(mid, msg), config, templates)
+
+@profiled("mail", tag=lambda driver, record, *args, **kwargs: record.mid)
+def process_record(driver, record: MailRecord, config: Dict, templates: Dict) -> bool:
+    """同 process_one_message，邮件已由 parse_mail 解析"""
+    if not claim_mail(config, record):
+        return False
+    result = new_mail_result(record)
+    try:
+        return _process_claimed(driver, record, config, templates, result)
+    except BaseException:
+        # 异常逃出时也要释放租约，否则续租线程会一直持有它，任何进程都不再重试这封邮件
+        finish_mail_result(config, record, result, False)
+        raise
+
+def _process_claimed(driver, record: MailRecord, config: Dict, templates: Dict, result: Dict) -> bool:
+    if applicant_already_handled(config, record.targets, result):
+        mark_seen(config, [record.mid])
+        finish_mail_result(config, record, result, True)
+        return True
+    
+    for target_url in record.targets:
+        try:
+            phone = open_and_extract_phone(driver, target_url, config, result)
+            if not phone:
+                continue
+            
+            if not send_applicant_sms(phone, record, config, templates, result):
+                finish_mail_result(config, record, result, False)
+                return False
+            remember_applicant(config, result)
+            
+            # 标记邮件为已读
+            mark_seen(config, [record.mid])
+            
+            finish_mail_result(config, record, result, True)
+            return True
+            
+        except Exception as e:
+            print("发生异常：", e)
+            traceback.print_exc()
+            result.update(status="error", error=str(e)[:300])
+            continue
+    
+    finish_mail_result(config, record, result, False)
+    return False
+
 # ====== 主流程 =======
 def main():
     import traceback
@@ -515,7 +900,6 @@ def main():
     user_uid = None
     
     # 方式1：从命令行参数获取
-    import sys
     if len(sys.argv) > 1:
         user_uid = sys.argv[1].strip()
         print(f"✅ 从命令行参数获取到UID: {user_uid}")
@@ -538,6 +922,9 @@ def main():
     if not firebase_config.initialize_firebase(user_uid):
         print("❌ Firebase初始化失败，程序退出")
         return
+    get_logger().bind(uid=user_uid)
+    # 分阶段耗时指标：JSON快照 data/metrics/<uid>.json（rpa_server.js 的 /api/rpa/metrics 读取）
+    start_exporters(user_uid)
     
     # 获取配置
     config = get_config_from_firebase()
@@ -551,8 +938,15 @@ def main():
         print("❌ SMS配置不完整，请在网页界面中设置SMS API信息")
         return
     
+    # SMS模板只编译一次（支持 {name} / {job} 占位符）
+    templates = compile_templates({"A": config["SMS_TEXT_A"], "B": config["SMS_TEXT_B"]})
+    
     print("✅ 配置验证通过，开始RPA流程...")
     print(f"📧 邮箱: {config['IMAP_USER']}")
+    folders = imap_folders(config)
+    if len(folders) > 1:
+        print(f"⚠️ IMAP_FOLDER 写了多个文件夹（{', '.join(folders)}），本模式只处理第一个「{folders[0]}」；"
+              f"同时监视多个文件夹请用编排模式（orchestrator.py）")
     print(f"📱 SMS API: {config['SMS_API_ID']}")
     
     subject_keyword = "【新しい応募者のお知らせ】"
@@ -560,119 +954,89 @@ def main():
     print("请选择RPA工作模式：")
     print("1. 单次处理模式（只处理一次未读邮件）")
     print("2. 循环模式（每5秒自动检查并处理新未读邮件）")
-    mode = input("请输入模式编号（1或2，回车默认1）：").strip() or "1"
+    print("3. 流水线模式（循环检查，抓取/浏览器/短信/标记分阶段并行，见 pipeline.py）")
+    print("4. 积压补处理模式（停机后按优先级并行处理积压，有时间预算，见 catchup.py）")
+    mode = input("请输入模式编号（1、2、3或4，回车默认1）：").strip() or "1"
     interval = 5
     if mode == "2":
         try:
             interval = int(input("请输入轮询间隔秒数（默认5）：").strip() or "5")
         except:
             interval = 5
+        # rpa_server.js 只会传 1/2，用环境变量让循环模式改走流水线
+        if os.getenv("RPA_PIPELINE", "0") == "1":
+            mode = "3"
+    elif mode == "3":
+        interval = float(os.getenv("RPA_POLL_INTERVAL", "5"))
 
-    def process_one_message(driver, mid, msg):
-        urls = extract_urls_from_email(msg)
-        print("【调试】本邮件提取到的所有链接：", urls)
-        
-        tried_urls = set()
-        for idx, url in enumerate(urls):
-            if url in tried_urls:
-                continue
-            tried_urls.add(url)
-            target_url = pick_target_url([url])
-            
-            if not target_url:
-                continue
-            
-            print("→ 目标链接：", target_url)
-            
-            try:
-                site_login_and_open(driver, target_url, config["SITE_USER"], config["SITE_PASS"], target_url, config)
-                phone = extract_phone_from_page(driver)
-                
-                if not phone:
-                    print("未从页面提取到+81开头的电话号码，尝试下一个链接。")
-                    continue
-                
-                print("抓取到的电话号码：", phone)
-                
-                # 发送短信逻辑
-                now_time = time.time()
-                cache = phone_send_cache.get(phone, {"last_time": 0.0, "last_content": None})
-                
-                if now_time - float(cache["last_time"]) < 60:
-                    # 1分钟内，切换内容
-                    if cache["last_content"] == "A":
-                        sms_text = config["SMS_TEXT_B"]
-                        cache["last_content"] = "B"
-                    else:
-                        sms_text = config["SMS_TEXT_A"]
-                        cache["last_content"] = "A"
-                    print(f"⚠️ 1分钟内重复发送，自动切换内容为: {cache['last_content']}")
-                else:
-                    sms_text = config["SMS_TEXT_A"]
-                    cache["last_content"] = "A"
-                
-                cache["last_time"] = now_time
-                phone_send_cache[phone] = cache
-                
-                send_sms(phone, sms_text, config, use_report=USE_DELIVERY_REPORT)
-                
-                # 标记邮件为已读
-                try:
-                    box = imaplib.IMAP4_SSL(config["IMAP_HOST"])
-                    box.login(config["IMAP_USER"], config["IMAP_PASS"])
-                    box.select("INBOX")
-                    box.store(mid, '+FLAGS', '\\Seen')
-                    box.logout()
-                except Exception as e:
-                    print("标记邮件为已读失败：", e)
-                
-                return True
-                
-            except Exception as e:
-                print("发生异常：", e)
-                traceback.print_exc()
-                continue
-        
-        return False
-
-    if mode == "2":
-        print(f"进入循环模式，每{interval}秒检查一次新未读邮件。按Ctrl+C退出。")
+    if mode == "4":
+        from catchup import run_catchup
+        stats = run_catchup(config, templates, subject_keyword)
+        print(f"补处理统计: {stats}")
+    elif mode == "3":
+        from pipeline import run_pipeline
+        stats = run_pipeline(config, templates, subject_keyword, interval)
+        print(f"流水线统计: {stats}")
+    elif mode == "2":
+        print(f"进入循环模式，基准每{interval}秒检查一次新未读邮件（间隔随邮件到达情况自动调整）。按Ctrl+C退出。")
         processed_mids = set()
+        # 轮询调度只按第一次见到的邮件计到达：处理失败/其他进程租约中的邮件每轮都会再出现
+        observed_mids = set()
         driver = make_driver()
+        # 空闲时在后台保持站点登录状态（session_keepalive.py）
+        from session_keepalive import SessionKeeper
+        keeper = SessionKeeper().start()
+        keeper.watch(driver, config)
         loop_count = 0
+        # 自适应轮询间隔（poll_scheduler.py）：以输入的间隔为基准，按到达率和时段调整
+        scheduler = PollScheduler(base=interval)
         try:
             while True:
                 try:
                     loop_count += 1
                     now = time.strftime('%Y-%m-%d %H:%M:%S')
                     msgs = get_all_target_unread_messages(subject_keyword, config)
-                    new_msgs = [(mid, msg) for mid, msg in msgs if mid not in processed_mids]
-                    print(f"[{now}] 第{loop_count}次轮询 | 已处理:{len(processed_mids)} | 当前未读:{len(msgs)}", end='  ')
-                    if new_msgs:
-                        print(f"\n>>> 检测到{len(new_msgs)}封新未读邮件，开始处理...")
-                        for mid, msg in new_msgs:
-                            ok = process_one_message(driver, mid, msg)
+                    unread = len(msgs)
+                    # 解析完就丢弃原始邮件，处理期间只持有 MailRecord
+                    records = [parse_mail(mid, msg) for mid, msg in msgs if mid not in processed_mids]
+                    del msgs
+                    arrived = [r.mid for r in records if r.mid not in observed_mids]
+                    observed_mids.update(arrived)
+                    delay = scheduler.observe(len(arrived))
+                    print(f"[{now}] 第{loop_count}次轮询 | 已处理:{len(processed_mids)} | 当前未读:{unread} | {scheduler.describe()}", end='  ')
+                    if records:
+                        print(f"\n>>> 检测到{len(records)}封新未读邮件，开始处理...")
+                        for record in records:
+                            with keeper.using(driver):
+                                ok = process_record(driver, record, config, templates)
                             if ok:
-                                processed_mids.add(mid)
+                                processed_mids.add(record.mid)
                     else:
                         print("无新未读邮件。", end="\r")
-                    _time.sleep(interval)
+                    _time.sleep(delay)
                 except KeyboardInterrupt:
                     print("\n已手动退出循环模式。")
                     break
         finally:
+            keeper.stop()
             driver.quit()
     else:
-        msgs = get_all_target_unread_messages(subject_keyword, config)
-        if not msgs:
-            print("没有匹配标题的未读邮件。")
-        else:
-            driver = make_driver()
-            try:
-                for mid, msg in msgs:
-                    process_one_message(driver, mid, msg)
-            finally:
+        # 边取边处理：第一封命中就开始，不等整个积压下载完
+        driver = None
+        count = 0
+        try:
+            for mid, msg in iter_target_unread_messages(subject_keyword, config):
+                record = parse_mail(mid, msg)
+                del msg
+                if driver is None:
+                    driver = make_driver()
+                process_record(driver, record, config, templates)
+                count += 1
+        finally:
+            if driver is not None:
                 driver.quit()
+        if not count:
+            print("没有匹配标题的未读邮件。")
         input("按回车键关闭窗口...")
 
 if __name__ == "__main__":
@@ -7,17 +7,29 @@
 5. 给该手机号发送短信
 """
 # type: ignore
-from bs4 import BeautifulSoup, Tag
-# type: ignore
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
 import os, re, time, base64, imaplib, email, requests
 from email.header import decode_header
-from typing import Optional, List
+from typing import Optional, List, Dict
 from urllib.parse import urlparse
 from dataclasses import dataclass
 from email.message import Message
+from sms_codes import SMS_CODE_MAP
+from lazy_import import lazy_module, lazy_attr
+from event_log import make_print, make_input
+from metrics import timed, timed_iter, inc as metric_inc, start_exporters
+from poll_scheduler import PollScheduler
+from profiling import profiled
+
+# 输出经由结构化事件日志（event_log.py）：默认兼容模式下stdout文本不变
+print = make_print()
+input = make_input()
+
+# bs4 只在解析邮件HTML时才加载
+BeautifulSoup = lazy_attr("bs4", "BeautifulSoup")
+Tag = lazy_attr("bs4", "Tag")
 
 
 # ====== 配置（用环境变量或直接写死）======
@@ -26,15 +38,24 @@ API_ID = os.getenv("SMS_API_ID", "sm000206_user")
 API_PASSWORD = os.getenv("SMS_API_PASSWORD", "reclab0601")
 SMS_TEXT_A = "りくらぼ株式会社です\nご応募ありがとうございます\nLINEで選考案内→\nhttps://line.me/R/ti/p/@637nkhcm"
 SMS_TEXT_B = "りくらぼ株式会社です。\nご応募ありがとうございます！\nLINEで選考案内→\nhttps://line.me/R/ti/p/@637nkhcm"
-
-# 记录手机号最近一次发送的时间和内容
-from typing import Dict, Any
-phone_send_cache: Dict[str, Dict[str, Any]] = {}
+# 模板只编译一次（支持 {name} / {job} 占位符，见 sms_template.py）
+from sms_template import compile_templates, extract_applicant_info, EscapedText, escape_text
+SMS_TEMPLATES = compile_templates({"A": SMS_TEXT_A, "B": SMS_TEXT_B})
+
+# 记录手机号最近一次发送的时间和内容（跨进程共享，见 send_history.py）
+from send_history import get_history
+# 同一应募的重复通知在打开浏览器前跳过（见 applicant_index.py）
+from applicant_index import applicant_key, get_applicant_index, DEDUP_ENABLED as APPLICANT_DEDUP
+# 与 send_sms_firebase.py 等其他进程共用邮件租约（见 mail_lease.py），同一封邮件只处理一次
+from mail_lease import mail_key, get_lease_manager
+from results_writer import mail_doc_id
 USE_DELIVERY_REPORT = os.getenv("SMS_USE_REPORT", "0") == "1"
 TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "15"))
 
 # Gmail IMAP
 IMAP_HOST = os.getenv("IMAP_HOST", "imap.gmail.com")
+IMAP_PORT = int(os.getenv("IMAP_PORT", "0")) or None
+IMAP_SSL = os.getenv("IMAP_SSL", "1") != "0"   # 0：明文IMAP（本地IMAP替身）
 IMAP_USER = os.getenv("IMAP_USER", "info@rec-lab.biz")
 IMAP_PASS = os.getenv("IMAP_PASS", "gwfxmbfzvexlydwb")
 
@@ -47,11 +68,12 @@ SITE_USER = os.getenv("SITE_USER", "info@rec-lab.biz")
 SITE_PASS = os.getenv("SITE_PASS", "reclab0601")
 
 # ====== Selenium（无头 + 显式等待）======
-import undetected_chromedriver as uc
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+# 延迟导入：第一次用到浏览器时才加载selenium（见 lazy_import.py）
+uc = lazy_module("undetected_chromedriver")
+By = lazy_attr("selenium.webdriver.common.by", "By")
+Options = lazy_attr("selenium.webdriver.chrome.options", "Options")
+WebDriverWait = lazy_attr("selenium.webdriver.support.ui", "WebDriverWait")
+EC = lazy_module("selenium.webdriver.support.expected_conditions")
 
 def make_driver():
     opts = Options()
@@ -79,32 +101,94 @@ def decode_any(s):
 
 # 只读取指定标题的未读邮件
 
-# 获取所有匹配标题的未读邮件（返回[(mid, msg)]列表）
-def get_all_target_unread_messages(subject_keyword: str):
-    box = imaplib.IMAP4_SSL(IMAP_HOST)
+def imap_connect() -> imaplib.IMAP4:
+    if IMAP_SSL:
+        return imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT) if IMAP_PORT else imaplib.IMAP4_SSL(IMAP_HOST)
+    return imaplib.IMAP4(IMAP_HOST, IMAP_PORT) if IMAP_PORT else imaplib.IMAP4(IMAP_HOST)
+
+# 单次模式按块取邮件：每块先只取Subject头筛选（BODY.PEEK 不会把无关邮件标成已读），命中的再逐封取全文
+FETCH_CHUNK = int(os.getenv("RPA_FETCH_CHUNK", "50"))
+SUBJECT_FIELDS = "(BODY.PEEK[HEADER.FIELDS (SUBJECT)])"
+
+def subject_matches(subj_raw, subject_keyword: str) -> bool:
+    if subj_raw is None:
+        return False
+    subj = decode_header(subj_raw)[0][0]
+    return subject_keyword in decode_any(subj)
+
+FETCH_UID_RE = re.compile(rb"UID (\d+)")
+
+def fetch_subjects(box, uids: List[bytes]) -> Dict[bytes, Optional[str]]:
+    """一条UID FETCH取一块邮件的Subject头，返回 {uid: Subject}"""
+    typ, data = box.uid("FETCH", b",".join(uids), SUBJECT_FIELDS)
+    subjects = {}
+    if typ != "OK":
+        return subjects
+    for item in data:
+        if isinstance(item, tuple) and len(item) > 1:
+            m = FETCH_UID_RE.search(item[0])
+            if m:
+                subjects[m.group(1)] = email.message_from_bytes(item[1]).get("Subject")
+    return subjects
+
+def mark_seen(uid: bytes):
+    """新开一次IMAP连接，按UID把邮件标记为已读（处理期间原连接可能已断开重连，序号不可靠）"""
+    box = imap_connect()
     box.login(IMAP_USER, IMAP_PASS)
     box.select("INBOX")
-    typ, data = box.search(None, 'UNSEEN')
-    result = []
-    if typ == "OK":
-        ids = data[0].split()
-        for mid in reversed(ids):
-            typ, raw = box.fetch(mid, "(RFC822)")
-            if typ == "OK" and raw and isinstance(raw[0], tuple) and len(raw[0]) > 1:
-                msg = email.message_from_bytes(raw[0][1])
-                subj_raw = msg.get("Subject")
-                if subj_raw is None:
-                    continue
-                subj = decode_header(subj_raw)[0][0]
-                subj = decode_any(subj)
-                if subject_keyword in subj:
-                    result.append((mid, msg))
+    box.uid("STORE", uid, '+FLAGS', '\\Seen')
     box.logout()
-    return result
+
+@timed_iter("imap_fetch")
+def iter_target_unread_messages(subject_keyword: str, chunk_size: int = FETCH_CHUNK):
+    """
+    逐封产出匹配标题的未读邮件 (uid, msg)，从最新的开始；内存里只有一块的Subject和当前这一封。
+    处理一封要几分钟、中途还会重连，期间别的客户端删除邮件会让序号错位，所以搜索、取信、标记已读全程用UID。
+    """
+    box = None
+
+    def connect():
+        nonlocal box
+        box = imap_connect()
+        box.login(IMAP_USER, IMAP_PASS)
+        box.select("INBOX")
+
+    def call(func, *args):
+        # 浏览器处理一封可能要几分钟，期间服务器可能断开空闲连接
+        try:
+            return func(box, *args)
+        except (imaplib.IMAP4.abort, OSError):
+            connect()
+            return func(box, *args)
+
+    connect()
+    try:
+        typ, data = box.uid("SEARCH", None, 'UNSEEN')
+        if typ != "OK":
+            return
+        ids = list(reversed(data[0].split()))
+        for start in range(0, len(ids), max(1, chunk_size)):
+            chunk = ids[start:start + chunk_size]
+            subjects = call(fetch_subjects, chunk)
+            for mid in chunk:
+                if not subject_matches(subjects.get(mid), subject_keyword):
+                    continue
+                typ, raw = call(lambda b, m: b.uid("FETCH", m, "(RFC822)"), mid)
+                if typ == "OK" and raw and isinstance(raw[0], tuple) and len(raw[0]) > 1:
+                    yield mid, email.message_from_bytes(raw[0][1])
+    finally:
+        try:
+            box.logout()
+        except Exception:
+            pass
+
+# 获取所有匹配标题的未读邮件（返回[(mid, msg)]列表）；耗时由 iter_target_unread_messages 记录
+def get_all_target_unread_messages(subject_keyword: str):
+    return list(iter_target_unread_messages(subject_keyword))
 
 # 自动获取最新验证码（6位数字）邮件内容
 def get_latest_verification_code() -> Optional[str]:
-    box = imaplib.IMAP4_SSL(IMAP_HOST)
+    box = imap_connect()
     box.login(IMAP_USER, IMAP_PASS)
     box.select("INBOX")
     typ, data = box.search(None, 'UNSEEN')
@@ -149,6 +233,7 @@ def get_latest_verification_code() -> Optional[str]:
 
 
 # 优先抓“応募内容を確認する”按钮的链接
+@timed("mime_parse")
 def extract_urls_from_email(msg: Message) -> List[str]:
     urls = []
     html = None
@@ -239,10 +324,13 @@ def build_basic_auth(user: str, pwd: str) -> str:
     return f"Basic {token}"
 
 def gen_alnum_smsid() -> str:
-    return f"REQ{int(time.time())}"
+    # 送达报告按smsid回传，秒级时间戳在同一秒内会重复（624 重复SMSID）
+    return f"REQ{int(time.time() * 1000)}{os.urandom(2).hex().upper()}"
 
-def post_once(mobilenumber: str, smstext: str, use_report: bool) -> requests.Response:
-    text = (smstext or "").replace("&", "＆")
+@timed("sms_api")
+def post_once(mobilenumber: str, smstext: str, use_report: bool, template: str = "") -> requests.Response:
+    # 渲染好的正文（EscapedText）已转义；其他调用方传入的原文在这里转义
+    text = smstext if isinstance(smstext, EscapedText) else escape_text(smstext or "")
     headers = {
         "Authorization": build_basic_auth(API_ID, API_PASSWORD),
         "Content-Type": "application/x-www-form-urlencoded",
@@ -254,93 +342,13 @@ def post_once(mobilenumber: str, smstext: str, use_report: bool) -> requests.Res
         data["status"] = "1"
         data["smsid"] = gen_alnum_smsid()
     r = requests.post(API_URL, headers=headers, data=data, timeout=TIMEOUT)
-    # 状态码详细说明映射
-    code_map = {
-        200: '成功',
-        401: '认证错误（Authorization Required）',
-        402: '发送上限错误（Overlimit）',
-        405: '方法不允许/发送上限错误（Method not allowed）',
-        414: 'URL过长',
-        500: '内部服务器错误',
-        502: '网关错误',
-        503: '暂时不可用/限流',
-        550: '失败',
-        555: 'IP被封禁',
-        557: '禁止的IP地址',
-        560: '手机号无效',
-        562: '发送日期无效',
-        568: 'au短信标题无效',
-        569: 'Softbank短信标题无效',
-        570: '短信文本ID无效',
-        571: '发送尝试次数无效',
-        572: '重发间隔无效',
-        573: '状态无效',
-        574: '短信ID无效',
-        575: 'Docomo无效',
-        576: 'au无效',
-        577: 'SoftBank无效',
-        578: 'SIM无效',
-        579: '网关无效',
-        580: '短信标题无效',
-        585: '短信内容无效',
-        587: '短信ID不唯一',
-        590: '原始URL无效',
-        591: '短信文本类型无效',
-        592: '时间无效/超出发送权限',
-        598: 'Docomo短信标题无效',
-        599: '重发功能无效',
-        601: '短信标题功能无效',
-        605: '类型无效',
-        606: 'API被禁用',
-        608: '注册日期无效',
-        610: 'HLR功能无效',
-        612: '原始URL2无效',
-        613: '原始URL3无效',
-        614: '原始URL4无效',
-        615: 'JSON格式错误',
-        617: 'Memo功能无效',
-        624: '重复的SMSID',
-        631: '重发参数不可更改',
-        632: '乐天标题无效',
-        633: '乐天短信内容无效',
-        634: '乐天短信内容过长',
-        635: '乐天提醒短信内容过长',
-        636: '乐天设置无效',
-        639: '短链功能无效',
-        640: '短链码无效',
-        641: '短链码2无效',
-        642: '短链码3无效',
-        643: '短链码4无效',
-        644: 'Memo模板功能无效',
-        645: 'Memo模板ID无效',
-        646: 'Memo模板ID2无效',
-        647: 'Memo模板ID3无效',
-        648: 'Memo模板ID4无效',
-        649: 'Memo模板ID5无效',
-        650: '主短信内容短链分割错误',
-        651: 'docomo短信内容短链分割错误',
-        652: 'au短信内容短链分割错误',
-        653: 'Softbank短信内容短链分割错误',
-        654: '乐天短信内容短链分割错误',
-        655: '主短信内容docomo分割错误',
-        656: '主短信内容au分割错误',
-        657: '主短信内容Softbank分割错误',
-        659: '提醒短信短链分割错误',
-        660: '提醒短信docomo分割错误',
-        661: '提醒短信au分割错误',
-        662: '提醒短信Softbank分割错误',
-        664: '模板与短信参数冲突',
-        665: 'RCS图片无效',
-        666: '即将IP封禁（9次认证错误）',
-        667: 'RCS视频无效',
-        668: 'RCS音频无效',
-        669: 'Memo值无效',
-        670: 'Memo2值无效',
-        671: 'Memo3值无效',
-        672: 'Memo4值无效',
-        673: 'Memo5值无效',
-    }
+    if use_report:
+        from delivery_report import record_sent_report
+        record_sent_report(data["smsid"], mobilenumber, template, r.status_code)
+    # 状态码详细说明映射（见 sms_codes.py）
+    code_map = SMS_CODE_MAP
     msg = code_map.get(r.status_code, '未知错误')
+    metric_inc("rpa_sms_responses_total", status=r.status_code)
     print(f"STATUS: {r.status_code} ({msg}) | SENT mobilenumber: {mobilenumber}")
     print("BODY  :", r.text[:500])
     # 响应内容判断
@@ -349,7 +357,7 @@ def post_once(mobilenumber: str, smstext: str, use_report: bool) -> requests.Res
         print(r.text)
     return r
 
-def send_sms(phone: str, text: str, use_report: bool = False):
+def send_sms(phone: str, text: str, use_report: bool = False, template: str = ""):
     # 自动将+81开头的号码转为0开头的日本本地格式
     raw = only_digits(phone)
     if raw.startswith("81") and len(raw) == 11:
@@ -363,12 +371,13 @@ def send_sms(phone: str, text: str, use_report: bool = False):
     else:
         raise SystemExit(f"手机号不符合日本本地格式：{phone}（清洗后：{raw}）")
     print(f"发送本地格式手机号：{local_num}")
-    r = post_once(local_num, text, use_report)
+    r = post_once(local_num, text, use_report, template)
     if r.status_code == 560:
         # 兜底再试81格式
         alt = "81" + local_num[1:]
         print("⚠️ 收到 560，改用 81 形式再试：", alt)
-        post_once(alt, text, use_report)
+        r = post_once(alt, text, use_report, template)
+    return r
 
 # ====== 网页自动化：登录+抓手机号 =======
 @dataclass
@@ -390,6 +399,7 @@ def by_map(kind: str):
         "xpath": By.XPATH
     }[kind]
 
+@timed("site_login")
 def site_login_and_open(driver, login_url: str, user: str, pwd: str, target_url: str):
     driver.get(login_url)
     wait = WebDriverWait(driver, 20)
@@ -489,6 +499,7 @@ PHONE_XPATHS = [
 # 支持+81 xx xxxx xxxx等格式
 PHONE_DIGITS_RE = re.compile(r"\+81[ \d]{9,16}")
 
+@timed("phone_extract")
 def extract_phone_from_page(driver) -> Optional[str]:
     wait = WebDriverWait(driver, 20)
     # 先等待“電話番号”或“Phone number”字段出现，确保页面内容已加载
@@ -575,6 +586,8 @@ def main():
     import sys
     import time as _time
     subject_keyword = "【新しい応募者のお知らせ】"
+    # 分阶段耗时指标：JSON快照 data/metrics/send_sms_once.json，RPA_METRICS_PORT 设置时另开 /metrics
+    start_exporters("send_sms_once")
 
     print("请选择RPA工作模式：")
     print("1. 单次处理模式（只处理一次未读邮件）")
@@ -589,6 +602,21 @@ def main():
 
 
     def process_one_message(driver, mid, msg):
+        key = mail_key({"IMAP_USER": IMAP_USER, "IMAP_FOLDER": "INBOX"}, mail_doc_id(msg, mid))
+        leases = get_lease_manager()
+        if not leases.claim(key):
+            print(f"⏭️ 该邮件已由其他RPA进程领取（{key}），跳过。")
+            return False
+        ok = False
+        try:
+            ok = handle_message(driver, mid, msg)
+        finally:
+            # 成功：其他进程不再处理；失败：释放，下次轮询可重试
+            leases.release(key, done=ok)
+        return ok
+
+    @profiled("mail", tag=lambda driver, mid, msg: mid)
+    def handle_message(driver, mid, msg):
         urls = extract_urls_from_email(msg)
         print("【调试】本邮件提取到的所有链接：", urls)
         # 优先用蓝色按钮链接（extract_urls_from_email已优先返回按钮href）
@@ -608,6 +636,15 @@ def main():
             if not all([API_ID, API_PASSWORD]):
                 print("请设置 SMS_API_ID / SMS_API_PASSWORD 环境变量。")
                 return False
+            if APPLICANT_DEDUP and applicant_key(target_url):
+                hit = get_applicant_index().check("", target_url)
+                if hit:
+                    print(f"⏭️ 该应募已处理过（{hit['key']}，第{hit['hits']}次重复通知），跳过。")
+                    try:
+                        mark_seen(mid)
+                    except Exception as e:
+                        print("标记邮件为已读失败：", e)
+                    return True
             try:
                 site_login_and_open(driver, target_url, SITE_USER, SITE_PASS, target_url)
                 # 保存页面HTML和截图，便于排查页面结构
@@ -623,32 +660,21 @@ def main():
                     print("未从页面提取到+81开头的电话号码，尝试下一个链接。")
                     continue
                 print("抓取到的电话号码：", phone)
-                now_time = time.time()
-                cache = phone_send_cache.get(phone, {"last_time": 0.0, "last_content": None})
-                # 判断1分钟内是否已发过
-                if now_time - float(cache["last_time"]) < 60:
-                    # 1分钟内，切换内容
-                    if cache["last_content"] == "A":
-                        sms_text = SMS_TEXT_B
-                        cache["last_content"] = "B"
-                    else:
-                        sms_text = SMS_TEXT_A
-                        cache["last_content"] = "A"
-                    print(f"⚠️ 1分钟内重复发送，自动切换内容为: {cache['last_content']}")
-                else:
-                    # 超过1分钟，默认发A
-                    sms_text = SMS_TEXT_A
-                    cache["last_content"] = "A"
-                cache["last_time"] = now_time
-                phone_send_cache[phone] = cache
-                send_sms(phone, sms_text, use_report=USE_DELIVERY_REPORT)
+                # 1分钟内重复发送则切换A/B内容，超过1分钟默认发A
+                content, repeated = get_history().rotate_content(phone, window=60)
+                rendered = SMS_TEMPLATES[content].render(extract_applicant_info(msg), strict=False)
+                if not rendered.ok:
+                    print(f"❌ 短信文本长度不合法（{rendered.length}字符，{rendered.segments}段），不发送。")
+                    return False
+                sms_text = rendered.text
+                if repeated:
+                    print(f"⚠️ 1分钟内重复发送，自动切换内容为: {content}")
+                r = send_sms(phone, sms_text, use_report=USE_DELIVERY_REPORT, template=content)
+                if APPLICANT_DEDUP and r.status_code == 200:
+                    get_applicant_index().remember("", target_url, phone)
                 # 标记该邮件为已读
                 try:
-                    box = imaplib.IMAP4_SSL(IMAP_HOST)
-                    box.login(IMAP_USER, IMAP_PASS)
-                    box.select("INBOX")
-                    box.store(mid, '+FLAGS', '\\Seen')
-                    box.logout()
+                    mark_seen(mid)
                 except Exception as e:
                     print("标记邮件为已读失败：", e)
                 return True
@@ -682,32 +708,19 @@ def main():
                 print("未从页面提取到+81开头的电话号码。该邮件保持未读，跳过处理下一封。")
                 return False
             print("抓取到的电话号码：", phone)
-            now_time = time.time()
-            cache = phone_send_cache.get(phone, {"last_time": 0.0, "last_content": None})
-            # 判断1分钟内是否已发过
-            if now_time - float(cache["last_time"]) < 60:
-                # 1分钟内，切换内容
-                if cache["last_content"] == "A":
-                    sms_text = SMS_TEXT_B
-                    cache["last_content"] = "B"
-                else:
-                    sms_text = SMS_TEXT_A
-                    cache["last_content"] = "A"
-                print(f"⚠️ 1分钟内重复发送，自动切换内容为: {cache['last_content']}")
-            else:
-                # 超过1分钟，默认发A
-                sms_text = SMS_TEXT_A
-                cache["last_content"] = "A"
-            cache["last_time"] = now_time
-            phone_send_cache[phone] = cache
+            # 1分钟内重复发送则切换A/B内容，超过1分钟默认发A
+            content, repeated = get_history().rotate_content(phone, window=60)
+            rendered = SMS_TEMPLATES[content].render(extract_applicant_info(msg), strict=False)
+            if not rendered.ok:
+                print(f"❌ 短信文本长度不合法（{rendered.length}字符，{rendered.segments}段），不发送。")
+                return False
+            sms_text = rendered.text
+            if repeated:
+                print(f"⚠️ 1分钟内重复发送，自动切换内容为: {content}")
             send_sms(phone, sms_text, use_report=USE_DELIVERY_REPORT)
             # 标记该邮件为已读
             try:
-                box = imaplib.IMAP4_SSL(IMAP_HOST)
-                box.login(IMAP_USER, IMAP_PASS)
-                box.select("INBOX")
-                box.store(mid, '+FLAGS', '\\Seen')
-                box.logout()
+                mark_seen(mid)
             except Exception as e:
                 print("标记邮件为已读失败：", e)
             return True
@@ -717,10 +730,14 @@ def main():
             return False
 
     if mode == "2":
-        print(f"进入循环模式，每{interval}秒检查一次新未读邮件。按Ctrl+C退出。")
+        print(f"进入循环模式，基准每{interval}秒检查一次新未读邮件（间隔随邮件到达情况自动调整）。按Ctrl+C退出。")
         processed_mids = set()
+        # 轮询调度只按第一次见到的邮件计到达：处理失败/其他进程租约中的邮件每轮都会再出现
+        observed_mids = set()
         driver = make_driver()
         loop_count = 0
+        # 自适应轮询间隔（poll_scheduler.py）：以输入的间隔为基准，按到达率和时段调整
+        scheduler = PollScheduler(base=interval)
         try:
             while True:
                 try:
@@ -728,7 +745,10 @@ def main():
                     now = time.strftime('%Y-%m-%d %H:%M:%S')
                     msgs = get_all_target_unread_messages(subject_keyword)
                     new_msgs = [(mid, msg) for mid, msg in msgs if mid not in processed_mids]
-                    print(f"[{now}] 第{loop_count}次轮询 | 已处理:{len(processed_mids)} | 当前未读:{len(msgs)}", end='  ')
+                    arrived = [mid for mid, _ in new_msgs if mid not in observed_mids]
+                    observed_mids.update(arrived)
+                    delay = scheduler.observe(len(arrived))
+                    print(f"[{now}] 第{loop_count}次轮询 | 已处理:{len(processed_mids)} | 当前未读:{len(msgs)} | {scheduler.describe()}", end='  ')
                     if new_msgs:
                         print(f"\n>>> 检测到{len(new_msgs)}封新未读邮件，开始处理...")
                         for mid, msg in new_msgs:
@@ -737,23 +757,27 @@ def main():
                                 processed_mids.add(mid)
                     else:
                         print("无新未读邮件。", end="\r")
-                    _time.sleep(interval)
+                    _time.sleep(delay)
                 except KeyboardInterrupt:
                     print("\n已手动退出循环模式。")
                     break
         finally:
             driver.quit()
     else:
-        msgs = get_all_target_unread_messages(subject_keyword)
-        if not msgs:
-            print("没有匹配标题的未读邮件。")
-        else:
-            driver = make_driver()
-            try:
-                for mid, msg in msgs:
-                    process_one_message(driver, mid, msg)
-            finally:
+        # 边取边处理：第一封命中就开始，不等整个积压下载完
+        driver = None
+        count = 0
+        try:
+            for mid, msg in iter_target_unread_messages(subject_keyword):
+                if driver is None:
+                    driver = make_driver()
+                process_one_message(driver, mid, msg)
+                count += 1
+        finally:
+            if driver is not None:
                 driver.quit()
+        if not count:
+            print("没有匹配标题的未读邮件。")
         input("按回车键关闭窗口...")
 
 if __name__ == "__main__":
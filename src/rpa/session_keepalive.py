@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+站点会话保活（Indeed 雇主后台）
+会话过期后，下一封邮件在 site_login_and_open 里要重新走 邮箱→密码→（常常还有）二步验证，
+二步验证还要等验证码邮件，几十秒全算在这位求职者的 time-to-SMS 上。
+这里由一个后台线程在空闲时段维护每个浏览器（或 cookie 会话，只要有 get / current_url / page_source）：
+- 驱动锁：Selenium driver 不能多线程同时使用。热路径处理邮件时用 keeper.using(driver) 持有该浏览器的锁，
+  保活只在非阻塞拿到锁时动作，所以不会打断正在处理的邮件（邮件到达时最多等一次保活请求结束）
+- 浏览器空闲 RPA_KEEPALIVE_IDLE 秒以上、距上次确认登录状态超过 RPA_KEEPALIVE_INTERVAL 秒时，
+  打开一个需要登录的轻量页面（RPA_KEEPALIVE_URL，默认为最近处理过的页面所在站点的首页）；
+  对滑动过期的会话，这次访问本身就会续期
+- 页面变回登录表单 = 会话已过期：立即在后台调用 site_login_and_open 重新登录（含二步验证取码），
+  下一位求职者到达时浏览器已经是登录状态
+- 记录会话寿命（登录到发现过期的最短时间），预计过期的时刻过后马上再确认一次，而不是等下一个保活周期
+
+环境变量：
+    RPA_KEEPALIVE=0          关闭
+    RPA_KEEPALIVE_INTERVAL   空闲时确认会话的间隔（秒，默认240）
+    RPA_KEEPALIVE_IDLE       浏览器空闲多久后才保活（秒，默认30）
+    RPA_KEEPALIVE_URL        保活访问的页面
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from typing import Optional, List, Dict, Any
+
+from event_log import make_print, log_event
+from metrics import inc as metric_inc
+
+print = make_print()
+
+KEEPALIVE_ENABLED = os.getenv("RPA_KEEPALIVE", "1") != "0"
+KEEPALIVE_INTERVAL = float(os.getenv("RPA_KEEPALIVE_INTERVAL", "240"))
+KEEPALIVE_IDLE = float(os.getenv("RPA_KEEPALIVE_IDLE", "30"))
+KEEPALIVE_URL = os.getenv("RPA_KEEPALIVE_URL", "")
+# 预计过期时刻之后多久再确认（秒）
+EXPIRY_SLACK = 5.0
+TICK = 1.0
+
+# 登录 / 二步验证页面的特征（与 site_login_and_open 的定位方式一致）
+LOGIN_MARKERS = ('name="__email"', 'id="login-email-input"', 'type="password"', 'id="verification_input"')
+
+def is_login_page(driver) -> bool:
+    try:
+        source = driver.page_source or ""
+    except Exception:
+        return False
+    return any(marker in source for marker in LOGIN_MARKERS)
+
+def site_home(url: str) -> str:
+    parsed = urlparse(url or "")
+    if not parsed.scheme or not parsed.netloc:
+        return ""
+    return f"{parsed.scheme}://{parsed.netloc}/"
+
+class BrowserSession:
+    __slots__ = ("driver", "config", "lock", "url", "last_used", "last_ok", "last_login", "lifetime", "stats")
+
+    def __init__(self, driver, config: Dict[str, Any], url: str = ""):
+        self.driver = driver
+        self.config = config
+        self.lock = threading.Lock()
+        self.url = url
+        now = time.monotonic()
+        self.last_used = now
+        self.last_ok = now
+        self.last_login: Optional[float] = None
+        self.lifetime: Optional[float] = None   # 观测到的最短会话寿命（秒）
+        self.stats = {"touches": 0, "expired": 0, "relogins": 0, "failures": 0}
+
+    def expected_expiry(self) -> Optional[float]:
+        if self.last_login is None or self.lifetime is None:
+            return None
+        return self.last_login + self.lifetime
+
+    def due(self, now: float, interval: float, idle: float) -> bool:
+        if not self.url or now - self.last_used < idle:
+            return False
+        expiry = self.expected_expiry()
+        if expiry is not None and self.last_ok < expiry + EXPIRY_SLACK <= now:
+            return True
+        return now - self.last_ok >= interval
+
+class SessionKeeper:
+    """
+    keeper = SessionKeeper().start()
+    keeper.watch(driver, config)
+    with keeper.using(driver):      # 热路径：处理一封邮件期间持有该浏览器
+        process_record(driver, ...)
+    """
+
+    def __init__(self, interval: float = KEEPALIVE_INTERVAL, idle: float = KEEPALIVE_IDLE, url: str = KEEPALIVE_URL,
+                 enabled: bool = KEEPALIVE_ENABLED):
+        self.interval = interval
+        self.idle = idle
+        self.url = url
+        self.enabled = enabled
+        self._sessions: Dict[int, BrowserSession] = {}
+        self._closed = {"touches": 0, "expired": 0, "relogins": 0, "failures": 0}   # 已关闭浏览器的累计
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ====== 注册 ======
+    def watch(self, driver, config: Dict[str, Any]):
+        with self._lock:
+            if id(driver) not in self._sessions:
+                self._sessions[id(driver)] = BrowserSession(driver, config, self.url)
+
+    def unwatch(self, driver):
+        with self._lock:
+            session = self._sessions.pop(id(driver), None)
+            if session is not None:
+                for k, v in session.stats.items():
+                    self._closed[k] += v
+
+    def _session(self, driver) -> Optional[BrowserSession]:
+        with self._lock:
+            return self._sessions.get(id(driver))
+
+    # ====== 热路径 ======
+    @contextmanager
+    def using(self, driver):
+        session = self._session(driver)
+        if session is None:
+            yield driver
+            return
+        with session.lock:
+            try:
+                yield driver
+            finally:
+                now = time.monotonic()
+                session.last_used = now
+                if not is_login_page(driver):
+                    session.last_ok = now
+                if not session.url:
+                    try:
+                        session.url = site_home(driver.current_url)
+                    except Exception:
+                        pass
+
+    def call(self, driver, func, *args):
+        """在持有该浏览器的锁时执行 func(*args)（供线程池里的流水线阶段使用）"""
+        with self.using(driver):
+            return func(*args)
+
+    # ====== 后台保活 ======
+    def maintain(self, session: BrowserSession) -> Optional[str]:
+        """确认一次会话；浏览器正在使用时返回 None，否则返回 ok / relogin / failed"""
+        if not session.lock.acquire(blocking=False):
+            return None
+        try:
+            return self._maintain(session)
+        finally:
+            session.lock.release()
+
+    def _maintain(self, session: BrowserSession) -> str:
+        # 延迟导入：压测会替换 site_login_and_open
+        import send_sms_firebase as rpa
+
+        now = time.monotonic()
+        session.stats["touches"] += 1
+        try:
+            session.driver.get(session.url)
+            if not is_login_page(session.driver):
+                session.last_ok = time.monotonic()
+                metric_inc("rpa_site_keepalive_total", result="ok")
+                return "ok"
+            session.stats["expired"] += 1
+            alive = now - (session.last_login if session.last_login is not None else session.last_ok)
+            if session.last_login is not None:
+                session.lifetime = alive if session.lifetime is None else min(session.lifetime, alive)
+            print(f"🔑 站点会话已过期（约{alive / 60:.0f}分钟），后台重新登录…")
+            config = session.config
+            rpa.site_login_and_open(session.driver, session.url, config["SITE_USER"], config["SITE_PASS"],
+                                    session.url, config)
+            if is_login_page(session.driver):
+                raise RuntimeError("重新登录后仍是登录页面")
+        except Exception as e:
+            session.stats["failures"] += 1
+            session.last_ok = time.monotonic()   # 下个周期再试，不在失败后连续重试
+            metric_inc("rpa_site_keepalive_total", result="failed")
+            log_event("site_keepalive_failed", "warning", url=session.url, error=str(e)[:300])
+            print(f"⚠️ 后台重新登录失败: {e}")
+            return "failed"
+        session.last_ok = session.last_login = time.monotonic()
+        session.stats["relogins"] += 1
+        metric_inc("rpa_site_keepalive_total", result="relogin")
+        log_event("site_relogin", "info", url=session.url, lifetime_s=round(session.lifetime or 0))
+        return "relogin"
+
+    def _run(self):
+        while not self._stop.wait(TICK):
+            now = time.monotonic()
+            with self._lock:
+                sessions = list(self._sessions.values())
+            for session in sessions:
+                if self._stop.is_set():
+                    return
+                if session.due(now, self.interval, self.idle):
+                    self.maintain(session)
+
+    def start(self) -> "SessionKeeper":
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="site-keepalive", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            sessions: List[BrowserSession] = list(self._sessions.values())
+            total = dict(self._closed, sessions=len(sessions))
+        for session in sessions:
+            for k, v in session.stats.items():
+                total[k] += v
+        return total
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SMS文本模板
+- 模板只编译一次：静态部分预先做 & → ＆ 转义并预先算好UCS-2长度
+- 渲染结果是 EscapedText，post_once 看到它就不再整段替换一遍 &
+- 占位符：{name}/{応募者名}（求职者姓名）、{job}/{職種}（职位名，均从通知邮件中提取）
+- 渲染时只处理占位符部分，并给出UCS-2分段数；超长文本在调用API之前就被拒绝
+"""
+
+import os
+import re
+from typing import Optional, List, Dict, Tuple, Union
+from email.header import decode_header
+
+# ====== 长度限制（UCS-2）======
+# 单条70字符；超出后按长SMS拆分，每段67字符（UDH占去3字符）
+SINGLE_SEGMENT_CHARS = 70
+MULTI_SEGMENT_CHARS = 67
+# sms-console 长文本上限（字符数），可按合同调整
+SMS_MAX_CHARS = int(os.getenv("SMS_MAX_CHARS", "660"))
+
+PLACEHOLDER_RE = re.compile(r"\{([^{}\s]+)\}")
+PLACEHOLDER_ALIASES = {
+    "name": "name", "応募者名": "name", "氏名": "name",
+    "job": "job", "職種": "job", "求人名": "job",
+}
+
+def escape_text(text: str) -> str:
+    # API 以 & 分隔表单字段，与 post_once 相同替换为全角
+    return text.replace("&", "＆") if "&" in text else text
+
+class EscapedText(str):
+    """已做过 & → ＆ 替换的短信正文（渲染结果），post_once 原样发送"""
+    __slots__ = ()
+
+def ucs2_length(text: str) -> int:
+    """UCS-2/UTF-16 码元数：BMP 外的字符（如部分emoji）占2"""
+    if text.isascii():
+        return len(text)
+    return len(text.encode("utf-16-le")) // 2
+
+def segment_count(length: int) -> int:
+    if length <= SINGLE_SEGMENT_CHARS:
+        return 1 if length else 0
+    return -(-length // MULTI_SEGMENT_CHARS)
+
+class TemplateTooLong(ValueError):
+    pass
+
+class RenderedMessage:
+    __slots__ = ("text", "length", "segments", "template")
+
+    def __init__(self, text: str, length: int, template: str):
+        self.text = text
+        self.length = length
+        self.segments = segment_count(length)
+        self.template = template
+
+    @property
+    def ok(self) -> bool:
+        return 0 < self.length <= SMS_MAX_CHARS
+
+    def __repr__(self):
+        return f"RenderedMessage(template={self.template!r}, length={self.length}, segments={self.segments})"
+
+class CompiledTemplate:
+    """编译后的模板：parts 为 [静态文本, 占位符键, 静态文本, ...]"""
+    __slots__ = ("name", "source", "_parts", "_static_len", "_keys", "_constant")
+
+    def __init__(self, source: str, name: str = ""):
+        self.name = name
+        self.source = source or ""
+        parts: List[Union[str, Tuple[str]]] = []
+        static_len = 0
+        keys = []
+        pos = 0
+        for m in PLACEHOLDER_RE.finditer(self.source):
+            key = PLACEHOLDER_ALIASES.get(m.group(1))
+            if key is None:
+                # 未知的花括号内容按原文保留
+                continue
+            static = escape_text(self.source[pos:m.start()])
+            parts.append(static)
+            static_len += ucs2_length(static)
+            parts.append((key,))
+            keys.append(key)
+            pos = m.end()
+        tail = escape_text(self.source[pos:])
+        parts.append(tail)
+        static_len += ucs2_length(tail)
+        self._parts = parts
+        self._static_len = static_len
+        self._keys = tuple(keys)
+        self._constant = RenderedMessage(EscapedText(tail), static_len, name) if not keys else None
+
+    @property
+    def placeholders(self) -> Tuple[str, ...]:
+        return self._keys
+
+    def render(self, values: Optional[Dict[str, str]] = None, strict: bool = True) -> RenderedMessage:
+        """
+        渲染模板；缺失的占位符替换为空字符串。
+        strict=True 时超长抛出 TemplateTooLong，否则返回 ok=False 的结果由调用方处理。
+        """
+        if self._constant is not None:
+            result = self._constant
+        else:
+            values = values or {}
+            out = []
+            length = self._static_len
+            for part in self._parts:
+                if type(part) is tuple:
+                    v = escape_text(str(values.get(part[0]) or ""))
+                    length += ucs2_length(v)
+                    out.append(v)
+                else:
+                    out.append(part)
+            result = RenderedMessage(EscapedText("".join(out)), length, self.name)
+        if strict and not result.ok:
+            raise TemplateTooLong(
+                f"SMS text length {result.length} exceeds limit {SMS_MAX_CHARS} "
+                f"(template={self.name or '-'}, segments={result.segments})"
+            )
+        return result
+
+_compiled_cache: Dict[Tuple[str, str], CompiledTemplate] = {}
+
+def compile_template(source: str, name: str = "") -> CompiledTemplate:
+    """同一文本只编译一次"""
+    key = (name, source or "")
+    tpl = _compiled_cache.get(key)
+    if tpl is None:
+        tpl = CompiledTemplate(source, name)
+        if len(_compiled_cache) > 256:
+            _compiled_cache.clear()
+        _compiled_cache[key] = tpl
+    return tpl
+
+def compile_templates(sources: Dict[str, str]) -> Dict[str, CompiledTemplate]:
+    """Firestore templates / SMS_TEXT_A,B 等一组模板"""
+    return {name: compile_template(text, name) for name, text in sources.items()}
+
+def measure_text(text: str) -> RenderedMessage:
+    """不含占位符的现成文本（如个别发送）只做长度与分段计算"""
+    escaped = EscapedText(escape_text(text or ""))
+    return RenderedMessage(escaped, ucs2_length(escaped), "")
+
+# ====== 从通知邮件中提取求职者信息 ======
+# 例：【新しい応募者のお知らせ】山田 太郎さんが「ホールスタッフ」に応募しました
+_NAME_RE = re.compile(r"(?:】|^)\s*([^\s「」【】][^「」【】]*?)\s*(?:さん|様)")
+_JOB_RE = re.compile(r"「([^」]+)」")
+_JOB_LABEL_RE = re.compile(r"(?:求人|職種|Job)\s*[:：]\s*([^\n\r<]+)")
+
+def extract_applicant_info(msg) -> Dict[str, str]:
+    """从邮件标题（不足时看正文）提取 name / job，取不到时为空字符串"""
+    info = {"name": "", "job": ""}
+    subj_raw = msg.get("Subject") if msg is not None else None
+    subject = ""
+    if subj_raw:
+        chunks = []
+        for part, enc in decode_header(subj_raw):
+            if isinstance(part, bytes):
+                try:
+                    chunks.append(part.decode(enc or "utf-8", errors="ignore"))
+                except LookupError:
+                    chunks.append(part.decode("utf-8", errors="ignore"))
+            else:
+                chunks.append(part)
+        subject = "".join(chunks)
+    m = _NAME_RE.search(subject)
+    if m:
+        info["name"] = m.group(1).strip()
+    m = _JOB_RE.search(subject)
+    if m:
+        info["job"] = m.group(1).strip()
+    if info["job"] or msg is None:
+        return info
+    for part in msg.walk():
+        if part.get_content_type() != "text/plain":
+            continue
+        payload = part.get_payload(decode=True)
+        if not payload:
+            continue
+        try:
+            text = payload.decode(part.get_content_charset() or "utf-8", errors="ignore")
+        except LookupError:
+            text = payload.decode("utf-8", errors="ignore")
+        m = _JOB_LABEL_RE.search(text) or _JOB_RE.search(text)
+        if m:
+            info["job"] = m.group(1).strip()
+            break
+    return info